@@ -0,0 +1,187 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from Calibration.ModuleCalibration import undistort_points
+
+CALIBRATION_PATH = "Calibration/data"
+
+IOU_THRESHOLD = 0.3
+MIN_VISIBILITY = 0.5
+
+
+def get_iou(boxes_1, boxes_2):
+    r"""
+    Intersection over union of all pairs of boxes.
+
+    :param boxes_1: boxes (N x 4) as (x1, y1, x2, y2).
+    :param boxes_2: boxes (M x 4) as (x1, y1, x2, y2).
+
+    :return: matrix N x M.
+    """
+
+    boxes_1 = np.asarray(boxes_1, np.float64).reshape(-1, 4)
+    boxes_2 = np.asarray(boxes_2, np.float64).reshape(-1, 4)
+
+    x1 = np.maximum(boxes_1[:, None, 0], boxes_2[None, :, 0])
+    y1 = np.maximum(boxes_1[:, None, 1], boxes_2[None, :, 1])
+    x2 = np.minimum(boxes_1[:, None, 2], boxes_2[None, :, 2])
+    y2 = np.minimum(boxes_1[:, None, 3], boxes_2[None, :, 3])
+
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_1 = (boxes_1[:, 2] - boxes_1[:, 0]) * (boxes_1[:, 3] - boxes_1[:, 1])
+    area_2 = (boxes_2[:, 2] - boxes_2[:, 0]) * (boxes_2[:, 3] - boxes_2[:, 1])
+    union = area_1[:, None] + area_2[None, :] - intersection
+
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def undistort_boxes(boxes, width, height, path=CALIBRATION_PATH):
+    r"""
+    Maps boxes of the frames captured into the frames undistorted by the preprocessing (bounding box of the
+    corners undistorted).
+
+    :param boxes: boxes (N x 4) as (x1, y1, x2, y2).
+    :param width: width of the frames.
+    :param height: height of the frames.
+    :param path: path of the calibration file.
+
+    :return: boxes (N x 4).
+    """
+
+    boxes = np.asarray(boxes, np.float64).reshape(-1, 4)
+    if len(boxes) == 0:
+        return boxes
+
+    corners = boxes[:, [0, 1, 2, 1, 0, 3, 2, 3]].reshape(-1, 2)
+    corners = undistort_points(path, corners, width, height).reshape(-1, 4, 2)
+
+    return np.hstack([corners.min(axis=1), corners.max(axis=1)])
+
+
+class MotEvaluator:
+    r"""
+    CLEAR MOT evaluation of the tracks: the tracks are matched to the ground truth in each frame by IoU (the
+    matches of the previous frame are kept while their IoU is over the threshold, the others are assigned by the
+    Hungarian algorithm). The ground truth mostly out of the frame is ignored: it is neither a miss nor a false
+    positive if it is matched.
+    """
+
+    def __init__(self, iou_threshold=IOU_THRESHOLD, min_visibility=MIN_VISIBILITY):
+        """
+        Constructor of class.
+
+        :param iou_threshold: minimum IoU of a match.
+        :param min_visibility: minimum fraction of the box into the frame of the ground truth evaluated.
+        """
+
+        self.iou_threshold = iou_threshold
+        self.min_visibility = min_visibility
+
+        # Track matched to each ground truth id in the last frame where it was matched
+        self.last_match = {}
+        self.previous_matches = {}
+        self.matched_tracks = {}
+
+        self.num_ground_truth = 0
+        self.num_matches = 0
+        self.num_misses = 0
+        self.num_false_positives = 0
+        self.num_id_switches = 0
+        self.sum_iou = 0.0
+
+        self.speed_errors = []
+        self.relative_speed_errors = []
+
+    def update(self, truth, tracks):
+        """
+        Evaluates a frame.
+
+        :param truth: ground truth: list of dict with id, box, visibility and velocity (km/h).
+        :param tracks: tracks: list of (id, box (x1, y1, x2, y2), velocity (km/h)).
+        """
+
+        truth_boxes = [item["box"] for item in truth]
+        track_boxes = [box for _, box, _ in tracks]
+        iou = get_iou(truth_boxes, track_boxes)
+
+        truth_ids = [item["id"] for item in truth]
+        track_ids = [track_id for track_id, _, _ in tracks]
+        track_index = {track_id: j for j, track_id in enumerate(track_ids)}
+
+        matches = {}
+
+        # Matches of the previous frame still valid
+        for i, truth_id in enumerate(truth_ids):
+            j = track_index.get(self.previous_matches.get(truth_id))
+            if j is not None and iou[i, j] >= self.iou_threshold and j not in matches.values():
+                matches[i] = j
+
+        rows = [i for i in range(len(truth_ids)) if i not in matches]
+        columns = [j for j in range(len(track_ids)) if j not in matches.values()]
+
+        if rows and columns:
+            sub_iou = iou[np.ix_(rows, columns)]
+            assigned_rows, assigned_columns = linear_sum_assignment(-sub_iou)
+
+            for r, c in zip(assigned_rows, assigned_columns):
+                if sub_iou[r, c] >= self.iou_threshold:
+                    matches[rows[r]] = columns[c]
+
+        matched_columns = set(matches.values())
+        self.previous_matches = {}
+
+        for i, item in enumerate(truth):
+            ignored = item.get("visibility", 1.0) < self.min_visibility
+            j = matches.get(i)
+
+            if j is None:
+                if not ignored:
+                    self.num_misses += 1
+                    self.num_ground_truth += 1
+                continue
+
+            track_id = track_ids[j]
+            self.previous_matches[item["id"]] = track_id
+
+            if ignored:
+                continue
+
+            self.num_ground_truth += 1
+            self.num_matches += 1
+            self.sum_iou += iou[i, j]
+
+            last_track = self.last_match.get(item["id"])
+            if last_track is not None and last_track != track_id:
+                self.num_id_switches += 1
+
+            self.last_match[item["id"]] = track_id
+            self.matched_tracks.setdefault(item["id"], set()).add(track_id)
+
+            velocity = tracks[j][2]
+            if velocity > 0 and item.get("velocity", 0) > 0:
+                self.speed_errors.append(abs(velocity - item["velocity"]))
+                self.relative_speed_errors.append(abs(velocity - item["velocity"]) / item["velocity"])
+
+        self.num_false_positives += len(track_ids) - len(matched_columns)
+
+    def get_metrics(self):
+        """
+        Get the metrics of the frames evaluated.
+
+        :return: dict with MOTA, MOTP (mean IoU), ID switches, false positives, misses, ground truth, tracks per
+                 ground truth id and speed errors (mean absolute in km/h and mean relative).
+        """
+
+        errors = self.num_misses + self.num_false_positives + self.num_id_switches
+
+        return {"mota": 1 - errors / self.num_ground_truth if self.num_ground_truth > 0 else 0.0,
+                "motp": self.sum_iou / self.num_matches if self.num_matches > 0 else 0.0,
+                "id_switches": self.num_id_switches,
+                "false_positives": self.num_false_positives,
+                "misses": self.num_misses,
+                "ground_truth": self.num_ground_truth,
+                "tracks_per_vehicle": float(np.mean([len(tracks) for tracks in self.matched_tracks.values()]))
+                if self.matched_tracks else 0.0,
+                "speed_error_kmh": float(np.mean(self.speed_errors)) if self.speed_errors else None,
+                "speed_error_rel": float(np.mean(self.relative_speed_errors)) if self.relative_speed_errors
+                else None}
@@ -0,0 +1,123 @@
+import argparse
+import time
+
+import cv2 as cv
+import numpy as np
+
+from MotionTracking import Utility as Utility
+
+KERNEL = cv.getStructuringElement(cv.MORPH_ELLIPSE, (3, 3))
+
+
+def erode_dilate_iterative(mask, iterations):
+    r"""
+    Morphological operations as implemented before: N erosions and one dilation with the 3x3 ellipse.
+
+    :param mask: binary mask.
+    :param iterations: number of erosions.
+    """
+
+    mask_erode = cv.erode(mask, KERNEL, iterations=iterations)
+    return cv.dilate(mask_erode, KERNEL, iterations=1)
+
+
+def create_masks(num_masks, height=512, width=750, num_blobs=30, seed=0):
+    r"""
+    Create binary masks with blobs (vehicles) and speckles (noise of the optical flow).
+
+    :param num_masks: number of masks.
+    :param height: height of the masks.
+    :param width: width of the masks.
+    :param num_blobs: number of blobs for each mask.
+    :param seed: seed of the random generator.
+    """
+
+    rng = np.random.default_rng(seed)
+    masks = []
+
+    for _ in range(num_masks):
+        mask = np.zeros((height, width), np.uint8)
+
+        for _ in range(num_blobs):
+            center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+            axes = (int(rng.integers(5, 60)), int(rng.integers(5, 40)))
+            cv.ellipse(mask, center, axes, int(rng.integers(0, 180)), 0, 360, 255, -1)
+
+        speckles = (rng.random((height, width)) < 0.01).astype(np.uint8) * 255
+        masks.append(cv.bitwise_or(mask, cv.dilate(speckles, KERNEL)))
+
+    return masks
+
+
+def check_contours(masks, iterations):
+    r"""
+    Check that the contours of both implementations are the same.
+
+    :param masks: binary masks.
+    :param iterations: number of erosions.
+
+    :return: number of masks with different contours.
+    """
+
+    num_errors = 0
+
+    for mask in masks:
+        contours_1, _ = cv.findContours(erode_dilate_iterative(mask, iterations), cv.RETR_EXTERNAL,
+                                        cv.CHAIN_APPROX_NONE)
+        contours_2, _ = cv.findContours(Utility.erode_dilate(mask, iterations), cv.RETR_EXTERNAL,
+                                        cv.CHAIN_APPROX_NONE)
+
+        if len(contours_1) != len(contours_2) or \
+                any(not np.array_equal(cnt_1, cnt_2) for cnt_1, cnt_2 in zip(contours_1, contours_2)):
+            num_errors += 1
+
+    return num_errors
+
+
+def benchmark(function, masks, iterations, repeat):
+    r"""
+    Average time (milliseconds) of the function for each mask.
+
+    :param function: morphological operations to measure.
+    :param masks: binary masks.
+    :param iterations: number of erosions.
+    :param repeat: number of repetitions.
+    """
+
+    start_time = time.perf_counter()
+
+    for _ in range(repeat):
+        for mask in masks:
+            function(mask, iterations)
+
+    return (time.perf_counter() - start_time) * 1000 / (repeat * len(masks))
+
+
+if __name__ == "__main__":
+    r"""
+    Microbenchmark of the morphological operations of Motion.
+    Run from the root of the project: python -m Benchmark.morphology
+    """
+
+    parser = argparse.ArgumentParser(description="Morphological operations: check and microbenchmark.")
+    parser.add_argument("--masks", help="file .npz with the recorded binary masks (array 'masks').")
+    parser.add_argument("--iterations", type=int, nargs="+", default=[12], help="numbers of erosions.")
+    parser.add_argument("--repeat", type=int, default=20, help="number of repetitions.")
+    args = parser.parse_args()
+
+    if args.masks is not None:
+        with np.load(args.masks) as File:
+            masks = list(File['masks'])
+    else:
+        masks = create_masks(10)
+
+    for iterations in args.iterations:
+        errors = check_contours(masks, iterations)
+        time_iterative = benchmark(erode_dilate_iterative, masks, iterations, args.repeat)
+        time_single_pass = benchmark(Utility.erode_dilate, masks, iterations, args.repeat)
+
+        print(f"Iterations: {iterations}, masks with different contours: {errors}/{len(masks)}, "
+              f"iterative: {time_iterative:.3f} ms, single pass: {time_single_pass:.3f} ms")
+
+        if errors > 0:
+            raise SystemExit(1)
@@ -0,0 +1,281 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import cv2 as cv
+import numpy as np
+
+from Benchmark.synthetic import SCENARIOS, NUM_FRAMES, SEED, create_clip, load_ground_truth
+from OpticalFlow.flowEngine import FARNEBACK, PRESET_MEDIUM
+
+CLIPS_FOLDER = os.path.join(tempfile.gettempdir(), "benchmark_clips")
+RESULTS_FOLDER = os.path.join("Benchmark", "results")
+
+# Relative change of a metric considered a regression
+TOLERANCE = 0.10
+
+
+def get_commit():
+    r"""
+    Get the current commit of the repository (suffix "-dirty" if there are changes not committed).
+    """
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+    return commit + "-dirty" if dirty else commit
+
+
+def get_peak_rss():
+    r"""
+    Get the peak resident set size (MB) of the current process, None if not available.
+    """
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+
+def run_scenario(path_clip, width, height, flow_backend, flow_preset, prediction):
+    r"""
+    Runs the headless pipeline on a clip (into a new process, for a clean peak RSS).
+
+    :param path_clip: path of the clip.
+    :param width: width of the frames.
+    :param height: height of the frames.
+    :param flow_backend: backend of the optical flow.
+    :param flow_preset: preset of the optical flow.
+    :param prediction: bool, if true the position of the vehicles is predicted.
+
+    :return: dict with frames, elapsed time, FPS, peak RSS, number of tracks and times of the stages.
+    """
+
+    from Common.logger import configure, WARNING
+    from main import HeadlessApp
+
+    configure(level=WARNING)
+
+    video = {"Index": 0, "Name": os.path.basename(path_clip), "Lane": 0, "Path": path_clip,
+             "Frame rate": (10, 30), "Polygon": [], "Zones": []}
+    tracks = set()
+
+    def sink(iteration, vehicles):
+        tracks.update(vehicle.id for vehicle in vehicles)
+
+    with tempfile.TemporaryDirectory() as folder:
+        path_profile = os.path.join(folder, "profile.json")
+        app = HeadlessApp(video, excluded_area=False, sink=sink, height_cam=height, width_cam=width,
+                          flow_backend=flow_backend, flow_preset=flow_preset, prediction=prediction,
+                          profile_path=path_profile)
+
+        frames, elapsed_time = app.op_dense.run()
+
+        with open(path_profile) as file:
+            stages = json.load(file)["stages"]
+
+    return {"frames": frames, "elapsed_s": elapsed_time,
+            "fps": frames / elapsed_time if elapsed_time > 0 else 0,
+            "peak_rss_mb": get_peak_rss(), "tracks": len(tracks), "stages": stages}
+
+
+def run(scenarios, num_frames, seed, repeat, flow_backend, flow_preset, prediction, clips_folder):
+    r"""
+    Runs the benchmark: each scenario is run repeat times into a new process, the run with the median FPS is kept.
+
+    :param scenarios: names of the scenarios.
+    :param num_frames: number of frames of the clips.
+    :param seed: seed of the clips.
+    :param repeat: number of runs of each scenario.
+    :param flow_backend: backend of the optical flow.
+    :param flow_preset: preset of the optical flow.
+    :param prediction: bool, if true the position of the vehicles is predicted.
+    :param clips_folder: folder of the clips (created if they don't exist).
+
+    :return: results (dict).
+    """
+
+    results = {"commit": get_commit(), "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "machine": {"platform": platform.platform(), "processor": platform.processor(),
+                           "cpu_count": os.cpu_count(), "python": platform.python_version(),
+                           "numpy": np.__version__, "opencv": cv.__version__},
+               "config": {"frames": num_frames, "seed": seed, "repeat": repeat, "flow_backend": flow_backend,
+                          "flow_preset": flow_preset, "prediction": prediction},
+               "scenarios": {}}
+
+    context = multiprocessing.get_context("spawn")
+
+    for name in scenarios:
+        path_clip, path_truth = create_clip(clips_folder, name, seed, num_frames)
+        truth = load_ground_truth(path_truth)
+        width, height, num_vehicles = SCENARIOS[name]
+
+        runs = []
+        for _ in range(repeat):
+            with context.Pool(1) as pool:
+                runs.append(pool.apply(run_scenario, (path_clip, width, height, flow_backend, flow_preset,
+                                                      prediction)))
+
+        result = sorted(runs, key=lambda item: item["fps"])[len(runs) // 2]
+        result.update({"width": width, "height": height, "vehicles": num_vehicles,
+                       "frames_sha1": truth["frames_sha1"], "ground_truth_tracks": truth["num_tracks"],
+                       "fps_runs": [item["fps"] for item in runs]})
+        results["scenarios"][name] = result
+
+        frame = result["stages"].get("Frame", {})
+        peak_rss = f"{result['peak_rss_mb']:.1f} MB" if result["peak_rss_mb"] is not None else "n/a"
+        print(f"{name}: {result['fps']:.2f} FPS, frame p50 {frame.get('p50_ms', 0):.1f} ms, "
+              f"p99 {frame.get('p99_ms', 0):.1f} ms, peak RSS {peak_rss}, "
+              f"tracks {result['tracks']}/{result['ground_truth_tracks']}")
+
+    return results
+
+
+def get_metrics(result):
+    r"""
+    Get the metrics of a scenario compared between two runs.
+
+    :param result: result of the scenario.
+
+    :return: dict name: (value, bool true if higher is better).
+    """
+
+    metrics = {"fps": (result["fps"], True)}
+
+    if result.get("peak_rss_mb") is not None:
+        metrics["peak_rss_mb"] = (result["peak_rss_mb"], False)
+
+    for stage, stats in result["stages"].items():
+        metrics[f"{stage} p50_ms"] = (stats["p50_ms"], False)
+        metrics[f"{stage} p95_ms"] = (stats["p95_ms"], False)
+
+    return metrics
+
+
+def compare(baseline, current, tolerance=TOLERANCE, min_time=0.5):
+    r"""
+    Compares two results files and prints the relative changes.
+
+    :param baseline: results of reference.
+    :param current: results to check.
+    :param tolerance: relative change considered a regression.
+    :param min_time: times (milliseconds) below this value are not checked (noise of the clock).
+
+    :return: list of the regressions (scenario, metric, baseline value, current value).
+    """
+
+    if baseline["config"] != current["config"]:
+        print(f"Warning: different configuration {baseline['config']} != {current['config']}")
+
+    if baseline["machine"] != current["machine"]:
+        print("Warning: results of different machines")
+
+    regressions = []
+
+    for name, result in current["scenarios"].items():
+        if name not in baseline["scenarios"]:
+            continue
+
+        reference = baseline["scenarios"][name]
+
+        if reference["frames_sha1"] != result["frames_sha1"]:
+            print(f"Warning: {name}, different clips")
+
+        print(f"{name} ({baseline['commit']} -> {current['commit']})")
+        metrics_reference = get_metrics(reference)
+
+        for metric, (value, higher_is_better) in get_metrics(result).items():
+            if metric not in metrics_reference:
+                continue
+
+            value_reference = metrics_reference[metric][0]
+            change = (value - value_reference) / value_reference if value_reference > 0 else 0
+            worse = -change if higher_is_better else change
+
+            checked = higher_is_better or metric == "peak_rss_mb" or max(value, value_reference) >= min_time
+            flag = ""
+
+            if checked and worse > tolerance:
+                flag = " REGRESSION"
+                regressions.append((name, metric, value_reference, value))
+            elif checked and -worse > tolerance:
+                flag = " improvement"
+
+            print(f"  {metric:24} {value_reference:10.2f} {value:10.2f} {change * 100:+7.1f}%{flag}")
+
+    return regressions
+
+
+def load_results(path):
+    r"""
+    Load a results file.
+
+    :param path: path of the JSON file.
+    """
+
+    with open(path) as file:
+        return json.load(file)
+
+
+if __name__ == "__main__":
+    r"""
+    Benchmark of the headless pipeline (OpticalFlowDense + Motion) on synthetic traffic clips.
+    Run from the root of the project:
+        python -m Benchmark.pipeline run [--scenarios small_light medium_dense] [--output results.json]
+        python -m Benchmark.pipeline compare baseline.json current.json
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark of the pipeline on synthetic traffic clips.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parser_run = commands.add_parser("run", help="runs the benchmark and writes the results.")
+    parser_run.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser_run.add_argument("--frames", type=int, default=NUM_FRAMES, help="number of frames of the clips.")
+    parser_run.add_argument("--seed", type=int, default=SEED, help="seed of the clips.")
+    parser_run.add_argument("--repeat", type=int, default=1, help="number of runs of each scenario (median).")
+    parser_run.add_argument("--backend", default=FARNEBACK, help="backend of the optical flow.")
+    parser_run.add_argument("--preset", default=PRESET_MEDIUM, help="preset of the optical flow.")
+    parser_run.add_argument("--prediction", action="store_true", help="predicts the position of the vehicles.")
+    parser_run.add_argument("--clips", default=CLIPS_FOLDER, help="folder of the clips.")
+    parser_run.add_argument("--output", help="results file (default Benchmark/results/<commit>.json).")
+
+    parser_compare = commands.add_parser("compare", help="compares two results files.")
+    parser_compare.add_argument("baseline", help="results of reference.")
+    parser_compare.add_argument("current", help="results to check.")
+    parser_compare.add_argument("--tolerance", type=float, default=TOLERANCE, help="relative change allowed.")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run(args.scenarios, args.frames, args.seed, args.repeat, args.backend, args.preset,
+                      args.prediction, args.clips)
+
+        output = args.output or os.path.join(RESULTS_FOLDER, f"{results['commit']}.json")
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+
+        with open(output, "w") as file:
+            json.dump(results, file, indent=2)
+
+        print(f"Results: {output}")
+
+    else:
+        regressions = compare(load_results(args.baseline), load_results(args.current), args.tolerance)
+
+        if regressions:
+            print(f"{len(regressions)} regressions")
+            raise SystemExit(1)
@@ -0,0 +1,241 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import time
+
+import cv2 as cv
+
+from Benchmark.evaluation import MotEvaluator, undistort_boxes, IOU_THRESHOLD
+from Benchmark.pipeline import CLIPS_FOLDER, get_commit
+from Benchmark.synthetic import SCENARIOS, SEED, create_clip, load_ground_truth
+from OpticalFlow.flowEngine import FARNEBACK, DIS, COARSE_FARNEBACK, PRESET_FAST, PRESET_MEDIUM
+
+# Parameters of the pipeline swept by default
+GRID = {
+    "flow_backend": [FARNEBACK, DIS, COARSE_FARNEBACK],
+    "flow_preset": [PRESET_FAST, PRESET_MEDIUM],
+    "threshold": [15, 20, 30],
+    "erode_iterations": [8, 12],
+    "min_area": [40, 100],
+}
+
+NUM_FRAMES = 100
+
+# Objectives of the Pareto frontier: (metric, bool true if higher is better)
+OBJECTIVES = [("mota", True), ("fps", True)]
+
+
+def get_configurations(grid):
+    r"""
+    Get all the combinations of the values of the parameters.
+
+    :param grid: dict parameter: list of values.
+
+    :return: list of dict parameter: value.
+    """
+
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def init_worker(num_threads):
+    r"""
+    Initializes a worker of the pool: OpenCV uses num_threads threads, so the workers don't compete for the cores.
+
+    :param num_threads: number of threads of OpenCV.
+    """
+
+    from Common.logger import configure, WARNING
+
+    cv.setNumThreads(num_threads)
+    configure(level=WARNING)
+
+
+def evaluate(task):
+    r"""
+    Runs the headless pipeline with a configuration on a clip and evaluates the tracks with the ground truth.
+
+    :param task: tuple (clip name, path of the clip, path of the ground truth, configuration, IoU threshold).
+
+    :return: dict with clip, configuration, FPS and metrics of MotEvaluator.
+    """
+
+    from main import HeadlessApp
+
+    name, path_clip, path_truth, configuration, iou_threshold = task
+    truth = load_ground_truth(path_truth)
+    width, height = truth["width"], truth["height"]
+
+    # The ground truth is mapped into the frames undistorted by the preprocessing
+    frames = []
+    for items in truth["frames"]:
+        boxes = undistort_boxes([item["box"] for item in items], width, height)
+        frames.append([dict(item, box=box) for item, box in zip(items, boxes)])
+
+    evaluator = MotEvaluator(iou_threshold)
+
+    def sink(iteration, vehicles):
+        # The flow of the iteration is between the frames iteration and iteration + 1, the blobs are at the
+        # positions of the first one
+        if iteration < len(frames):
+            tracks = [(vehicle.id, (*vehicle.coordinates[0], *vehicle.coordinates[3]), vehicle.velocity)
+                      for vehicle in vehicles]
+            evaluator.update(frames[iteration], tracks)
+
+    video = {"Index": 0, "Name": name, "Lane": 0, "Path": path_clip, "Frame rate": (10, 30), "Polygon": [],
+             "Zones": []}
+    app = HeadlessApp(video, excluded_area=False, sink=sink, height_cam=height, width_cam=width, **configuration)
+    num_frames, elapsed_time = app.op_dense.run()
+
+    result = {"clip": name, "configuration": configuration,
+              "fps": num_frames / elapsed_time if elapsed_time > 0 else 0}
+    result.update(evaluator.get_metrics())
+
+    return result
+
+
+def get_pareto_frontier(results, objectives=OBJECTIVES):
+    r"""
+    Get the results not dominated by another result: no other result is at least as good in all objectives and
+    better in one.
+
+    :param results: results (dict with the metrics of the objectives).
+    :param objectives: list of (metric, bool true if higher is better).
+
+    :return: results of the frontier, sorted by the first objective (best first).
+    """
+
+    def get_values(result):
+        return [result[metric] if higher_is_better else -result[metric] for metric, higher_is_better in objectives]
+
+    values = [get_values(result) for result in results]
+    frontier = []
+
+    for i, result in enumerate(results):
+        dominated = any(all(a >= b for a, b in zip(values[j], values[i])) and values[j] != values[i]
+                        for j in range(len(results)) if j != i)
+
+        if not dominated:
+            frontier.append(result)
+
+    return sorted(frontier, key=lambda result: get_values(result), reverse=True)
+
+
+def sweep(clips, grid, processes, num_threads=1, iou_threshold=IOU_THRESHOLD):
+    r"""
+    Evaluates all the configurations of the grid on all the clips, in parallel.
+
+    :param clips: list of (name, path of the clip, path of the ground truth).
+    :param grid: dict parameter: list of values.
+    :param processes: number of processes.
+    :param num_threads: number of threads of OpenCV of each process.
+    :param iou_threshold: minimum IoU of a match.
+
+    :return: list of results.
+    """
+
+    tasks = [(name, path_clip, path_truth, configuration, iou_threshold)
+             for name, path_clip, path_truth in clips for configuration in get_configurations(grid)]
+    results = []
+
+    # Each task in a new process: no state of a run (caches, memory) affects the next ones
+    context = multiprocessing.get_context("spawn")
+
+    with context.Pool(processes, initializer=init_worker, initargs=(num_threads,), maxtasksperchild=1) as pool:
+        for result in pool.imap_unordered(evaluate, tasks):
+            results.append(result)
+            print(f"[{len(results)}/{len(tasks)}] {result['clip']} {result['configuration']}: "
+                  f"MOTA {result['mota']:.3f}, ID switches {result['id_switches']}, FPS {result['fps']:.2f}")
+
+    return results
+
+
+def print_frontier(name, frontier):
+    r"""
+    Prints the Pareto frontier of a clip.
+
+    :param name: name of the clip.
+    :param frontier: results of the frontier.
+    """
+
+    print(f"Pareto frontier {name}:")
+    print(f"  {'MOTA':>6} {'IDSW':>5} {'speed err':>9} {'FPS':>7}  configuration")
+
+    for result in frontier:
+        speed_error = result["speed_error_rel"]
+        speed_error = f"{speed_error * 100:8.1f}%" if speed_error is not None else f"{'n/a':>9}"
+
+        print(f"  {result['mota']:6.3f} {result['id_switches']:5d} {speed_error} {result['fps']:7.2f}  "
+              f"{result['configuration']}")
+
+
+def parse_value(value):
+    r"""
+    Parses a value of the grid given by the command line (integer, float or string).
+
+    :param value: text.
+    """
+
+    for type_value in (int, float):
+        try:
+            return type_value(value)
+        except ValueError:
+            pass
+
+    return value
+
+
+if __name__ == "__main__":
+    r"""
+    Sweep of the parameters of the pipeline: accuracy (CLEAR MOT, speed error) versus throughput (FPS).
+    Run from the root of the project:
+        python -m Benchmark.sweep --scenarios medium_dense --set threshold 15 20 30 --processes 4
+        python -m Benchmark.sweep --clip camera.avi camera.json
+    The ground truth of an annotated clip has the format of Benchmark/synthetic.py: width, height and, for each
+    frame, the list of the vehicles (id, box [x1, y1, x2, y2], optional visibility and velocity in km/h).
+    """
+
+    parser = argparse.ArgumentParser(description="Accuracy versus throughput sweep of the pipeline parameters.")
+    parser.add_argument("--scenarios", nargs="*", default=None, choices=list(SCENARIOS),
+                        help="synthetic scenarios (default medium_dense if no clip is given).")
+    parser.add_argument("--clip", nargs=2, action="append", default=[], metavar=("VIDEO", "TRUTH"),
+                        help="annotated clip and its ground truth (JSON), can be repeated.")
+    parser.add_argument("--frames", type=int, default=NUM_FRAMES, help="number of frames of the synthetic clips.")
+    parser.add_argument("--seed", type=int, default=SEED, help="seed of the synthetic clips.")
+    parser.add_argument("--clips", default=CLIPS_FOLDER, help="folder of the synthetic clips.")
+    parser.add_argument("--set", nargs="+", action="append", default=[], metavar=("PARAMETER", "VALUE"),
+                        help=f"values of a parameter of the grid ({', '.join(GRID)}), can be repeated.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="number of processes.")
+    parser.add_argument("--threads", type=int, default=1, help="number of threads of OpenCV of each process.")
+    parser.add_argument("--iou", type=float, default=IOU_THRESHOLD, help="minimum IoU of a match.")
+    parser.add_argument("--output", default="sweep.json", help="results file.")
+    args = parser.parse_args()
+
+    grid = dict(GRID)
+    for values in args.set:
+        if values[0] not in GRID or len(values) < 2:
+            raise Exception(f"Invalid parameter of the grid: {values}")
+
+        grid[values[0]] = [parse_value(value) for value in values[1:]]
+
+    scenarios = args.scenarios if args.scenarios is not None else ([] if args.clip else ["medium_dense"])
+    clips = [(name, *create_clip(args.clips, name, args.seed, args.frames)) for name in scenarios]
+    clips += [(os.path.splitext(os.path.basename(path_clip))[0], path_clip, path_truth)
+              for path_clip, path_truth in args.clip]
+
+    start_time = time.perf_counter()
+    results = sweep(clips, grid, args.processes, args.threads, args.iou)
+
+    frontiers = {}
+    for name, _, _ in clips:
+        frontiers[name] = get_pareto_frontier([result for result in results if result["clip"] == name])
+        print_frontier(name, frontiers[name])
+
+    with open(args.output, "w") as file:
+        json.dump({"commit": get_commit(), "grid": grid, "processes": args.processes, "threads": args.threads,
+                   "elapsed_s": time.perf_counter() - start_time, "results": results, "frontiers": frontiers},
+                  file, indent=2)
+
+    print(f"Results: {args.output}")
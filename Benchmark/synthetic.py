@@ -0,0 +1,347 @@
+import hashlib
+import json
+import os
+
+import cv2 as cv
+import numpy as np
+
+from MotionTracking.Utility import UP, DOWN, LEFT, RIGHT, get_velocity
+
+# Scenarios: resolution (width, height) and number of vehicles on the road at the same time
+SCENARIOS = {
+    "small_light": (480, 320, 4),
+    "small_dense": (480, 320, 12),
+    "medium_light": (750, 512, 6),
+    "medium_dense": (750, 512, 20),
+    "large_light": (1280, 720, 8),
+    "large_dense": (1280, 720, 32),
+}
+
+FRAME_RATE = 25
+NUM_FRAMES = 150
+SEED = 0
+
+# Size of the vehicles and speed (pixels per frame) at the width of reference
+REFERENCE_WIDTH = 750
+VEHICLE_LENGTH = (36, 56)
+VEHICLE_WIDTH = (20, 28)
+VEHICLE_SPEED = (2.0, 7.0)
+
+ASPHALT = 95
+
+
+def create_background(width, height, rng):
+    r"""
+    Create the road: textured asphalt with a horizontal and a vertical carriageway (crossroad) and lane markings.
+
+    :param width: width of the frame.
+    :param height: height of the frame.
+    :param rng: random generator.
+
+    :return: background (BGR) and lanes as tuples (direction, coordinate of the center of the lane).
+    """
+
+    noise = rng.normal(0, 12, (height, width)).astype(np.float32)
+    asphalt = np.clip(ASPHALT + cv.GaussianBlur(noise, (5, 5), 0), 0, 255).astype(np.uint8)
+    background = cv.cvtColor(asphalt, cv.COLOR_GRAY2BGR)
+
+    # Grass outside the carriageways
+    grass = np.zeros_like(background)
+    grass[:] = (60, 110, 70)
+    road = np.zeros((height, width), np.uint8)
+
+    lane = int(round(height * 0.09))
+    center_y, center_x = height // 2, width // 2
+    cv.rectangle(road, (0, center_y - 2 * lane), (width, center_y + 2 * lane), 255, -1)
+    cv.rectangle(road, (center_x - 2 * lane, 0), (center_x + 2 * lane, height), 255, -1)
+    background[road == 0] = (grass[road == 0] * 0.7 + background[road == 0] * 0.3).astype(np.uint8)
+
+    # Lane markings (dashed) and central lines
+    for x in range(0, width, 4 * lane):
+        for y in (center_y - lane, center_y + lane):
+            cv.line(background, (x, y), (x + 2 * lane, y), (220, 220, 220), 2)
+
+    for y in range(0, height, 4 * lane):
+        for x in (center_x - lane, center_x + lane):
+            cv.line(background, (x, y), (x, y + 2 * lane), (220, 220, 220), 2)
+
+    cv.line(background, (0, center_y), (width, center_y), (0, 200, 230), 2)
+    cv.line(background, (center_x, 0), (center_x, height), (0, 200, 230), 2)
+
+    lanes = [(RIGHT, center_y + lane // 2 + lane), (RIGHT, center_y + lane // 2),
+             (LEFT, center_y - lane // 2 - lane), (LEFT, center_y - lane // 2),
+             (DOWN, center_x - lane // 2 - lane), (DOWN, center_x - lane // 2),
+             (UP, center_x + lane // 2 + lane), (UP, center_x + lane // 2)]
+
+    return background, lanes
+
+
+def create_sprite(length, width, direction, rng):
+    r"""
+    Create the image of a vehicle seen from above: body, windows and wheels.
+
+    :param length: length of the vehicle (pixels).
+    :param width: width of the vehicle (pixels).
+    :param direction: direction of the vehicle.
+    :param rng: random generator.
+
+    :return: sprite (BGR), oriented along the direction.
+    """
+
+    body = tuple(int(value) for value in rng.integers(30, 256, 3))
+    sprite = np.zeros((width, length, 3), np.uint8)
+    sprite[:] = body
+
+    wheel = max(2, width // 6)
+    for x in (length // 6, length - length // 6 - wheel * 2):
+        sprite[:wheel, x:x + wheel * 2] = 20
+        sprite[-wheel:, x:x + wheel * 2] = 20
+
+    # Windshield at the front (right side of the sprite) and rear window
+    window = (40, 40, 40)
+    cv.rectangle(sprite, (length * 6 // 10, wheel), (length * 8 // 10, width - wheel - 1), window, -1)
+    cv.rectangle(sprite, (length // 10, wheel + 1), (length * 2 // 10, width - wheel - 2), window, -1)
+    cv.rectangle(sprite, (length * 3 // 10, wheel + 1), (length * 5 // 10, width - wheel - 2),
+                 tuple(min(255, value + 40) for value in body), -1)
+
+    if direction == LEFT:
+        sprite = cv.flip(sprite, 1)
+    elif direction == DOWN:
+        sprite = cv.rotate(sprite, cv.ROTATE_90_CLOCKWISE)
+    elif direction == UP:
+        sprite = cv.rotate(sprite, cv.ROTATE_90_COUNTERCLOCKWISE)
+
+    return sprite
+
+
+class SyntheticTraffic:
+    r"""
+    Deterministic synthetic traffic on a crossroad: textured vehicles drive along the lanes with constant speed,
+    enter from the border of the frame and leave from the opposite border. The same scenario and seed always
+    give the same frames and the same ground truth.
+    """
+
+    def __init__(self, width, height, num_vehicles, fps=FRAME_RATE, seed=SEED):
+        """
+        Constructor of class.
+
+        :param width: width of the frames.
+        :param height: height of the frames.
+        :param num_vehicles: number of vehicles on the road at the same time.
+        :param fps: frame rate of the clip.
+        :param seed: seed of the random generator.
+        """
+
+        self.width = width
+        self.height = height
+        self.num_vehicles = num_vehicles
+        self.fps = fps
+
+        self.rng = np.random.default_rng(seed)
+        self.background, self.lanes = create_background(width, height, self.rng)
+        self.scale = width / REFERENCE_WIDTH
+
+        # Speed of each lane: the vehicles of the same lane don't overtake each other
+        self.speeds = [float(self.rng.uniform(*VEHICLE_SPEED) * self.scale) for _ in self.lanes]
+
+        self.vehicles = []
+        self.counter_vehicle = 0
+
+        # Vehicles already on the road at the first frame
+        for _ in range(num_vehicles):
+            self.add_vehicle(self.rng.uniform(0, 1))
+
+    def add_vehicle(self, progress=0.0):
+        """
+        Adds a vehicle at the start of a free lane.
+
+        :param progress: fraction of the lane already travelled.
+        """
+
+        for _ in range(10):
+            index = self.rng.integers(0, len(self.lanes))
+            direction, center = self.lanes[index]
+            speed = self.speeds[index]
+            length = int(self.rng.integers(*VEHICLE_LENGTH) * self.scale)
+            width = int(self.rng.integers(*VEHICLE_WIDTH) * self.scale)
+
+            horizontal = direction in (LEFT, RIGHT)
+            size = self.width if horizontal else self.height
+            position = -length + progress * (size + length)
+
+            if direction in (LEFT, UP):
+                position = size - position - length
+
+            # The vehicles in the same lane don't overlap
+            if all(vehicle["direction"] != direction or vehicle["center"] != center or
+                   abs(vehicle["position"] - position) > max(vehicle["length"], length) * 1.5
+                   for vehicle in self.vehicles):
+                break
+        else:
+            return
+
+        self.counter_vehicle += 1
+        self.vehicles.append({"id": self.counter_vehicle, "direction": direction, "center": center,
+                              "length": length, "width": width, "speed": speed, "position": position,
+                              "sprite": create_sprite(length, width, direction, self.rng)})
+
+    def get_box(self, vehicle):
+        """
+        Get the bounding box (x1, y1, x2, y2) of the vehicle, not clipped to the frame.
+
+        :param vehicle: vehicle.
+        """
+
+        position = int(round(vehicle["position"]))
+        half = vehicle["width"] // 2
+
+        if vehicle["direction"] in (LEFT, RIGHT):
+            return position, vehicle["center"] - half, position + vehicle["length"], vehicle["center"] - half + \
+                vehicle["width"]
+
+        return vehicle["center"] - half, position, vehicle["center"] - half + vehicle["width"], \
+            position + vehicle["length"]
+
+    def render(self):
+        """
+        Renders the current frame.
+
+        :return: frame (BGR) and ground truth of the vehicles visible: list of dict with id, box (clipped to the
+                 frame), visibility (fraction of the box into the frame), direction, speed (pixels per frame) and
+                 velocity (km/h, as estimated by Motion).
+        """
+
+        frame = self.background.copy()
+        truth = []
+
+        for vehicle in self.vehicles:
+            x1, y1, x2, y2 = self.get_box(vehicle)
+            cx1, cy1, cx2, cy2 = max(x1, 0), max(y1, 0), min(x2, self.width), min(y2, self.height)
+
+            if cx1 >= cx2 or cy1 >= cy2:
+                continue
+
+            frame[cy1:cy2, cx1:cx2] = vehicle["sprite"][cy1 - y1:cy2 - y1, cx1 - x1:cx2 - x1]
+            visibility = (cx2 - cx1) * (cy2 - cy1) / ((x2 - x1) * (y2 - y1))
+            truth.append({"id": vehicle["id"], "box": [cx1, cy1, cx2, cy2], "visibility": round(visibility, 4),
+                          "direction": vehicle["direction"], "speed": round(vehicle["speed"], 4),
+                          "velocity": round(get_velocity(vehicle["speed"], self.fps), 4)})
+
+        return frame, truth
+
+    def step(self):
+        """
+        Moves the vehicles by one frame, the vehicles out of the frame are replaced by new vehicles.
+        """
+
+        for vehicle in self.vehicles:
+            if vehicle["direction"] in (RIGHT, DOWN):
+                vehicle["position"] += vehicle["speed"]
+            else:
+                vehicle["position"] -= vehicle["speed"]
+
+        self.vehicles = [vehicle for vehicle in self.vehicles if self.is_visible(vehicle)]
+
+        while len(self.vehicles) < self.num_vehicles:
+            self.add_vehicle()
+
+            if len(self.vehicles) < self.num_vehicles and self.rng.uniform(0, 1) < 0.5:
+                # Lanes busy, retry at the next frame
+                break
+
+    def is_visible(self, vehicle):
+        """
+        Check if the vehicle has not yet left the frame.
+
+        :param vehicle: vehicle.
+        """
+
+        x1, y1, x2, y2 = self.get_box(vehicle)
+
+        if vehicle["direction"] == RIGHT:
+            return x1 < self.width
+        elif vehicle["direction"] == LEFT:
+            return x2 > 0
+        elif vehicle["direction"] == DOWN:
+            return y1 < self.height
+
+        return y2 > 0
+
+
+def get_clip_paths(folder, name, seed=SEED, num_frames=NUM_FRAMES):
+    r"""
+    Get the paths of the clip and of its ground truth.
+
+    :param folder: folder of the clips.
+    :param name: name of the scenario.
+    :param seed: seed of the random generator.
+    :param num_frames: number of frames.
+    """
+
+    base = os.path.join(folder, f"{name}_{num_frames}f_s{seed}")
+    return base + ".avi", base + ".json"
+
+
+def create_clip(folder, name, seed=SEED, num_frames=NUM_FRAMES, fps=FRAME_RATE):
+    r"""
+    Create the clip of a scenario and its ground truth (JSON), if they don't exist.
+    The ground truth contains the hash of the frames rendered, to check that two runs used the same clip.
+
+    :param folder: folder of the clips.
+    :param name: name of the scenario (key of SCENARIOS).
+    :param seed: seed of the random generator.
+    :param num_frames: number of frames.
+    :param fps: frame rate of the clip.
+
+    :return: paths of the clip and of the ground truth.
+    """
+
+    if name not in SCENARIOS:
+        raise Exception(f"Unknown scenario: {name}")
+
+    path_clip, path_truth = get_clip_paths(folder, name, seed, num_frames)
+
+    if os.path.exists(path_clip) and os.path.exists(path_truth):
+        return path_clip, path_truth
+
+    os.makedirs(folder, exist_ok=True)
+
+    width, height, num_vehicles = SCENARIOS[name]
+    traffic = SyntheticTraffic(width, height, num_vehicles, fps, seed)
+
+    # Lossless codec: the pipeline sees exactly the frames rendered
+    writer = cv.VideoWriter(path_clip, cv.VideoWriter_fourcc(*"FFV1"), fps, (width, height))
+    if not writer.isOpened():
+        writer = cv.VideoWriter(path_clip, cv.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+
+    frames_hash = hashlib.sha1()
+    frames = []
+
+    for _ in range(num_frames):
+        frame, truth = traffic.render()
+        writer.write(frame)
+        frames_hash.update(frame.tobytes())
+        frames.append(truth)
+        traffic.step()
+
+    writer.release()
+
+    ground_truth = {"scenario": name, "width": width, "height": height, "vehicles": num_vehicles,
+                    "fps": fps, "seed": seed, "frames_sha1": frames_hash.hexdigest(),
+                    "num_tracks": len({vehicle["id"] for truth in frames for vehicle in truth}), "frames": frames}
+
+    with open(path_truth, "w") as file:
+        json.dump(ground_truth, file)
+
+    return path_clip, path_truth
+
+
+def load_ground_truth(path):
+    r"""
+    Load the ground truth of a clip.
+
+    :param path: path of the JSON file.
+    """
+
+    with open(path) as file:
+        return json.load(file)
@@ -1,4 +1,5 @@
 import cv2 as cv
+import hashlib
 import os
 import numpy as np
 
@@ -75,3 +76,75 @@ def load_coefficients(path):
         camera_matrix, dist_matrix, rvecs, tvecs = File['mtx'], File['dist'], File['rvecs'], File['tvecs']
 
     return [camera_matrix, dist_matrix, rvecs, tvecs]
+
+
+def load_undistort_maps(path, width, height):
+    """
+    Loads the undistortion maps (fixed-point, to use with cv.remap) of the camera for the given resolution.
+    The maps are built once and cached on disk next to the calibration file, keyed by the calibration
+    coefficients and the resolution.
+
+    :param path: path of the calibration file.
+    :param width: width of the frame.
+    :param height: height of the frame.
+
+    :return: maps of cv.initUndistortRectifyMap with type CV_16SC2: the first one (height x width x 2) holds
+             the integer coordinates, the second one (height x width) the interpolation coefficients.
+    """
+
+    camera_matrix, dist_matrix, _, _ = load_coefficients(path)
+
+    key = hashlib.sha1()
+    key.update(camera_matrix.tobytes())
+    key.update(dist_matrix.tobytes())
+    key.update(f"{width}x{height}".encode())
+    file_maps = f"{path}/undistort_maps_{width}x{height}_{key.hexdigest()[:16]}.npz"
+
+    if os.path.exists(file_maps):
+        try:
+            with np.load(file_maps) as File:
+                return File['map1'], File['map2']
+        except Exception:
+            # Corrupted cache, the maps are built again
+            pass
+
+    new_camera_matrix, _ = cv.getOptimalNewCameraMatrix(camera_matrix, dist_matrix, (width, height), 0,
+                                                        (width, height))
+    map1, map2 = cv.initUndistortRectifyMap(camera_matrix, dist_matrix, None, new_camera_matrix, (width, height),
+                                            cv.CV_16SC2)
+
+    # Several processes can build the maps at once: each one writes a temporary file and moves it into place
+    # (atomically), so a reader never finds a partial file
+    file_temporary = f"{file_maps}.{os.getpid()}.tmp"
+
+    try:
+        with open(file_temporary, "wb") as File:
+            np.savez(File, map1=map1, map2=map2)
+
+        os.replace(file_temporary, file_maps)
+    except OSError:
+        # Read-only directory, the maps are not cached
+        if os.path.exists(file_temporary):
+            os.remove(file_temporary)
+
+    return map1, map2
+
+
+def undistort_points(path, points, width, height):
+    """
+    Maps points of the frame captured into the frame undistorted by the maps of load_undistort_maps.
+
+    :param path: path of the calibration file.
+    :param points: points (N x 2) of the frame captured.
+    :param width: width of the frame.
+    :param height: height of the frame.
+
+    :return: points (N x 2) of the frame undistorted.
+    """
+
+    camera_matrix, dist_matrix, _, _ = load_coefficients(path)
+    new_camera_matrix, _ = cv.getOptimalNewCameraMatrix(camera_matrix, dist_matrix, (width, height), 0,
+                                                        (width, height))
+
+    points = np.asarray(points, np.float64).reshape(-1, 1, 2)
+    return cv.undistortPoints(points, camera_matrix, dist_matrix, P=new_camera_matrix).reshape(-1, 2)
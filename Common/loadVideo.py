@@ -1,16 +1,176 @@
+import threading
+import time
+from collections import deque
+
 import cv2 as cv
 import pafy
 
 from MotionTracking.Utility import log
 
+# Policies of the frame prefetcher when the buffers are full
+BLOCK = "Block"  # The decoding waits for a free buffer (video files)
+DROP_OLDEST = "Drop oldest"  # The oldest frame not yet read is dropped (live sources)
+
 
-def get_video(url, height, width):
+class FramePrefetcher:
+    r"""
+    Capture that decodes the frames on a background thread into a ring of preallocated buffers,
+    so the decoding overlaps the processing of the frames. It exposes the same methods of cv.VideoCapture
+    used to read the video.
+    """
+
+    def __init__(self, capture, buffer_size=8, policy=BLOCK):
+        """
+        Constructor of class.
+
+        :param capture: cv.VideoCapture to read.
+        :param buffer_size: number of the frame buffers.
+        :param policy: policy when the buffers are full (Block or Drop oldest).
+        """
+
+        self.capture = capture
+        self.policy = policy
+
+        # Ring of the frame buffers (allocated by the first frames decoded)
+        self.buffers = [None] * buffer_size
+        self.free = deque(range(buffer_size))
+        self.ready = deque()
+        self.current = None  # Buffer used by the consumer
+
+        self.condition = threading.Condition()
+        self.finished = False
+        self.stopped = False
+
+        # Counters
+        self.decoded = 0
+        self.dropped = 0
+        self.wait_time = 0
+
+        self.thread = threading.Thread(target=self.decode, daemon=True)
+        self.thread.start()
+
+    def decode(self):
+        """
+        Decodes the frames into the free buffers (background thread).
+        """
+
+        while True:
+            with self.condition:
+                while not self.free and not self.stopped:
+
+                    if self.policy == DROP_OLDEST and self.ready:
+                        # Drops the oldest frame not yet read
+                        self.free.append(self.ready.popleft())
+                        self.dropped += 1
+                    else:
+                        self.condition.wait()
+
+                if self.stopped:
+                    break
+
+                index = self.free.popleft()
+
+            ret, frame = self.capture.read(self.buffers[index])
+
+            with self.condition:
+                if not ret:
+                    # End of the video
+                    self.free.append(index)
+                    self.finished = True
+                    self.condition.notify_all()
+                    break
+
+                self.buffers[index] = frame
+                self.ready.append(index)
+                self.decoded += 1
+                self.condition.notify_all()
+
+    def read(self):
+        """
+        Reads the next frame decoded.
+
+        :return: bool, true if the frame has been read, and the frame (valid until the next call).
+        """
+
+        with self.condition:
+            if self.current is not None:
+                # The previous frame is no longer used
+                self.free.append(self.current)
+                self.current = None
+                self.condition.notify_all()
+
+            start_time = time.perf_counter()
+            while not self.ready and not self.finished:
+                self.condition.wait()
+            self.wait_time += time.perf_counter() - start_time
+
+            if not self.ready:
+                return False, None
+
+            self.current = self.ready.popleft()
+            return True, self.buffers[self.current]
+
+    def grab(self):
+        """
+        Skips the next frame decoded.
+
+        :return: bool, true if the frame has been skipped.
+        """
+
+        ret, _ = self.read()
+        return ret
+
+    def isOpened(self):
+        """
+        Checks if there are frames to read.
+        """
+
+        with self.condition:
+            return self.capture.isOpened() and not (self.finished and not self.ready)
+
+    def get(self, prop):
+        """
+        Gets a property of the capture.
+
+        :param prop: property id.
+        """
+
+        return self.capture.get(prop)
+
+    def get_counters(self):
+        """
+        Gets the counters of the prefetcher.
+
+        :return: frames decoded, frames dropped, frames decoded not yet read and time (seconds) spent by
+                 the consumer waiting for the frames.
+        """
+
+        with self.condition:
+            return {"Decoded": self.decoded, "Dropped": self.dropped, "Queued": len(self.ready),
+                    "Wait time": self.wait_time}
+
+    def release(self):
+        """
+        Stops the decoding and releases the capture.
+        """
+
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+        self.thread.join()
+        self.capture.release()
+
+
+def get_video(url, height, width, buffer_size=0, start_frame=0):
     r"""
     Parse url video. Setting video capture.
 
     :param url: url-video.
     :param height: height of camera video.
     :param width: width of camera video.
+    :param buffer_size: number of frames decoded in advance on a background thread (0 to disable).
+    :param start_frame: index of the first frame read (local videos only).
     """
     flag = False  # Fix unknown exception of pafy
 
@@ -30,8 +190,16 @@ def get_video(url, height, width):
                 cap = cv.VideoCapture(url)
                 cap.set(cv.CAP_PROP_FRAME_WIDTH, width)
                 cap.set(cv.CAP_PROP_FRAME_HEIGHT, height)
+
+                if start_frame > 0:
+                    cap.set(cv.CAP_PROP_POS_FRAMES, start_frame)
                 flag = True
             except Exception as e:
                 log(1, f"Error load local video: {e}")
 
+    if buffer_size > 0:
+        # Live sources drop the oldest frames, video files wait for the processing
+        policy = DROP_OLDEST if "http" in url else BLOCK
+        cap = FramePrefetcher(cap, buffer_size, policy)
+
     return cap
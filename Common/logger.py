@@ -0,0 +1,211 @@
+import atexit
+import json
+import sys
+import threading
+import time
+from collections import deque
+
+from colorama import Style, Fore
+
+# Levels of the messages
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+# Categories of the messages
+CATEGORY_INFO = 0
+CATEGORY_ERROR = 1
+CATEGORY_TABLE = 2
+CATEGORY_DRAWING = 3
+
+# Tag, color and default level of each category
+CATEGORIES = {
+    CATEGORY_INFO: ("INFO", Fore.YELLOW, INFO),
+    CATEGORY_ERROR: ("ERROR", Fore.RED, ERROR),
+    CATEGORY_TABLE: ("TABLE", Fore.BLUE, DEBUG),
+    CATEGORY_DRAWING: ("DRAWING", Fore.GREEN, DEBUG),
+}
+
+
+class Logger:
+    r"""
+    Asynchronous logger: the messages are queued by the caller (no formatting, no I/O) and they are formatted
+    and written in batches by a background thread, to the console and optionally to a JSON-lines file.
+    The messages are filtered by level and by category before being queued.
+    """
+
+    def __init__(self, level=DEBUG, categories=None, console=True, json_path=None, flush_interval=0.1,
+                 max_pending=100000):
+        """
+        Constructor of class.
+
+        :param level: minimum level of the messages.
+        :param categories: categories enabled, None to enable all categories.
+        :param console: bool, if true the messages are written to the console.
+        :param json_path: path of the JSON-lines file, None to disable it.
+        :param flush_interval: maximum time (seconds) before a message is written.
+        :param max_pending: maximum number of messages not yet written (the oldest ones are dropped).
+        """
+
+        self.level = level
+        self.enabled = set(CATEGORIES) if categories is None else set(categories)
+        self.console = console
+
+        self.json_file = None
+        self.set_json_path(json_path)
+
+        self.flush_interval = flush_interval
+        self.pending = deque(maxlen=max_pending)
+
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = False
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def set_json_path(self, json_path):
+        """
+        Sets the JSON-lines file of the messages.
+
+        :param json_path: path of the file, None to disable it.
+        """
+
+        if self.json_file is not None:
+            self.json_file.close()
+
+        self.json_file = open(json_path, "a", encoding="utf-8") if json_path is not None else None
+
+    def is_enabled(self, category, level=None):
+        """
+        Check if the messages of the category (and level) are written.
+
+        :param category: category of the message.
+        :param level: level of the message, None for the default level of the category.
+        """
+
+        if level is None:
+            level = CATEGORIES[category][2]
+
+        return category in self.enabled and level >= self.level
+
+    def log(self, category, msg, *args, level=None):
+        """
+        Queues a message. The message is formatted (msg % args) only when written.
+
+        :param category: category of the message.
+        :param msg: message, format string or callable that returns the message.
+        :param args: arguments of the format string.
+        :param level: level of the message, None for the default level of the category.
+        """
+
+        if level is None:
+            level = CATEGORIES[category][2]
+
+        if category not in self.enabled or level < self.level:
+            return
+
+        self.pending.append((time.time(), category, level, msg, args))
+
+        if category == CATEGORY_ERROR:
+            self.wake.set()
+
+    def run(self):
+        """
+        Writes the messages queued (background thread).
+        """
+
+        while not self.stopped:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        """
+        Formats and writes all the messages queued.
+        """
+
+        with self.lock:
+            records = []
+            while self.pending:
+                records.append(self.pending.popleft())
+
+            if not records:
+                return
+
+            lines = []
+            json_lines = []
+
+            for timestamp, category, level, msg, args in records:
+                try:
+                    text = msg() if callable(msg) else (msg % args if args else str(msg))
+                except Exception as e:
+                    text = f"{msg} {args} (format error: {e})"
+
+                tag, color, _ = CATEGORIES[category]
+
+                if self.console:
+                    lines.append(f"{color}[{tag}] {text}{Style.RESET_ALL}\n")
+
+                if self.json_file is not None:
+                    json_lines.append(json.dumps({"time": timestamp, "level": level, "category": tag,
+                                                  "message": text}) + "\n")
+
+            if lines:
+                sys.stdout.write("".join(lines))
+                sys.stdout.flush()
+
+            if json_lines:
+                self.json_file.write("".join(json_lines))
+                self.json_file.flush()
+
+    def close(self):
+        """
+        Writes the messages queued and stops the background thread.
+        """
+
+        self.stopped = True
+        self.wake.set()
+        self.thread.join()
+        self.flush()
+
+        if self.json_file is not None:
+            self.json_file.close()
+            self.json_file = None
+
+
+logger = Logger()
+atexit.register(logger.close)
+
+
+def get_logger():
+    r"""
+    Get the logger of the application.
+    """
+
+    return logger
+
+
+def configure(level=None, categories=None, console=None, json_path=None):
+    r"""
+    Configures the logger of the application.
+
+    :param level: minimum level of the messages, None to keep the current one.
+    :param categories: categories enabled, None to keep the current ones.
+    :param console: bool, if true the messages are written to the console, None to keep the current value.
+    :param json_path: path of the JSON-lines file, None to keep the current one.
+    """
+
+    with logger.lock:
+        if level is not None:
+            logger.level = level
+
+        if categories is not None:
+            logger.enabled = set(categories)
+
+        if console is not None:
+            logger.console = console
+
+        if json_path is not None:
+            logger.set_json_path(json_path)
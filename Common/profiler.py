@@ -0,0 +1,239 @@
+import json
+import math
+import time
+
+import cv2 as cv
+import numpy as np
+
+from Common import color as Color
+from MotionTracking.Utility import log
+
+# Stages of the processing of a frame
+CAPTURE = "Capture"
+PREPROCESS = "Preprocess"
+FLOW = "Flow"
+SEGMENTATION = "Segmentation"
+CONTOURS = "Contours"
+ASSOCIATION = "Association"
+TABLE = "Table"
+DRAWING = "Drawing"
+DISPLAY = "Display"
+FRAME = "Frame"
+
+STAGES = [CAPTURE, PREPROCESS, FLOW, SEGMENTATION, CONTOURS, ASSOCIATION, TABLE, DRAWING, DISPLAY, FRAME]
+
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram:
+    r"""
+    Histogram of durations with fixed log-spaced bins (from min_time to max_time seconds).
+    Recording a duration doesn't allocate memory, the percentiles are estimated by the bins (relative error
+    lower than half of a bin).
+    """
+
+    def __init__(self, min_time=1e-6, max_time=10.0, bins_per_decade=40):
+        """
+        Constructor of class.
+
+        :param min_time: minimum duration (seconds), the shorter durations are in the first bin.
+        :param max_time: maximum duration (seconds), the longer durations are in the last bin.
+        :param bins_per_decade: number of bins for each power of ten.
+        """
+
+        self.min_time = min_time
+        self.bins_per_decade = bins_per_decade
+        self.num_bins = int(math.ceil(math.log10(max_time / min_time) * bins_per_decade))
+
+        self.counts = np.zeros(self.num_bins, np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, duration):
+        """
+        Adds a duration.
+
+        :param duration: duration (seconds).
+        """
+
+        if duration > self.min_time:
+            index = min(int(math.log10(duration / self.min_time) * self.bins_per_decade), self.num_bins - 1)
+        else:
+            index = 0
+
+        self.counts[index] += 1
+        self.count += 1
+        self.total += duration
+
+        if duration > self.max:
+            self.max = duration
+
+    def get_percentiles(self, percentiles=PERCENTILES):
+        """
+        Get the percentiles of the durations (geometric center of the bin).
+
+        :param percentiles: percentiles (0-100).
+
+        :return: list of durations (seconds).
+        """
+
+        if self.count == 0:
+            return [0.0] * len(percentiles)
+
+        cumulative = np.cumsum(self.counts)
+        indexes = np.searchsorted(cumulative, [self.count * p / 100 for p in percentiles])
+
+        return [min(self.min_time * 10 ** ((index + 0.5) / self.bins_per_decade), self.max) for index in indexes]
+
+    def reset(self):
+        """
+        Deletes all the durations.
+        """
+
+        self.counts[:] = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class Profiler:
+    r"""
+    Timing of the stages of the processing of the frames (monotonic clock).
+    The durations are recorded into the histograms of the stages, reported as percentiles (p50, p95, p99)
+    in an overlay, in a periodic log and in a JSON file.
+
+    Usage: start = profiler.start(); ...; profiler.stop(STAGE, start)
+    """
+
+    def __init__(self, report_interval=5.0):
+        """
+        Constructor of class.
+
+        :param report_interval: interval (seconds) of the log of the percentiles, 0 to disable it.
+        """
+
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self.report_interval = report_interval
+        self.last_report = time.perf_counter()
+
+    def start(self):
+        """
+        Get the current time (start of a stage).
+        """
+
+        return time.perf_counter()
+
+    def stop(self, stage, start):
+        """
+        Records the duration of a stage.
+
+        :param stage: stage.
+        :param start: time of the start of the stage.
+
+        :return: current time (start of the next stage).
+        """
+
+        now = time.perf_counter()
+        self.histograms[stage].record(now - start)
+
+        return now
+
+    def get_percentiles(self):
+        """
+        Get the percentiles (milliseconds) of the stages measured.
+
+        :return: dict stage: (p50, p95, p99).
+        """
+
+        return {stage: tuple(1000 * value for value in histogram.get_percentiles())
+                for stage, histogram in self.histograms.items() if histogram.count > 0}
+
+    def get_report(self):
+        """
+        Get the percentiles of the stages as text.
+        """
+
+        return ", ".join(f"{stage} {p50:.1f}/{p95:.1f}/{p99:.1f}"
+                         for stage, (p50, p95, p99) in self.get_percentiles().items())
+
+    def report(self):
+        """
+        Logs the percentiles, if the last log is older than the report interval.
+        """
+
+        if self.report_interval <= 0:
+            return
+
+        now = time.perf_counter()
+
+        if now - self.last_report >= self.report_interval:
+            log(0, "Profile [ms p50/p95/p99]: %s", self.get_report())
+            self.last_report = now
+
+    def draw(self, img, position, dim=1.0, color=Color.RED):
+        """
+        Draws the percentiles of the stages into the image.
+        The lines that don't fit into the image are moved left, to be right-aligned to its border.
+
+        :param img: image.
+        :param position: position (x, y) of the first line.
+        :param dim: dimension of the text.
+        :param color: color of the text.
+        """
+
+        x, y = position
+        step = int(20 * dim)
+        margin = 10
+
+        for stage, (p50, p95, p99) in self.get_percentiles().items():
+            text = f"{stage}: {p50:.1f}/{p95:.1f}/{p99:.1f} ms"
+            (width, _), _ = cv.getTextSize(text, cv.FONT_HERSHEY_PLAIN, dim, 1)
+
+            cv.putText(img, text, (max(margin, min(x, img.shape[1] - width - margin)), y), cv.FONT_HERSHEY_PLAIN,
+                       dim, color, 1)
+            y += step
+
+    def dump(self, path):
+        """
+        Writes the statistics of the stages into a JSON file.
+
+        :param path: path of the file.
+        """
+
+        stages = {}
+
+        for stage, histogram in self.histograms.items():
+            if histogram.count == 0:
+                continue
+
+            p50, p95, p99 = (1000 * value for value in histogram.get_percentiles())
+            stages[stage] = {"count": histogram.count, "mean_ms": 1000 * histogram.total / histogram.count,
+                             "p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "max_ms": 1000 * histogram.max}
+
+        with open(path, "w") as file:
+            json.dump({"stages": stages}, file, indent=2)
+
+
+class NullProfiler:
+    r"""
+    Profiler that doesn't measure anything, used when the profiling is disabled.
+    """
+
+    def start(self):
+        return 0
+
+    def stop(self, stage, start):
+        return 0
+
+    def get_percentiles(self):
+        return {}
+
+    def report(self):
+        pass
+
+    def draw(self, img, position, dim=1.0, color=Color.RED):
+        pass
+
+    def dump(self, path):
+        pass
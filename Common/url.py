@@ -13,6 +13,9 @@ polygons_cambridge = [np.array([[330, 338], [469, 341], [353, 236], [298, 199],
                       # Right Polygon
                       ]
 
+zones_cambridge = ["Top", "Left", "Bottom", "Centered", "Right"]  # Names of the polygons
+
 # Urls videos
 CAMBRIDGE = {"Index": 1, "Name": "CAMBRIDGE", "Lane": 0, "Path": "https://youtu.be/f1DyY6a44yA",
-             "Frame rate": (635, 40), "Polygon": polygons_cambridge}  # USA
+             "Frame rate": (635, 40), "Polygon": polygons_cambridge,
+             "Zones": zones_cambridge}  # USA
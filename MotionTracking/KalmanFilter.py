@@ -0,0 +1,126 @@
+import numpy as np
+
+
+class KalmanFilter:
+    r"""
+    Constant-velocity Kalman filter of the centroids of the vehicles, state (x, y, vx, vy) in pixels and
+    pixels per frame. All methods work on stacks of vehicles (arrays N x 4 and N x 4 x 4).
+    """
+
+    def __init__(self, std_measurement=3.0, std_acceleration=2.0, std_position=3.0, std_velocity=15.0):
+        """
+        Constructor of class.
+
+        :param std_measurement: standard deviation (pixels) of the centroid of the blob.
+        :param std_acceleration: standard deviation (pixels / frame^2) of the acceleration of the vehicle.
+        :param std_position: initial standard deviation (pixels) of the position.
+        :param std_velocity: initial standard deviation (pixels / frame) of the velocity.
+        """
+
+        self.std_acceleration = std_acceleration
+        self.initial_covariance = np.diag([std_position ** 2, std_position ** 2,
+                                           std_velocity ** 2, std_velocity ** 2])
+
+        # Noise of the measurement (position)
+        self.measurement_noise = np.eye(2) * std_measurement ** 2
+
+    def get_transition(self, dt):
+        """
+        Get the transition matrix and the process noise.
+
+        :param dt: elapsed time (frames).
+        """
+
+        transition = np.eye(4)
+        transition[0, 2] = transition[1, 3] = dt
+
+        # Noise of a random (white) acceleration
+        g = np.array([[dt ** 2 / 2, 0], [0, dt ** 2 / 2], [dt, 0], [0, dt]])
+        noise = g @ g.T * self.std_acceleration ** 2
+
+        return transition, noise
+
+    def initiate(self, positions):
+        """
+        Creates the states of new vehicles (velocity equal to zero).
+
+        :param positions: positions (N x 2).
+
+        :return: means (N x 4) and covariances (N x 4 x 4).
+        """
+
+        means = np.zeros((len(positions), 4))
+        means[:, :2] = positions
+        covariances = np.repeat(self.initial_covariance[None], len(positions), axis=0)
+
+        return means, covariances
+
+    def predict(self, means, covariances, dt=1):
+        """
+        Predicts the states after dt frames.
+
+        :param means: means (N x 4).
+        :param covariances: covariances (N x 4 x 4).
+        :param dt: elapsed time (frames).
+
+        :return: means and covariances predicted.
+        """
+
+        transition, noise = self.get_transition(dt)
+
+        means = means @ transition.T
+        covariances = np.einsum("ij,njk,lk->nil", transition, covariances, transition) + noise
+
+        return means, covariances
+
+    def project(self, means, covariances):
+        """
+        Projects the states into the measurement space (position).
+
+        :param means: means (N x 4).
+        :param covariances: covariances (N x 4 x 4).
+
+        :return: positions (N x 2) and covariances of the innovation (N x 2 x 2).
+        """
+
+        return means[:, :2], covariances[:, :2, :2] + self.measurement_noise
+
+    def get_radii(self, covariances, gate=3.0):
+        """
+        Get the radii of the gates around the positions predicted, gate times the standard deviation
+        along the major axis of the covariance of the innovation.
+
+        :param covariances: covariances (N x 4 x 4).
+        :param gate: number of standard deviations.
+
+        :return: radii (N).
+        """
+
+        innovation = covariances[:, :2, :2] + self.measurement_noise
+        a, b, c = innovation[:, 0, 0], innovation[:, 0, 1], innovation[:, 1, 1]
+
+        # Maximum eigenvalue of a 2x2 symmetric matrix
+        eigenvalue = (a + c) / 2 + np.sqrt(((a - c) / 2) ** 2 + b ** 2)
+
+        return gate * np.sqrt(eigenvalue)
+
+    def update(self, means, covariances, positions):
+        """
+        Corrects the states with the positions measured.
+
+        :param means: means (N x 4).
+        :param covariances: covariances (N x 4 x 4).
+        :param positions: positions measured (N x 2).
+
+        :return: means and covariances corrected.
+        """
+
+        projected_means, innovation = self.project(means, covariances)
+
+        # Kalman gain: P H^T S^-1
+        gain = covariances[:, :, :2] @ np.linalg.inv(innovation)
+
+        means = means + np.einsum("nij,nj->ni", gain, positions - projected_means)
+        covariances = covariances - np.einsum("nij,njk->nik", gain, covariances[:, :2, :])
+
+        return means, covariances
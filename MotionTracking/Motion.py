@@ -2,19 +2,32 @@ import cv2 as cv
 import numpy as np
 
 import Common.color as Color
+from Common.profiler import NullProfiler, SEGMENTATION, CONTOURS, ASSOCIATION, DRAWING, TABLE
+from MotionTracking.KalmanFilter import KalmanFilter
+from MotionTracking.RegionStatistics import RegionStatistics
 from MotionTracking.Table import COLUMN_VELOCITY, COLUMN_DIRECTION, COLUMN_STATIONARY
+from MotionTracking.TrackStore import TrackStore, PREVIOUS, CURRENT, STATIONARY, LOST, DRAWN
 from MotionTracking.Utility import log
 from MotionTracking.Vehicle import UNKNOWN
-from MotionTracking.Vehicle import Vehicle
 from MotionTracking import Utility as Utility
 
+# Maximum distance (pixels) to associate a blob to a vehicle of the previous frame or of the history
+MAX_DISTANCE_TRACKING = 30
+MAX_DISTANCE_HISTORY = 50
+
+# Gate (standard deviations) around the position predicted and its minimum and maximum radius (pixels)
+PREDICTION_GATE = 3.0
+PREDICTION_MIN_RADIUS = 20
+PREDICTION_MAX_RADIUS = 60
+
 
 class Motion:
     """
     Class to detect moving vehicles.
     """
 
-    def __init__(self, table, excluded_area, show_log, iterations_history=25, iterations_stationary=25):
+    def __init__(self, table, excluded_area, show_log, iterations_history=25, iterations_stationary=25,
+                 show_masks=True, threshold=20, erode_iterations=12, min_area=40, prediction=False, profiler=None):
         """
         Constructor of class Motion.
 
@@ -23,6 +36,13 @@ class Motion:
         :param show_log: bool, if true the logs are showed.
         :param iterations_history: maximum number frame before deleting the vehicle history.
         :param iterations_stationary: maximum number frame before deleting the stationary vehicle.
+        :param show_masks: bool, if true the masks are showed.
+        :param threshold: threshold (gray level of the flow rendered in HSV) to mark a pixel as moving.
+        :param erode_iterations: number of erosions (3x3 ellipse) of the binary mask.
+        :param min_area: minimum area (pixels) of a vehicle.
+        :param prediction: bool, if true the position of the vehicles is predicted (constant-velocity Kalman filter)
+                           and the blobs are associated around the position predicted.
+        :param profiler: profiler of the stages (segmentation, contours, association, drawing, table), None to disable.
         """
         # Number of the vehicles
         self.counter_vehicle = 0
@@ -30,123 +50,144 @@ class Motion:
         # Iteration number
         self.iteration = 0
 
-        # Frame Rate
+        # Frame Rate and frames of the video elapsed since the previous frame processed
         self.fps = 0
+        self.dt = 1
 
-        # Mask: [HSV Model] hue (direction of car), value (velocity), saturation (unused)
-        # Each row of mask: (hue  [ANGLE], saturation, value [VELOCITY])
+        # Hue (direction of car) and value (velocity, normalized magnitude) of the optical flow.
+        # The HSV mask (hue, saturation, value) is rendered only to be showed.
         self.mask_hsv = None
+        self.hue = None
+        self.value = None
         self.angle = None
         self.magnitude = None
 
+        # Binary mask of the moving pixels, buffers of the morphological operations
+        self.mask_bin = None
+        self.mask_erode = None
+        self.mask_dilate = None
+        self.erode_iterations = erode_iterations
+
+        # Blobs (vehicles) of the binary mask: labels of the pixels and minimum area
+        self.labels = None
+        self.min_area = min_area
+
+        # Map of the zones (polygons) and names of the zones
+        self.zones_map = None
+        self.zones = []
+
+        # Minimum value of a moving pixel for each hue and the map of the minimum values of the frame
+        self.hue_thresholds = Utility.get_hue_thresholds(threshold)
+        self.value_thresholds = None
+
+        # Statistics (intensity and direction) of the bounding boxes
+        self.region_statistics = RegionStatistics()
+
+        # Offset (x, y) of the region of interest in which the optical flow is calculated
+        self.offset = (0, 0)
+
         # Table
         self.table = table
 
-        # Vehicle list
-        self.prev_vehicles = []
-        self.current_vehicles = []
-        self.deleted_vehicles = []
-        self.vehicles_stationary = []
+        # Vehicles tracked (previous frame, current frame, stationary, lost and to draw)
+        self.tracks = TrackStore(iterations_history)
 
-        self.color_list = []
+        # Prediction of the position of the vehicles, None if disabled
+        self.kalman_filter = KalmanFilter() if prediction else None
 
-        self.vehicles_to_draw = []
+        # Timing of the stages
+        self.profiler = profiler if profiler is not None else NullProfiler()
 
-        # Maximum num frame before deleting the vehicle history
-        self.num_iterations_to_remove_vehicle_history = iterations_history
+        self.color_list = []
 
         # Maximum num frame before deleting the stationary vehicle
         self.num_iterations_stationary = iterations_stationary
 
-        # Minimum distance to mark a vehicle as stationary.
+        # Minimum distance (in one frame of the video) to mark a vehicle as stationary.
         self.dist_for_stationary = 1.5
 
         self.show_log = show_log
+        self.show_masks = show_masks
         self.excluded_area = excluded_area
 
-    def detect_vehicle(self, img, img_to_draw, flow, iter, fps, polygons):
+    def detect_vehicle(self, img, img_to_draw, flow, iter, fps, polygons, roi=None, zones=None, dt=1):
         r"""
         Detect vehicle into img
 
         :param img: img.
-        :param img_to_draw: img in which to draw vehicles.
+        :param img_to_draw: img in which to draw vehicles, None to skip the drawing.
         :param flow: optical flow.
         :param iter: current iteration.
-        :param fps: current frame per second.
+        :param fps: current frame per second (of the frames processed).
         :param polygons: polygons of the city.
+        :param roi: region of interest (x, y, width, height) of the optical flow, None if it is the whole img.
+        :param zones: names of the polygons.
+        :param dt: number of frames of the video elapsed since the previous frame processed (stride).
+
+        :return: vehicles tracked in the current frame.
         """
 
         self.iteration = iter
         self.fps = fps
+        self.dt = dt
+        self.offset = (0, 0) if roi is None else roi[:2]
 
-        if self.mask_hsv is None:
-            self.mask_hsv = np.zeros_like(img)
-            self.mask_hsv[..., 1] = 255
+        start = self.profiler.start()
+        self.segmentation(flow)
+        start = self.profiler.stop(SEGMENTATION, start)
 
-        self.magnitude, self.angle = cv.cartToPolar(flow[:, :, 0], flow[:, :, 1])
-        self.mask_hsv[..., 0] = self.angle * 180 / np.pi / 2
-        self.mask_hsv[..., 2] = cv.normalize(self.magnitude, None, 0, 255, cv.NORM_MINMAX)
+        if polygons is not None and self.zones_map is None:
+            # Map of the zones, built once
+            self.zones_map = Utility.get_zones_map(polygons, img.shape[0], img.shape[1])
+            self.zones = zones if zones is not None else [f"Zone {index + 1}" for index in range(len(polygons))]
 
-        mask_rgb = cv.cvtColor(self.mask_hsv, cv.COLOR_HSV2BGR)
-        mask = np.zeros_like(img)
-        self.mask_hsv = cv.addWeighted(mask, 1, mask_rgb, 2, 0)
+        blobs = self.morphological_operations()
+        start = self.profiler.stop(CONTOURS, start)
 
-        contours = self.morphological_operations()
-        self.vehicles_to_draw.clear()
+        self.tracks.clear(DRAWN)
 
-        if len(self.prev_vehicles) == 0:
+        if self.tracks.count(PREVIOUS) == 0:
             """
             Adds new vehicles only to the first iteration or 
             when the scene is devoid of vehicles.
             """
 
-            for num, cnt in enumerate(contours):
-                ret, coordinates = Utility.discard_area(cnt, polygons, self.excluded_area)
-
-                if ret:
-                    continue
+            associations = self.associate(blobs, self.tracks.get_vehicles(LOST), MAX_DISTANCE_HISTORY)
 
+            for coordinates, (result, distance) in zip(blobs, associations):
                 vehicle = self.check_vehicle_by_colors(coordinates)
                 if vehicle is None:
                     # Checks if the vehicle was already tracked
-                    ret = self.check_repaint_vehicles(coordinates)
+                    ret = self.check_repaint_vehicles(coordinates, result, distance)
 
                     if not ret:
                         # New vehicle added
                         self.create_new_vehicle(coordinates)
 
-            # Updates list to draw vehicles and update table
-            Utility.draw_vehicles(self.vehicles_to_draw + self.vehicles_stationary, self.iteration, img_to_draw,
-                                  self.show_log)
-            self.table.add_rows(self.vehicles_to_draw + self.vehicles_stationary)
-
         else:
             """
             Adds new vehicles based on previous frame.
             """
             tmp_new_coordinates = []
 
-            for num, cnt in enumerate(contours):
-                ret, coordinates = Utility.discard_area(cnt, polygons, self.excluded_area)
+            associations = self.associate(blobs,
+                                          self.tracks.get_vehicles(PREVIOUS) + self.tracks.get_vehicles(STATIONARY),
+                                          MAX_DISTANCE_TRACKING, prediction=self.kalman_filter is not None)
 
-                if ret:
-                    continue
-
-                vehicle = self.check_vehicle_by_colors(coordinates)
-                if vehicle is None:
-                    vehicle = self.tracking(coordinates=coordinates, img=img)
+            for coordinates, (vehicle, distance) in zip(blobs, associations):
+                if self.check_vehicle_by_colors(coordinates) is None:
+                    vehicle = self.tracking(coordinates=coordinates, img=img, vehicle=vehicle, min_distance=distance)
 
                     if vehicle is None:
                         tmp_new_coordinates.append(coordinates)
 
-            for coordinates in tmp_new_coordinates:
-                self.add_new_vehicles(coordinates)
+            associations = self.associate(tmp_new_coordinates, self.tracks.get_vehicles(LOST),
+                                          MAX_DISTANCE_HISTORY)
 
-            Utility.draw_vehicles(self.vehicles_to_draw + self.vehicles_stationary, self.iteration, img_to_draw,
-                                  self.show_log)
-            self.table.add_rows(self.vehicles_to_draw + self.vehicles_stationary)
+            for coordinates, (result, distance) in zip(tmp_new_coordinates, associations):
+                self.add_new_vehicles(coordinates, result, distance)
 
-            for vehicle in self.prev_vehicles:
+            for vehicle in self.tracks.get_vehicles(PREVIOUS):
                 # Deletes vehicles to no longer track
 
                 for index, color in enumerate(self.color_list):
@@ -154,120 +195,270 @@ class Motion:
                         del self.color_list[index]
                         break
 
-                self.table.delete_row(vehicle.name)
+                self.table.delete_row(vehicle.id)
 
                 # Add vehicles to history list
                 vehicle.set_iteration(self.iteration)
-                self.deleted_vehicles.append(vehicle)
+                self.tracks.mark_as_lost(vehicle, self.iteration)
+
+        if self.kalman_filter is not None:
+            self.correct(self.tracks.get_vehicles(CURRENT))
+
+        start = self.profiler.stop(ASSOCIATION, start)
 
-        tmp_list = []
-        count_deleted = 0
+        # Updates list to draw vehicles and update table
+        tracked_vehicles = self.tracks.get_vehicles(DRAWN) + self.tracks.get_vehicles(STATIONARY)
+        Utility.draw_vehicles(tracked_vehicles, self.iteration, img_to_draw, self.show_log)
+        start = self.profiler.stop(DRAWING, start)
 
-        for index, stat_vehicle in enumerate(self.vehicles_stationary):
-            # Remove the vehicle if has been tracked for more than N iteration.
+        self.table.add_rows(tracked_vehicles)
 
-            if stat_vehicle.iteration == self.iteration - self.num_iterations_stationary:
-                del tmp_list[index - count_deleted]
-                count_deleted += 1
+        # Publishes the changes of the table (rate limited)
+        self.table.flush()
+        self.profiler.stop(TABLE, start)
 
-        # Updates vehicles history list
-        self.vehicles_stationary = tmp_list.copy()
+        # Stationary vehicles are kept for one frame
+        self.tracks.clear(STATIONARY)
 
         # Updates lists
-        self.prev_vehicles = self.current_vehicles.copy()
-        self.current_vehicles.clear()
+        self.tracks.next_frame()
 
         # Deletes vehicles history after N iterations
-        tmp_list = self.deleted_vehicles.copy()
-        count_deleted = 0
-        for index, del_vehicle in enumerate(self.deleted_vehicles):
+        self.tracks.delete_lost(self.iteration)
+
+        return tracked_vehicles
+
+    def associate(self, blobs, vehicles, max_distance, default_distance=150, prediction=False):
+        """
+        Associates all the blobs to the vehicles in one shot.
+        The cost matrix of the distances among the centroids (gated by distance and direction)
+        is solved by the optimal assignment, so each vehicle is associated at most to one blob.
+
+        :param blobs: coordinates (start point, end point) of the blobs.
+        :param vehicles: list of vehicles.
+        :param max_distance: maximum allowable distance in the search for the vehicle (in one frame of the video,
+                             it's scaled by the frames elapsed since the previous frame processed).
+        :param default_distance: distance returned for the blobs not associated.
+        :param prediction: bool, if true the blobs are searched around the positions predicted, with the radius
+                           of the uncertainty of the prediction instead of max_distance.
+
+        :return: for each blob the vehicle associated (None if not associated) and the distance.
+        """
+
+        associations = [(None, default_distance)] * len(blobs)
+
+        # Vehicles without duplicates
+        tracks = {}
+        for vehicle in vehicles:
+            tracks.setdefault(vehicle.name, vehicle)
+        tracks = list(tracks.values())
+
+        if len(blobs) == 0 or len(tracks) == 0:
+            return associations
+
+        centroids = Utility.get_centroids(blobs)
+        directions = [self.get_direction(coordinates) for coordinates in blobs]
+        track_centroids = self.tracks.get_centroids(tracks)
+        track_directions = self.tracks.get_directions(tracks)
+
+        if prediction:
+            positions, max_distance = self.predict(tracks)
+            cost = Utility.get_cost_matrix(centroids, directions, positions, track_directions, max_distance)
+            matches, _ = Utility.get_assignment(cost)
 
-            if del_vehicle.iteration == self.iteration - self.num_iterations_to_remove_vehicle_history:
-                del tmp_list[index - count_deleted]
-                count_deleted += 1
+            # Distances from the previous positions (to calculate the velocity)
+            difference = centroids - track_centroids[np.maximum(matches, 0)]
+            distances = np.where(matches >= 0, np.hypot(difference[:, 0], difference[:, 1]), np.inf)
+        else:
+            # The displacement of the vehicles grows with the stride of the frames
+            cost = Utility.get_cost_matrix(centroids, directions, track_centroids, track_directions,
+                                           max_distance * self.dt)
+            matches, distances = Utility.get_assignment(cost)
+
+        for index in np.flatnonzero(matches >= 0):
+            vehicle = tracks[matches[index]]
+            associations[index] = (vehicle, distances[index])
+
+            if self.show_log:
+                log(0, "Update bounding box for %s, [Distance]: %s", vehicle.name, distances[index])
 
-        # Updates vehicles history list
-        self.deleted_vehicles = tmp_list.copy()
+        return associations
 
-    def get_distance(self, coordinates, list, max_distance, default_distance=150):
+    def predict(self, vehicles):
         """
-        Calculates the distance among all vehicles detected.
+        Predicts the position of the vehicles in the current frame.
 
-        :param coordinates: coordinates of the next bounding box (vehicle).
-        :param list: list of vehicles to loop.
-        :param max_distance: maximum allowable distance in the search for the vehicle.
-        :param default_distance: default value minimum distance.
+        :param vehicles: list of vehicles.
 
-        :return min_distance: smaller distance located relative to the coordinates.
-        :return result: information of the vehicle extracted on the basis of the coordinates.
+        :return: positions predicted (N x 2) and radii of the gates (N).
         """
 
-        new_centroid = Utility.get_centroid(coordinates)
-        dist_already_calculated = []
+        slots = self.tracks.get_slots(vehicles)
+        means, covariances = self.tracks.kalman_means[slots], self.tracks.kalman_covariances[slots]
 
-        min_distance = default_distance
-        result = None
+        # Vehicles without a state (new or found again in the history)
+        new = self.tracks.kalman_iterations[slots] < 0
+        if new.any():
+            means[new], covariances[new] = self.kalman_filter.initiate(self.tracks.centroids[slots[new]])
+
+        means, covariances = self.kalman_filter.predict(means, covariances, self.dt)
+
+        self.tracks.kalman_means[slots] = means
+        self.tracks.kalman_covariances[slots] = covariances
+        self.tracks.kalman_iterations[slots] = self.iteration
+
+        radii = self.kalman_filter.get_radii(covariances, PREDICTION_GATE)
+
+        return means[:, :2], np.clip(radii, PREDICTION_MIN_RADIUS, PREDICTION_MAX_RADIUS)
+
+    def correct(self, vehicles):
+        """
+        Corrects the states of the vehicles updated in the current frame with their new position.
+        The vehicles not predicted in this frame (new or found again in the history) are initiated.
+
+        :param vehicles: list of vehicles.
+        """
+
+        if len(vehicles) == 0:
+            return
+
+        slots = self.tracks.get_slots(vehicles)
+        positions = self.tracks.centroids[slots]
+        predicted = self.tracks.kalman_iterations[slots] == self.iteration
+
+        if predicted.any():
+            slots_predicted = slots[predicted]
+            self.tracks.kalman_means[slots_predicted], self.tracks.kalman_covariances[slots_predicted] = \
+                self.kalman_filter.update(self.tracks.kalman_means[slots_predicted],
+                                          self.tracks.kalman_covariances[slots_predicted], positions[predicted])
+
+        if not predicted.all():
+            slots_new = slots[~predicted]
+            self.tracks.kalman_means[slots_new], self.tracks.kalman_covariances[slots_new] = \
+                self.kalman_filter.initiate(positions[~predicted])
+
+        self.tracks.kalman_iterations[slots] = self.iteration
 
-        for box in list:
+    def segmentation(self, flow):
+        """
+        Calculates the binary mask of the moving pixels.
+        The normalized magnitude of the flow is thresholded directly, with the minimum value of its hue,
+        so the mask is the same of the flow rendered in HSV, converted to gray and thresholded.
+
+        :param flow: optical flow.
+        """
+
+        if self.mask_bin is None or self.mask_bin.shape != flow.shape[:2]:
+            self.hue = np.empty(flow.shape[:2], np.uint8)
+            self.value = np.empty(flow.shape[:2], np.float32)
+            self.value_thresholds = np.empty(flow.shape[:2], np.float32)
+            self.mask_bin = np.empty(flow.shape[:2], np.uint8)
+            self.mask_erode = np.empty(flow.shape[:2], np.uint8)
+            self.mask_dilate = np.empty(flow.shape[:2], np.uint8)
 
-            if not box.name in dist_already_calculated:
-                # Check if the vehicle has been already controlled.
-                dist_already_calculated.append(box.name)
+        self.magnitude, self.angle = cv.cartToPolar(flow[:, :, 0], flow[:, :, 1], self.magnitude, self.angle)
 
-                _centroid = box.centroid
-                distance = Utility.get_length(new_centroid, _centroid)
+        # Hue in [0, 180] (truncated) and value in [0, 255]
+        cv.convertScaleAbs(self.angle, self.hue, alpha=90 / np.pi, beta=-0.5)
+        cv.normalize(self.magnitude, self.value, 0, 255, cv.NORM_MINMAX)
 
-                if max_distance > distance >= 0:
-                    # Check if the vehicle has a distance between the values.
+        cv.LUT(self.hue, self.hue_thresholds, self.value_thresholds)
+        cv.compare(self.value, self.value_thresholds, cv.CMP_GE, self.mask_bin)
 
-                    direction = Utility.get_direction(coordinates, self.angle, self.magnitude)
+        self.region_statistics.update(self.hue, self.magnitude, self.offset)
 
-                    if (box.get_direction() == UNKNOWN or direction == box.get_direction()) or distance <= 50:
-                        # Check if the vehicle has the same direction
+    def get_displacement(self):
+        """
+        Get the displacement of the fastest vehicle in the last frame: the maximum magnitude of the flow into
+        the blobs (the isolated noise is removed by the erosion).
 
-                        if min_distance == default_distance or distance < min_distance:
-                            # Updates variables
-                            min_distance = distance  # Minimum distance between vehicles
-                            result = box  # Vehicle to be returned
+        :return: displacement (pixels), 0 if nothing moves.
+        """
 
-                            if self.show_log:
-                                log(0, f"Update bounding box for {box.name}, [Distance]: {min_distance}")
+        if self.mask_dilate is None or cv.countNonZero(self.mask_dilate) == 0:
+            return 0.0
 
-                            if min_distance == 0:
-                                break
+        _, max_value, _, _ = cv.minMaxLoc(self.magnitude, self.mask_dilate)
 
-        return min_distance, result
+        return max_value
 
     def morphological_operations(self):
         """
         Performs morphological operations on the mask.
 
-        :return contours: contours detect by mask.
+        :return blobs: bounding boxes (start point, end point) of the vehicles (coordinates of the img).
         """
 
-        mask_gray = cv.cvtColor(self.mask_hsv, cv.COLOR_BGR2GRAY)
-        _, mask_bin = cv.threshold(mask_gray, 20, 255, cv.THRESH_BINARY)
-
         # Morphological operations
-        kernel = cv.getStructuringElement(cv.MORPH_ELLIPSE, (3, 3))
-        mask_erode = cv.erode(mask_bin, kernel, iterations=12)
-        mask_dilate = cv.dilate(mask_erode, kernel, iterations=1)
+        mask_dilate = Utility.erode_dilate(self.mask_bin, self.erode_iterations, self.mask_erode, self.mask_dilate)
+
+        # Find blobs
+        zones_map = self.zones_map if self.excluded_area else None
+        boxes, self.labels = Utility.extract_blobs(mask_dilate, self.offset, self.min_area, zones_map, self.labels)
+
+        if self.show_masks:
+            self.show_mask(mask_dilate, len(boxes))
+
+        return [((x_start, y_start), (x_end, y_end)) for x_start, y_start, x_end, y_end in boxes.tolist()]
+
+    def show_mask(self, mask_dilate, num_contours):
+        """
+        Shows the binary mask and the mask of the optical flow.
 
-        # Find contours
-        contours, _ = cv.findContours(mask_dilate, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_NONE)
+        :param mask_dilate: binary mask.
+        :param num_contours: number of the blobs detected.
+        """
 
         # Mask binary
         mask_binary = cv.resize(mask_dilate, (400, 400))
         mask_binary = cv.cvtColor(mask_binary, cv.COLOR_GRAY2RGB)
 
-        Utility.set_text(mask_binary, str(len(contours)), (320, 380), color=Color.RED, thickness=3)
+        Utility.set_text(mask_binary, str(num_contours), (320, 380), color=Color.RED, thickness=3)
+
+        # Optical flow rendered in HSV
+        if self.mask_hsv is None or self.mask_hsv.shape[:2] != self.hue.shape:
+            self.mask_hsv = np.full((self.hue.shape[0], self.hue.shape[1], 3), 255, np.uint8)
 
-        mask = cv.resize(self.mask_hsv, (400, 400))
+        self.mask_hsv[..., 0] = self.hue
+        self.mask_hsv[..., 2] = self.value
+        mask_rgb = cv.cvtColor(self.mask_hsv, cv.COLOR_HSV2BGR)
+        mask_rgb = cv.addWeighted(mask_rgb, 2, mask_rgb, 0, 0)
+
+        mask = cv.resize(mask_rgb, (400, 400))
         stack = Utility.stack_images(1, ([mask_binary, mask]))
         cv.imshow("Masks", stack)
         cv.waitKey(1)
 
-        return contours
+    def get_direction(self, coordinates):
+        """
+        Get the direction of the vehicle.
+
+        :param coordinates: coordinates of the vehicle (coordinates of the img).
+        """
+
+        return self.region_statistics.get_direction(coordinates)
+
+    def get_zone(self, coordinates):
+        """
+        Get the zone (polygon) of the vehicle.
+
+        :param coordinates: coordinates of the vehicle.
+        """
+
+        if self.zones_map is None:
+            return UNKNOWN
+
+        zone = Utility.get_zone(self.zones_map, self.zones, coordinates)
+        return UNKNOWN if zone is None else zone
+
+    def get_intensity(self, coordinates):
+        """
+        Get the average intensity (hue) of the vehicle.
+
+        :param coordinates: coordinates of the vehicle (coordinates of the img).
+        """
+
+        return self.region_statistics.get_intensity(coordinates)
 
     def create_new_vehicle(self, coordinates):
         """
@@ -278,35 +469,34 @@ class Motion:
 
         name = f"Vehicle {self.counter_vehicle + 1}"
         if self.show_log:
-            log(0, f"Added the new {name} with coordinates {coordinates}")
+            log(0, "Added the new %s with coordinates %s", name, coordinates)
 
         # Update vehicles list
-        direction = Utility.get_direction(coordinates, self.angle, self.magnitude)
+        direction = self.get_direction(coordinates)
         coordinates = Utility.get_coordinates_bb(points=coordinates)
-        intensity = Utility.get_intensity(self.mask_hsv, coordinates)
+        intensity = self.get_intensity(coordinates)
 
         color, self.color_list = Utility.get_random_color(self.color_list)
-        vehicle = Vehicle(name, coordinates, intensity, color, self.num_iterations_stationary, direction)
+        vehicle = self.tracks.create(self.counter_vehicle + 1, name, coordinates, intensity, color,
+                                     self.num_iterations_stationary, direction)
+        vehicle.set_zone(self.get_zone(coordinates))
 
-        self.current_vehicles.append(vehicle)
-        self.vehicles_to_draw = Utility.check_vehicle_in_list(self.vehicles_to_draw, vehicle)
+        self.tracks.insert(CURRENT, vehicle)
+        self.tracks.insert(DRAWN, vehicle, move_to_end=True)
         self.counter_vehicle += 1
 
-    def tracking(self, coordinates, img, max_distance=30):
+    def tracking(self, coordinates, img, vehicle, min_distance):
         """
-        Tracking vehicles based on the minimum distance between all bounding boxes.
+        Tracking vehicles based on the association with the bounding boxes of the previous frame.
 
         :param coordinates: coordinates of the next bounding box (vehicle).
         :param img: img to draw in.
-        :param max_distance: maximum distance in pixel allowed.
+        :param vehicle: vehicle associated to the bounding box, None if not associated.
+        :param min_distance: distance between the vehicle and the bounding box.
 
         :return vehicle: if different from None, return vehicle object.
         """
 
-        min_distance, vehicle = self.get_distance(coordinates,
-                                                  self.prev_vehicles + self.vehicles_stationary,
-                                                  max_distance=max_distance)
-
         if vehicle is not None:
 
             if Utility.check_exit_to_the_scene(img, vehicle.coordinates):
@@ -314,45 +504,48 @@ class Motion:
                 Checks if the vehicles no longer present (out of the scene).
                 """
                 if self.show_log:
-                    log(0, f"Remove {vehicle.name} (not displayed)")
+                    log(0, "Remove %s (not displayed)", vehicle.name)
 
-                self.deleted_vehicles, _ = Utility.delete_all_items_in_list(self.deleted_vehicles, vehicle.name)
-                self.prev_vehicles, _ = Utility.delete_all_items_in_list(self.prev_vehicles, vehicle.name)
-                self.vehicles_stationary, ret = Utility.delete_item_in_list(self.vehicles_stationary, vehicle.name)
-                self.table.delete_row(vehicle.name)
+                self.tracks.remove(LOST, vehicle)
+                self.tracks.remove(PREVIOUS, vehicle)
+                self.tracks.remove(STATIONARY, vehicle)
+                self.table.delete_row(vehicle.id)
 
-            elif min_distance < self.dist_for_stationary:
+            elif min_distance < self.dist_for_stationary * self.dt:
                 """
                 Detects if there are stationary vehicles.
                 """
 
                 self.add_vehicles_stationary(vehicle, min_distance, coordinates)
 
-            elif min_distance < max_distance:
+            else:
                 """
-                Adds new vehicles present based on the previous frame.
+                Adds new vehicles present based on the previous frame
+                (the distance is already gated by the association).
                 """
 
                 if self.show_log:
-                    log(0, f"Update {vehicle.name} with min_distance {min_distance} with {coordinates}")
+                    log(0, "Update %s with min_distance %s with %s", vehicle.name, min_distance, coordinates)
 
                 vehicle = self.update_parameters_vehicle(vehicle, coordinates, min_distance)
 
-                self.current_vehicles.append(vehicle)
-                self.prev_vehicles, _ = Utility.delete_item_in_list(self.prev_vehicles, vehicle.name)
-                self.vehicles_to_draw = Utility.check_vehicle_in_list(self.vehicles_to_draw, vehicle)
+                self.tracks.insert(CURRENT, vehicle)
+                self.tracks.remove(PREVIOUS, vehicle)
+                self.tracks.insert(DRAWN, vehicle, move_to_end=True)
 
         return vehicle
 
-    def add_new_vehicles(self, coordinates):
+    def add_new_vehicles(self, coordinates, result, min_distance):
         """
         Adds new vehicles when not present at the previous frame.
 
         :param coordinates:  coordinates of the next bounding box (vehicle).
+        :param result: vehicle of the history associated to the bounding box, None if not associated.
+        :param min_distance: distance between the vehicle of the history and the bounding box.
 
         :return vehicle: vehicle to be drawn.
         """
-        ret = self.check_repaint_vehicles(coordinates)
+        ret = self.check_repaint_vehicles(coordinates, result, min_distance)
 
         if not ret:
             # New vehicle added to the scene
@@ -367,55 +560,35 @@ class Motion:
         :param coordinates: coordinates of the vehicle.
         """
 
-        # Temporary list to modify it a run time.
-        tmp_vehicles_stationary = self.vehicles_stationary.copy()
-
-        for index, stat_vehicle in enumerate(self.vehicles_stationary):
+        if self.tracks.contains(STATIONARY, vehicle):
+            # The vehicle is in the list of stationary vehicles.
+            num_stat = vehicle.num_frame_to_remove_vehicle - 1
 
-            if stat_vehicle.name == vehicle.name:
-                # Search for vehicles in the list of stationary vehicles.
-                num_stat = stat_vehicle.num_frame_to_remove_vehicle - 1
+            if num_stat != 0:
+                # The vehicle is still shown
+                vehicle.decrease_iterations_stationary()
 
-                if num_stat != 0:
-                    # The vehicle is still shown
-                    stat_vehicle.decrease_iterations_stationary()
-
-                    stat_vehicle = self.update_parameters_vehicle(stat_vehicle, coordinates, min_distance)
-
-                    self.current_vehicles.append(stat_vehicle)
-                    self.prev_vehicles, _ = Utility.delete_item_in_list(self.prev_vehicles, stat_vehicle.name)
-
-                elif num_stat == 0:
-                    # Deletes vehicle in the list of stationary vehicles. No tracking.
-                    stat_vehicle.unmarked_as_stationary(self.num_iterations_stationary)
-                    self.table.delete_row(stat_vehicle.name)
-
-                    self.deleted_vehicles, _ = Utility.delete_all_items_in_list(self.deleted_vehicles,
-                                                                                stat_vehicle.name)
-                    self.prev_vehicles, _ = Utility.delete_all_items_in_list(self.prev_vehicles, stat_vehicle.name)
-
-                    del tmp_vehicles_stationary[index]
-                break
-
-            if index + 1 == len(self.vehicles_stationary):
-                # Vehicle wasn't on vehicles_stationary list.
                 vehicle = self.update_parameters_vehicle(vehicle, coordinates, min_distance)
 
-                tmp_vehicles_stationary.append(vehicle)
-                self.current_vehicles.append(vehicle)
-                self.prev_vehicles, _ = Utility.delete_item_in_list(self.prev_vehicles, vehicle.name)
+                self.tracks.insert(CURRENT, vehicle)
+                self.tracks.remove(PREVIOUS, vehicle)
 
-        # Updates stationary list.
-        self.vehicles_stationary = tmp_vehicles_stationary.copy()
+            else:
+                # Deletes vehicle in the list of stationary vehicles. No tracking.
+                vehicle.unmarked_as_stationary(self.num_iterations_stationary)
+                self.table.delete_row(vehicle.id)
 
-        if len(self.vehicles_stationary) == 0:
-            # The list of the stationary vehicles is empty.
+                self.tracks.remove(LOST, vehicle)
+                self.tracks.remove(PREVIOUS, vehicle)
+                self.tracks.remove(STATIONARY, vehicle)
 
+        else:
+            # Vehicle wasn't on vehicles stationary list.
             vehicle = self.update_parameters_vehicle(vehicle, coordinates, min_distance)
 
-            self.vehicles_stationary.append(vehicle)
-            self.current_vehicles.append(vehicle)
-            self.prev_vehicles, _ = Utility.delete_item_in_list(self.prev_vehicles, vehicle.name)
+            self.tracks.insert(STATIONARY, vehicle)
+            self.tracks.insert(CURRENT, vehicle)
+            self.tracks.remove(PREVIOUS, vehicle)
 
     def update_parameters_vehicle(self, vehicle, coordinates, min_distance):
         """
@@ -430,57 +603,54 @@ class Motion:
 
         # Update coordinates
         vehicle.set_coordinates(Utility.get_coordinates_bb(points=coordinates))
+        vehicle.set_zone(self.get_zone(vehicle.coordinates))
 
         # Update direction
-        direction = Utility.get_direction(coordinates, self.angle, self.magnitude)
+        direction = self.get_direction(coordinates)
         vehicle.set_direction(direction)
-        self.table.update_table(vehicle.name, COLUMN_DIRECTION, vehicle.get_direction())
+        self.table.update_table(vehicle.id, COLUMN_DIRECTION, vehicle.get_direction())
 
         # Update intensity
-        intensity = Utility.get_intensity(self.mask_hsv, coordinates)
+        intensity = self.get_intensity(coordinates)
         vehicle.set_intensity(intensity)
 
         # Update velocity
         velocity = Utility.get_velocity(distance=min_distance, fps=self.fps)
         vehicle.set_velocity(velocity)
-        self.table.update_table(vehicle.name, COLUMN_VELOCITY, f"{vehicle.velocity} km/h")
+        self.table.update_table(vehicle.id, COLUMN_VELOCITY, f"{vehicle.velocity} km/h")
 
-        if min_distance < self.dist_for_stationary:
+        if min_distance < self.dist_for_stationary * self.dt:
             vehicle.marked_as_stationary()
         else:
             vehicle.unmarked_as_stationary(self.num_iterations_stationary)
 
             # Remove the vehicle if it was previously stationary
-            self.vehicles_stationary, _ = Utility.delete_item_in_list(self.vehicles_stationary, vehicle.name)
+            self.tracks.remove(STATIONARY, vehicle)
 
-        self.table.update_table(vehicle.name, COLUMN_STATIONARY, vehicle.is_stationary)
+        self.table.update_table(vehicle.id, COLUMN_STATIONARY, vehicle.is_stationary)
 
         return vehicle
 
-    def check_repaint_vehicles(self, coordinates):
+    def check_repaint_vehicles(self, coordinates, result, min_distance, max_distance=MAX_DISTANCE_HISTORY):
         """
         Check if there are vehicles to be redesigned.
 
         :param coordinates: coordinates of the last position of the vehicle.
+        :param result: vehicle of the history associated to the coordinates, None if not associated.
+        :param min_distance: distance between the vehicle of the history and the coordinates.
+        :param max_distance: maximum distance in pixel allowed (in one frame of the video).
 
         :return bool, true if the vehicle need to be redesigned, false otherwise.
         """
         repaint_vehicle = False
-        max_distance = 50
-        min_distance, result = self.get_distance(coordinates, self.deleted_vehicles, max_distance=max_distance)
 
-        if min_distance < max_distance and result is not None:
+        if min_distance < max_distance * self.dt and result is not None:
 
             # Check if the vehicle is already to be drawn
-            for vehicle_to_draw in self.vehicles_to_draw:
-                if result.name == vehicle_to_draw.name:
-                    repaint_vehicle = True
-                    break
-
-            if not repaint_vehicle:
+            if not self.tracks.contains(DRAWN, result):
                 repaint_vehicle = True
 
-                if min_distance < self.dist_for_stationary:
+                if min_distance < self.dist_for_stationary * self.dt:
                     # Stationary vehicle
                     self.add_vehicles_stationary(result, min_distance, coordinates)
 
@@ -489,11 +659,9 @@ class Motion:
                     result = self.update_parameters_vehicle(result, coordinates, min_distance)
 
                     # Update lists
-                    self.current_vehicles.append(result)
-                    self.prev_vehicles, _ = Utility.delete_item_in_list(self.prev_vehicles, result.name)
-                    self.vehicles_to_draw = Utility.check_vehicle_in_list(self.vehicles_to_draw, result)
-            else:
-                repaint_vehicle = False
+                    self.tracks.insert(CURRENT, result)
+                    self.tracks.remove(PREVIOUS, result)
+                    self.tracks.insert(DRAWN, result, move_to_end=True)
 
         return repaint_vehicle
 
@@ -506,12 +674,12 @@ class Motion:
         :return vehicle object with coordinates updated.
         """
         centroid = Utility.get_centroid(coordinates)
-        intensity_to_compare = Utility.get_intensity(self.mask_hsv, coordinates)
+        intensity_to_compare = self.get_intensity(coordinates)
 
         result = None
         intensity_range = 150
 
-        for vehicle in self.current_vehicles:
+        for vehicle in self.tracks.get_vehicles(CURRENT):
 
             distance = Utility.get_length(vehicle.centroid, centroid)
             if distance <= 30:
@@ -531,7 +699,9 @@ class Motion:
                     vehicle.set_coordinates(
                         Utility.get_coordinates_bb(points=((x_start_2, y_start_2), (x_end_1, y_end_1))))
 
-                self.vehicles_to_draw = Utility.check_vehicle_in_list(self.vehicles_to_draw, vehicle)
+                vehicle.set_zone(self.get_zone(vehicle.coordinates))
+
+                self.tracks.insert(DRAWN, vehicle, move_to_end=True)
                 result = vehicle
                 break
 
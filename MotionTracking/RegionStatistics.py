@@ -0,0 +1,153 @@
+import cv2 as cv
+import numpy as np
+
+from MotionTracking.Utility import UP, DOWN, LEFT, RIGHT, STATIONARY
+from MotionTracking import Utility as Utility
+
+# Directions of the bins of the histograms
+DIRECTIONS = [DOWN, LEFT, UP, RIGHT]
+
+
+def get_direction_lut():
+    r"""
+    Get the bin of the direction for each hue (angle / 2) of the optical flow.
+
+    Angle (degrees):
+    - (340, 360] and [0, 70]: down.
+    - (70, 180]: left.
+    - (180, 250]: up.
+    - (250, 340]: right.
+
+    :return: look-up table (256 elements) with the bin (starting from 1).
+    """
+
+    angle = (np.arange(256) % 180) * 2
+
+    lut = np.full(256, 1, np.uint8)
+    lut[(70 <= angle) & (angle < 180)] = 2
+    lut[(180 <= angle) & (angle < 250)] = 3
+    lut[(250 <= angle) & (angle < 340)] = 4
+
+    return lut
+
+
+class RegionStatistics:
+    r"""
+    Statistics of the regions (bounding boxes) of the optical flow.
+    The summed-area table of the hue and the integral histograms of the directions of the moving pixels
+    are built once per frame, so the statistics of any region are calculated in O(1).
+    The results are memoized for each region until the next frame.
+    """
+
+    def __init__(self, threshold=10.0):
+        """
+        Constructor of class.
+
+        :param threshold: minimum magnitude (degrees) of a moving pixel.
+        """
+
+        self.threshold = np.radians(threshold)
+        self.direction_lut = get_direction_lut()
+
+        # Offset (x, y) of the optical flow into the image
+        self.offset = (0, 0)
+
+        # Buffers
+        self.moving = None
+        self.bins = None
+        self.bin = None
+
+        # Summed-area table of the hue and integral histograms of the directions
+        self.hue_sum = None
+        self.histograms = None
+
+        # Results of the current frame
+        self.intensities = {}
+        self.directions = {}
+
+    def update(self, hue, magnitude, offset=(0, 0)):
+        """
+        Builds the tables of the new frame.
+
+        :param hue: hue of the optical flow (angle / 2, uint8).
+        :param magnitude: magnitude of the optical flow.
+        :param offset: offset (x, y) of the optical flow into the image.
+        """
+
+        height, width = hue.shape
+
+        if self.moving is None or self.moving.shape != hue.shape:
+            self.moving = np.empty((height, width), np.uint8)
+            self.bins = np.empty((height, width), np.uint8)
+            self.bin = np.empty((height, width), np.uint8)
+            self.hue_sum = np.empty((height + 1, width + 1), np.int32)
+            self.histograms = np.empty((len(DIRECTIONS), height + 1, width + 1), np.int32)
+
+        self.offset = offset
+        self.intensities.clear()
+        self.directions.clear()
+
+        cv.integral(hue, self.hue_sum, sdepth=cv.CV_32S)
+
+        # Bins of the directions of the moving pixels (0 if the pixel doesn't move)
+        cv.compare(magnitude, self.threshold, cv.CMP_GT, self.moving)
+        cv.LUT(hue, self.direction_lut, self.bins)
+        cv.bitwise_and(self.bins, self.moving, self.bins)
+
+        for index in range(len(DIRECTIONS)):
+            cv.compare(self.bins, index + 1, cv.CMP_EQ, self.bin)
+            cv.integral(self.bin, self.histograms[index], sdepth=cv.CV_32S)
+
+    def get_region(self, coordinates):
+        """
+        Get the region of the bounding box into the tables.
+
+        :param coordinates: coordinates of the bounding box (coordinates of the image).
+        """
+
+        (x_start, y_start), (x_end, y_end) = Utility.translate_coordinates(coordinates, self.offset)
+        height, width = self.moving.shape
+
+        return min(x_start, width), min(y_start, height), min(x_end, width), min(y_end, height)
+
+    def get_intensity(self, coordinates):
+        """
+        Gets the average hue of the bounding box.
+
+        :param coordinates: coordinates of the bounding box (coordinates of the image).
+        """
+
+        region = self.get_region(coordinates)
+
+        if region not in self.intensities:
+            x_start, y_start, x_end, y_end = region
+            area = (x_end - x_start) * (y_end - y_start)
+
+            if area > 0:
+                total = self.hue_sum[y_end, x_end] - self.hue_sum[y_start, x_end] - \
+                        self.hue_sum[y_end, x_start] + self.hue_sum[y_start, x_start]
+                self.intensities[region] = round(total / area)
+            else:
+                self.intensities[region] = 0
+
+        return self.intensities[region]
+
+    def get_direction(self, coordinates):
+        """
+        Gets the dominant direction of the moving pixels of the bounding box.
+
+        :param coordinates: coordinates of the bounding box (coordinates of the image).
+        """
+
+        region = self.get_region(coordinates)
+
+        if region not in self.directions:
+            x_start, y_start, x_end, y_end = region
+            histograms = self.histograms
+
+            counts = histograms[:, y_end, x_end] - histograms[:, y_start, x_end] - \
+                histograms[:, y_end, x_start] + histograms[:, y_start, x_start]
+
+            self.directions[region] = DIRECTIONS[counts.argmax()] if counts.any() else STATIONARY
+
+        return self.directions[region]
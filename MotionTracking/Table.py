@@ -1,5 +1,8 @@
+import time
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex
 from PyQt5.QtGui import QColor
-from PyQt5.QtWidgets import QWidget, QTableWidget, QTableWidgetItem, QVBoxLayout
+from PyQt5.QtWidgets import QWidget, QTableView, QVBoxLayout, QAbstractItemView
 from PyQt5.Qt import Qt
 
 from MotionTracking.Utility import log
@@ -10,6 +13,8 @@ COLUMN_COLOR = "Color"
 COLUMN_STATIONARY = "Stationary"
 COLUMN_DIRECTION = "Direction"
 
+COLUMNS = [COLUMN_VEHICLE, COLUMN_VELOCITY, COLUMN_STATIONARY, COLUMN_DIRECTION, COLUMN_COLOR]
+
 
 def get_column_index(name_column):
     """
@@ -35,12 +40,177 @@ def get_column_index(name_column):
     return index
 
 
+def get_row(vehicle):
+    """
+    Get the values of the columns of the row of the vehicle.
+
+    :param vehicle: vehicle.
+    """
+
+    return [vehicle.name, f"{round(vehicle.velocity, 3)} km/h", str(vehicle.is_stationary), vehicle.get_direction(),
+            vehicle.color]
+
+
+class VehicleTableModel(QAbstractTableModel):
+    """
+    Model of the table of the vehicles.
+    The changes are applied to the pending rows (row found by the id of the vehicle in O(1)) and they are
+    published to the view only by publish(), with a single dataChanged (or a reset if rows were added or deleted).
+    """
+
+    def __init__(self):
+        super().__init__()
+
+        # Rows showed by the view
+        self.rows = []
+
+        # Rows updated during the frame, id of the vehicle of each row and row of each vehicle
+        self.pending_rows = []
+        self.ids = []
+        self.rows_by_id = {}
+
+        # Changes not published: rows updated and flag of rows added or deleted
+        self.dirty_rows = set()
+        self.structure_changed = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return COLUMNS[section]
+
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        value = self.rows[index.row()][index.column()]
+
+        if index.column() == get_column_index(COLUMN_COLOR):
+            if role == Qt.BackgroundRole:
+                return QColor.fromRgb(value[2], value[1], value[0])
+
+        elif role == Qt.DisplayRole:
+            return value
+
+        elif role == Qt.TextAlignmentRole:
+            return Qt.AlignHCenter
+
+        return None
+
+    def contains(self, vehicle_id):
+        """
+        Check if the vehicle is in the table.
+
+        :param vehicle_id: id of the vehicle.
+        """
+
+        return vehicle_id in self.rows_by_id
+
+    def add_row(self, vehicle_id, row):
+        """
+        Adds a row at the end of the table.
+
+        :param vehicle_id: id of the vehicle.
+        :param row: values of the columns.
+        """
+
+        self.rows_by_id[vehicle_id] = len(self.pending_rows)
+        self.pending_rows.append(row)
+        self.ids.append(vehicle_id)
+        self.structure_changed = True
+
+    def delete_row(self, vehicle_id):
+        """
+        Deletes the row of the vehicle, the last row is moved in its place.
+
+        :param vehicle_id: id of the vehicle.
+
+        :return: bool, true if the row has been deleted.
+        """
+
+        row = self.rows_by_id.pop(vehicle_id, None)
+        if row is None:
+            return False
+
+        last_row = self.pending_rows.pop()
+        last_id = self.ids.pop()
+
+        if row < len(self.pending_rows):
+            self.pending_rows[row] = last_row
+            self.ids[row] = last_id
+            self.rows_by_id[last_id] = row
+
+        self.structure_changed = True
+        return True
+
+    def set_value(self, vehicle_id, column, value):
+        """
+        Update a cell of the row of the vehicle.
+
+        :param vehicle_id: id of the vehicle.
+        :param column: index of the column.
+        :param value: new value.
+
+        :return: bool, true if the vehicle is in the table.
+        """
+
+        row = self.rows_by_id.get(vehicle_id)
+        if row is None:
+            return False
+
+        if self.pending_rows[row][column] != value:
+            self.pending_rows[row][column] = value
+            self.dirty_rows.add(row)
+
+        return True
+
+    def find(self, column, value):
+        """
+        Search a value into a column.
+
+        :param column: index of the column.
+        :param value: value to search.
+
+        :return: bool, true if the value is present.
+        """
+
+        return any(row[column] == value for row in self.pending_rows)
+
+    def publish(self):
+        """
+        Publishes the changes to the view.
+        """
+
+        if self.structure_changed:
+            self.beginResetModel()
+            self.rows = [row.copy() for row in self.pending_rows]
+            self.endResetModel()
+
+        elif self.dirty_rows:
+            for row in self.dirty_rows:
+                self.rows[row] = self.pending_rows[row].copy()
+
+            top_left = self.index(min(self.dirty_rows), 0)
+            bottom_right = self.index(max(self.dirty_rows), len(COLUMNS) - 1)
+            self.dataChanged.emit(top_left, bottom_right)
+
+        self.dirty_rows.clear()
+        self.structure_changed = False
+
+
 class Table(QWidget):
     """
     Qt Table class.
+    The changes of a frame are published at the end of the frame by flush(), at most refresh_rate times per second.
     """
 
-    def __init__(self, show_log):
+    def __init__(self, show_log, refresh_rate=5):
         super().__init__()
         self.title = 'Vehicle list'
         self.left = 0
@@ -49,10 +219,15 @@ class Table(QWidget):
         self.height = 300
 
         self.layout = QVBoxLayout()
-        self.table = QTableWidget()
+        self.model = VehicleTableModel()
+        self.table = QTableView()
 
         self.show_log = show_log
 
+        # Minimum time (seconds) between two refreshes of the view
+        self.refresh_interval = 1 / refresh_rate if refresh_rate > 0 else 0
+        self.last_refresh = 0
+
         self.init_ui()
 
     def init_ui(self):
@@ -62,10 +237,8 @@ class Table(QWidget):
         self.layout.addWidget(self.table)
         self.setLayout(self.layout)
 
-        self.table.setColumnCount(5)
-        self.table.setHorizontalHeaderLabels(
-            [COLUMN_VEHICLE, COLUMN_VELOCITY, COLUMN_STATIONARY, COLUMN_DIRECTION, COLUMN_COLOR])
-        self.table.setEditTriggers(QTableWidget.NoEditTriggers)  # Table in read-only
+        self.table.setModel(self.model)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)  # Table in read-only
 
         self.show()
 
@@ -88,66 +261,23 @@ class Table(QWidget):
         """
 
         for item in rows:
-            if not self.check_cell(COLUMN_VEHICLE, item.name):
+            if not self.model.contains(item.id):
                 color = item.color
-                color_qt = QColor.fromRgb(color[2], color[1], color[0])
 
                 if self.show_log:
-                    log(2, f"Add row: {item.name}, {item.velocity}, {color}")
-
-                current_row = self.table.rowCount()
-                item_color = QTableWidgetItem()
-                item_color.setBackground(color_qt)
-
-                item_name = QTableWidgetItem(item.name)
-                item_name.setTextAlignment(Qt.AlignHCenter)
-
-                item_velocity = QTableWidgetItem(f"{round(item.velocity, 3)} km/h")
-                item_velocity.setTextAlignment(Qt.AlignHCenter)
-
-                item_stat = QTableWidgetItem(str(item.is_stationary))
-                item_stat.setTextAlignment(Qt.AlignHCenter)
+                    log(2, "Add row: %s, %s, %s", item.name, item.velocity, color)
 
-                item_direction = QTableWidgetItem(item.get_direction())
-                item_direction.setTextAlignment(Qt.AlignHCenter)
+                self.model.add_row(item.id, get_row(item))
 
-                self.table.insertRow(current_row)
-                self.table.setItem(current_row, 0, item_name)
-                self.table.setItem(current_row, 1, QTableWidgetItem(item_velocity))
-                self.table.setItem(current_row, 2, QTableWidgetItem(item_stat))
-                self.table.setItem(current_row, 3, QTableWidgetItem(item_direction))
-                self.table.setItem(current_row, 4, item_color)
-
-                self.table.update()
-
-    def delete_row(self, name_vehicle):
+    def delete_row(self, vehicle_id):
         r"""
         Delete row in the table.
 
-        :param name_vehicle: name of the vehicle to be deleted.
+        :param vehicle_id: id of the vehicle to be deleted.
         """
 
-        if self.show_log:
-            log(2, f"Delete row of {name_vehicle}")
-
-        columns = self.table.columnCount()
-        rows = self.table.rowCount()
-
-        for column in range(columns):
-            column_text = self.table.horizontalHeaderItem(column).text()
-
-            if column_text == COLUMN_VEHICLE:
-
-                for row in range(rows):
-                    try:
-                        cell = self.table.item(row, column).text()
-
-                        if cell == name_vehicle:
-                            self.table.removeRow(row)
-                            self.update()
-                            break
-                    except Exception as e:
-                        log(1, f"Error in DELETE ROW TABLE: {e}")
+        if self.model.delete_row(vehicle_id) and self.show_log:
+            log(2, "Delete row of vehicle %s", vehicle_id)
 
     def check_cell(self, name_column, name_cell):
         r"""
@@ -159,57 +289,56 @@ class Table(QWidget):
         :return: bool, true if text is present, false otherwise.
         """
 
-        columns = self.table.columnCount()
-        rows = self.table.rowCount()
+        return self.model.find(get_column_index(name_column), name_cell)
 
-        is_present = False
+    def update_table(self, vehicle_id, name_column, data):
+        r"""
+        Update information of the vehicles into table.
 
-        for column in range(columns):
-            column_text = self.table.horizontalHeaderItem(column).text()
+        :param vehicle_id: id of the vehicle.
+        :param name_column: column to be updated.
+        :param data: data to be updated.
+        """
 
-            if column_text == name_column:
+        if self.model.set_value(vehicle_id, get_column_index(name_column), str(data)) and self.show_log:
+            log(2, "Update %s [%s] of row: vehicle %s", name_column, data, vehicle_id)
 
-                for row in range(rows):
-                    try:
-                        cell = self.table.item(row, column).text()
+    def flush(self, force=False):
+        r"""
+        Publishes the changes of the frame to the view, if the last refresh is older than the refresh interval.
 
-                        if cell == name_cell:
-                            is_present = True
-                            break
-                    except Exception as e:
-                        log(1, f"Error in CHECK CELL: {e}")
+        :param force: bool, if true the changes are published anyway.
+        """
 
-        return is_present
+        now = time.perf_counter()
 
-    def update_table(self, name_vehicle, name_column, data):
-        r"""
-        Update information of the vehicles into table.
+        if force or now - self.last_refresh >= self.refresh_interval:
+            self.model.publish()
+            self.last_refresh = now
 
-        :param name_vehicle: vehicle name.
-        :param name_column: column to be updated.
-        :param data: data to be updated.
-        """
 
-        columns = self.table.columnCount()
-        rows = self.table.rowCount()
+class NullTable:
+    """
+    Table without window, used when no display is attached (headless mode).
+    """
 
-        for column in range(columns):
-            column_text = self.table.horizontalHeaderItem(column).text()
+    def show(self):
+        pass
 
-            if column_text == COLUMN_VEHICLE:
+    def close(self):
+        pass
 
-                for row in range(rows):
-                    cell = self.table.item(row, column).text()
+    def add_rows(self, rows):
+        pass
 
-                    if cell == name_vehicle:
-                        index = get_column_index(name_column)
+    def delete_row(self, vehicle_id):
+        pass
 
-                        item_cell = QTableWidgetItem(str(data))
-                        item_cell.setTextAlignment(Qt.AlignHCenter)
+    def check_cell(self, name_column, name_cell):
+        return False
 
-                        if self.show_log:
-                            log(2, f"Update {name_column} [{data}] of row: {name_vehicle}")
+    def update_table(self, vehicle_id, name_column, data):
+        pass
 
-                        self.table.setItem(row, index, item_cell)
-                        break
-        self.update()
+    def flush(self, force=False):
+        pass
@@ -0,0 +1,284 @@
+import multiprocessing
+import queue
+import sys
+import time
+
+from MotionTracking.Table import get_column_index, get_row
+from MotionTracking.Utility import log
+
+# Interval (milliseconds) of the polling of the queue into the viewer
+POLL_INTERVAL = 50
+
+
+def run_viewer(updates, refresh_rate):
+    r"""
+    Entry point of the viewer process: shows the table of the vehicles and applies the diffs received.
+    A diff is a tuple (snapshot, added, updated, removed), None closes the viewer.
+
+    :param updates: queue of the diffs.
+    :param refresh_rate: maximum number of refreshes per second of the table.
+    """
+
+    from PyQt5.QtCore import QTimer
+    from PyQt5.QtWidgets import QApplication
+
+    from MotionTracking.Table import Table
+
+    app = QApplication(sys.argv)
+    table = Table(show_log=False, refresh_rate=refresh_rate)
+
+    def poll():
+        while True:
+            try:
+                diff = updates.get_nowait()
+            except queue.Empty:
+                break
+
+            if diff is None:
+                app.quit()
+                return
+
+            snapshot, added, updated, removed = diff
+            model = table.model
+
+            if snapshot:
+                for vehicle_id in list(model.rows_by_id):
+                    model.delete_row(vehicle_id)
+
+            for vehicle_id, row in added:
+                model.add_row(vehicle_id, row)
+
+            for vehicle_id, column, value in updated:
+                model.set_value(vehicle_id, column, value)
+
+            for vehicle_id in removed:
+                model.delete_row(vehicle_id)
+
+        table.flush()
+
+    timer = QTimer()
+    timer.timeout.connect(poll)
+    timer.start(POLL_INTERVAL)
+
+    app.exec_()
+
+
+class TableProxy:
+    r"""
+    Table of the vehicles shown by a separate viewer process.
+    The changes of a frame are collected as a diff (rows added, cells updated, rows removed) and sent to the viewer
+    without blocking: if the queue is full the diff is dropped and a snapshot is sent at the next flush.
+    The viewer can be attached and detached at any time, the proxy keeps a copy of the rows to send a snapshot.
+    """
+
+    def __init__(self, show_log, refresh_rate=5, send_rate=10, queue_size=64):
+        """
+        Constructor of class.
+
+        :param show_log: bool, if true the logs are showed.
+        :param refresh_rate: maximum number of refreshes per second of the table (viewer).
+        :param send_rate: maximum number of diffs sent per second.
+        :param queue_size: maximum number of diffs into the queue.
+        """
+
+        self.show_log = show_log
+        self.refresh_rate = refresh_rate
+        self.queue_size = queue_size
+
+        # The viewer is a new interpreter (no copy of the state of OpenCV and Qt)
+        self.context = multiprocessing.get_context("spawn")
+        self.process = None
+        self.updates = None
+
+        # Rows of the table and changes not yet sent
+        self.rows = {}
+        self.added = {}
+        self.updated = {}
+        self.removed = set()
+        self.snapshot = False
+
+        self.send_interval = 1 / send_rate if send_rate > 0 else 0
+        self.last_send = 0
+
+    def is_attached(self):
+        """
+        Check if the viewer is running.
+        """
+
+        return self.process is not None and self.process.is_alive()
+
+    def attach(self):
+        """
+        Starts the viewer and sends the rows of the table.
+        """
+
+        if self.is_attached():
+            return
+
+        self.updates = self.context.Queue(self.queue_size)
+        self.process = self.context.Process(target=run_viewer, args=(self.updates, self.refresh_rate), daemon=True)
+        self.process.start()
+
+        self.snapshot = True
+        self.flush(force=True)
+
+        if self.show_log:
+            log(2, "Table viewer attached")
+
+    def detach(self, timeout=1):
+        """
+        Closes the viewer.
+
+        :param timeout: maximum time (seconds) to wait the viewer.
+        """
+
+        if self.process is None:
+            return
+
+        try:
+            self.updates.put_nowait(None)
+        except (queue.Full, ValueError, OSError):
+            pass
+
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+
+        self.updates.cancel_join_thread()
+        self.updates.close()
+        self.process = None
+        self.updates = None
+
+        if self.show_log:
+            log(2, "Table viewer detached")
+
+    def toggle(self):
+        """
+        Attaches the viewer if it isn't running, detaches it otherwise.
+        """
+
+        if self.is_attached():
+            self.detach()
+        else:
+            self.attach()
+
+    def show(self):
+        self.attach()
+
+    def close(self):
+        self.detach()
+
+    def add_rows(self, rows):
+        r"""
+        Added rows in the table.
+
+        :param rows: rows to add.
+        """
+
+        for item in rows:
+            if item.id not in self.rows:
+                row = get_row(item)
+                self.rows[item.id] = row
+                self.added[item.id] = row
+
+                if self.show_log:
+                    log(2, "Add row: %s, %s, %s", item.name, item.velocity, item.color)
+
+    def delete_row(self, vehicle_id):
+        r"""
+        Delete row in the table.
+
+        :param vehicle_id: id of the vehicle to be deleted.
+        """
+
+        if self.rows.pop(vehicle_id, None) is None:
+            return
+
+        self.updated.pop(vehicle_id, None)
+
+        if self.added.pop(vehicle_id, None) is None:
+            self.removed.add(vehicle_id)
+
+        if self.show_log:
+            log(2, "Delete row of vehicle %s", vehicle_id)
+
+    def check_cell(self, name_column, name_cell):
+        r"""
+        Check if name of the cell is present in the table.
+
+        :param name_column: column name.
+        :param name_cell: text to search into cell of the table.
+
+        :return: bool, true if text is present, false otherwise.
+        """
+
+        column = get_column_index(name_column)
+        return any(row[column] == name_cell for row in self.rows.values())
+
+    def update_table(self, vehicle_id, name_column, data):
+        r"""
+        Update information of the vehicles into table.
+
+        :param vehicle_id: id of the vehicle.
+        :param name_column: column to be updated.
+        :param data: data to be updated.
+        """
+
+        row = self.rows.get(vehicle_id)
+        if row is None:
+            return
+
+        column = get_column_index(name_column)
+        value = str(data)
+
+        if row[column] != value:
+            row[column] = value
+
+            if vehicle_id not in self.added:
+                # The rows added are sent with the last values
+                self.updated.setdefault(vehicle_id, {})[column] = value
+
+    def flush(self, force=False):
+        r"""
+        Sends the changes to the viewer, if the last diff sent is older than the send interval.
+        If the viewer has been closed the changes are discarded.
+
+        :param force: bool, if true the changes are sent anyway.
+        """
+
+        if self.process is not None and not self.process.is_alive():
+            # Window closed by the user
+            self.detach()
+
+        if self.process is None:
+            self.added.clear()
+            self.updated.clear()
+            self.removed.clear()
+            return
+
+        if not (self.snapshot or self.added or self.updated or self.removed):
+            return
+
+        now = time.perf_counter()
+        if not force and now - self.last_send < self.send_interval:
+            return
+
+        if self.snapshot:
+            diff = (True, [(vehicle_id, row.copy()) for vehicle_id, row in self.rows.items()], [], [])
+        else:
+            diff = (False, [(vehicle_id, row.copy()) for vehicle_id, row in self.added.items()],
+                    [(vehicle_id, column, value) for vehicle_id, columns in self.updated.items()
+                     for column, value in columns.items()],
+                    list(self.removed))
+
+        try:
+            self.updates.put_nowait(diff)
+            self.snapshot = False
+        except queue.Full:
+            # The viewer is late, it will receive the whole table
+            self.snapshot = True
+
+        self.added.clear()
+        self.updated.clear()
+        self.removed.clear()
+        self.last_send = now
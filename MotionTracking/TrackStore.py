@@ -0,0 +1,303 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from MotionTracking.Vehicle import Vehicle, DIRECTIONS, HISTORY_DIRECTIONS
+
+# States of the vehicles
+PREVIOUS = "Previous"
+CURRENT = "Current"
+STATIONARY = "Stationary"
+LOST = "Lost"
+DRAWN = "Drawn"
+
+STATES = [PREVIOUS, CURRENT, STATIONARY, LOST, DRAWN]
+
+
+class TrackStore:
+    r"""
+    Registry of the vehicles tracked, keyed by id.
+    Each state (previous frame, current frame, stationary, lost, to draw) is an ordered set of ids,
+    so the transitions among the states are O(1) and the insertion order is preserved.
+    A vehicle can be in more states at the same time and it is removed from the registry
+    when it is no longer in any state.
+
+    The state of the vehicles (bounding box, centroid, velocity, intensity, history of the directions,
+    stationary counters) is stored into preallocated arrays (struct of arrays), one slot for each vehicle.
+    The slots of the vehicles removed are reused.
+    """
+
+    def __init__(self, iterations_lost=25, capacity=64):
+        """
+        Constructor of class.
+
+        :param iterations_lost: number of iterations before deleting a lost vehicle.
+        :param capacity: initial number of slots, doubled when all slots are used.
+        """
+
+        self.vehicles = {}
+        self.states = {state: OrderedDict() for state in STATES}
+
+        # Arrays of the state of the vehicles and free slots
+        self.capacity = 0
+        self.free_slots = []
+
+        self.bboxes = np.empty((0, 4), np.int32)
+        self.centroids = np.empty((0, 2), np.int32)
+        self.velocities = np.empty(0, np.float64)
+        self.intensities = np.empty(0, np.int32)
+        self.direction_history = np.empty((0, HISTORY_DIRECTIONS), np.int8)
+        self.direction_index = np.empty(0, np.int8)
+        self.stationary = np.empty(0, np.bool_)
+        self.frames_to_remove = np.empty(0, np.int32)
+        self.iterations = np.empty(0, np.int32)
+
+        # State (x, y, vx, vy) of the Kalman filter and iteration of its last prediction (-1 if not initiated)
+        self.kalman_means = np.empty((0, 4), np.float64)
+        self.kalman_covariances = np.empty((0, 4, 4), np.float64)
+        self.kalman_iterations = np.empty(0, np.int32)
+
+        self.grow(capacity)
+
+        # Lost vehicles to check, keyed by the iteration of the deletion
+        self.iterations_lost = iterations_lost
+        self.expiry = {}
+
+    def __len__(self):
+        return len(self.vehicles)
+
+    def grow(self, capacity):
+        """
+        Enlarges the arrays of the state of the vehicles.
+
+        :param capacity: new number of slots.
+        """
+
+        for name in ("bboxes", "centroids", "velocities", "intensities", "direction_history", "direction_index",
+                     "stationary", "frames_to_remove", "iterations", "kalman_means", "kalman_covariances",
+                     "kalman_iterations"):
+            array = getattr(self, name)
+            new_array = np.zeros((capacity,) + array.shape[1:], array.dtype)
+            new_array[:self.capacity] = array
+            setattr(self, name, new_array)
+
+        # The lowest slots are used first
+        self.free_slots.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    def create(self, vehicle_id, name, coordinates, av_intensity, color, num_iter_stat, direction):
+        """
+        Creates a new vehicle into a free slot.
+        The vehicle must be inserted in a state, otherwise its slot isn't released.
+
+        :param vehicle_id: id of the vehicle.
+        :param name: name of the vehicle.
+        :param coordinates: coordinates of the bounding box.
+        :param av_intensity: average intensity of the vehicle.
+        :param color: color of the vehicle.
+        :param num_iter_stat: number of iterations before deleting the vehicle if stationary.
+        :param direction: direction of the vehicle.
+
+        :return: vehicle.
+        """
+
+        if len(self.free_slots) == 0:
+            self.grow(self.capacity * 2)
+
+        vehicle = Vehicle(self, self.free_slots.pop(), vehicle_id, name, coordinates, av_intensity, color,
+                          num_iter_stat, direction)
+        self.vehicles[vehicle.id] = vehicle
+        self.kalman_iterations[vehicle.slot] = -1
+
+        return vehicle
+
+    def get_slots(self, vehicles):
+        """
+        Get the slots of the vehicles.
+
+        :param vehicles: list of vehicles.
+        """
+
+        return np.fromiter((vehicle.slot for vehicle in vehicles), np.intp, len(vehicles))
+
+    def get_centroids(self, vehicles):
+        """
+        Get the centroids of the vehicles.
+
+        :param vehicles: list of vehicles.
+
+        :return: array (N, 2) of the centroids.
+        """
+
+        return self.centroids[self.get_slots(vehicles)]
+
+    def get_directions(self, vehicles):
+        """
+        Get the directions of the vehicles, the most frequent one into the history of each vehicle.
+        If two directions have the same frequency, the order of priority is up, down, right, left.
+
+        :param vehicles: list of vehicles.
+
+        :return: list of directions.
+        """
+
+        history = self.direction_history[self.get_slots(vehicles)]
+        codes = np.arange(1, len(DIRECTIONS) + 1, dtype=np.int8)
+
+        counts = (history[:, :, None] == codes).sum(axis=1)
+        return [DIRECTIONS[index] for index in counts.argmax(axis=1).tolist()]
+
+    def get(self, vehicle_id):
+        """
+        Get the vehicle by id.
+
+        :param vehicle_id: id of the vehicle.
+        """
+
+        return self.vehicles.get(vehicle_id)
+
+    def get_vehicles(self, state):
+        """
+        Get the vehicles of the state (in order of insertion).
+
+        :param state: state of the vehicles.
+
+        :return: list of vehicles.
+        """
+
+        return list(self.states[state].values())
+
+    def count(self, state):
+        """
+        Get the number of vehicles of the state.
+
+        :param state: state of the vehicles.
+        """
+
+        return len(self.states[state])
+
+    def contains(self, state, vehicle):
+        """
+        Check if the vehicle is in the state.
+
+        :param state: state of the vehicle.
+        :param vehicle: vehicle.
+        """
+
+        return vehicle.id in self.states[state]
+
+    def insert(self, state, vehicle, move_to_end=False):
+        """
+        Inserts the vehicle in the state.
+
+        :param state: state of the vehicle.
+        :param vehicle: vehicle.
+        :param move_to_end: bool, if true the vehicle already in the state is moved to the end.
+        """
+
+        if vehicle.id not in self.vehicles:
+            raise Exception(f"{vehicle.name} not is tracked!")
+
+        vehicles = self.states[state]
+
+        if vehicle.id in vehicles:
+            if move_to_end:
+                vehicles.move_to_end(vehicle.id)
+        else:
+            vehicles[vehicle.id] = vehicle
+
+    def remove(self, state, vehicle):
+        """
+        Removes the vehicle from the state.
+
+        :param state: state of the vehicle.
+        :param vehicle: vehicle.
+
+        :return: bool, true if the vehicle was in the state.
+        """
+
+        if self.states[state].pop(vehicle.id, None) is None:
+            return False
+
+        self.release(vehicle)
+        return True
+
+    def release(self, vehicle):
+        """
+        Removes the vehicle from the registry (and frees its slot) if it isn't in any state.
+
+        :param vehicle: vehicle.
+        """
+
+        for vehicles in self.states.values():
+            if vehicle.id in vehicles:
+                return
+
+        if self.vehicles.pop(vehicle.id, None) is not None:
+            self.free_slots.append(vehicle.slot)
+
+    def clear(self, state):
+        """
+        Removes all vehicles from the state.
+
+        :param state: state of the vehicles.
+        """
+
+        vehicles = self.states[state]
+        self.states[state] = OrderedDict()
+
+        for vehicle in vehicles.values():
+            self.release(vehicle)
+
+    def next_frame(self):
+        """
+        The vehicles of the current frame become the vehicles of the previous frame.
+        """
+
+        previous = self.states[PREVIOUS]
+        self.states[PREVIOUS] = self.states[CURRENT]
+        self.states[CURRENT] = OrderedDict()
+
+        for vehicle in previous.values():
+            self.release(vehicle)
+
+    def mark_as_lost(self, vehicle, iteration):
+        """
+        Marks the vehicle as lost (history of the vehicles).
+
+        :param vehicle: vehicle.
+        :param iteration: current iteration.
+        """
+
+        self.insert(LOST, vehicle)
+        self.expiry.setdefault(iteration + self.iterations_lost, []).append(vehicle.id)
+
+    def delete_lost(self, iteration):
+        """
+        Deletes the lost vehicles not updated in the last iterations.
+        A vehicle is deleted when its iteration is exactly iterations_lost before the current iteration,
+        otherwise (updated in the meantime) it is checked again later.
+
+        :param iteration: current iteration.
+
+        :return: list of vehicles deleted.
+        """
+
+        deleted = []
+
+        for vehicle_id in self.expiry.pop(iteration, []):
+            vehicle = self.states[LOST].get(vehicle_id)
+
+            if vehicle is None:
+                # No longer lost
+                continue
+
+            expiry = vehicle.iteration + self.iterations_lost
+
+            if expiry == iteration:
+                self.remove(LOST, vehicle)
+                deleted.append(vehicle)
+            elif expiry > iteration:
+                self.expiry.setdefault(expiry, []).append(vehicle_id)
+
+        return deleted
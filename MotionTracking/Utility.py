@@ -2,10 +2,10 @@ import math
 
 import cv2 as cv
 import numpy as np
-from colorama import Style, Fore
-from scipy.stats import mode
+from scipy.optimize import linear_sum_assignment
 
 import Common.color as Color
+from Common.logger import get_logger
 from Common.url import CITIES
 
 UP = "Moving up"
@@ -13,14 +13,18 @@ DOWN = "Moving down"
 LEFT = "Moving to the left"
 RIGHT = "Moving to the right"
 STATIONARY = "Stationary"
+UNKNOWN = "Unknown"
 
+KERNEL_MORPHOLOGY = cv.getStructuringElement(cv.MORPH_ELLIPSE, (3, 3))
 
-def log(info, msg):
+
+def log(info, msg, *args):
     r"""
-    Print message based on info.
+    Queue a message based on info, it is formatted (msg % args) and printed by a background thread.
 
     :param info: type of message.
     :param msg: msg to show.
+    :param args: arguments of the message.
 
     Info:
     - 0: information.
@@ -28,16 +32,7 @@ def log(info, msg):
     - 2: Actions table.
     - 3: Drawing.
     """
-    if info == 0:
-        print(Fore.YELLOW + f"[INFO] {msg}")
-    elif info == 1:
-        print(Fore.RED + f"[ERROR] {msg}")
-    elif info == 2:
-        print(Fore.BLUE + f"[TABLE] {msg}")
-    elif info == 3:
-        print(Fore.GREEN + f"[DRAWING] {msg}")
-
-    print(Style.RESET_ALL)
+    get_logger().log(info, msg, *args)
 
 
 def set_text(img, text, pos, font=cv.FONT_HERSHEY_PLAIN, dim: float = 2, color=Color.MAGENTA, thickness=2):
@@ -65,6 +60,79 @@ def get_length(point_1, point_2):
     return math.sqrt(math.pow(point_2[0] - point_1[0], 2) + math.pow((point_2[1] - point_1[1]), 2))
 
 
+def get_centroids(boxes):
+    r"""
+    Get the centroids of the bounding boxes.
+
+    :param boxes: bounding boxes (start point, end point) or four coordinates of the bounding boxes.
+    :return: array (N, 2) with the coordinates of the centroids.
+    """
+
+    boxes = np.asarray(boxes, np.int32).reshape(len(boxes), -1, 2)
+    return (boxes[:, 0] + boxes[:, -1]) // 2
+
+
+def get_cost_matrix(centroids, directions, track_centroids, track_directions, max_distance,
+                    same_direction_distance=50):
+    r"""
+    Calculate the cost matrix (distances between the centroids) among blobs and vehicles tracked.
+    A couple is not allowed (infinite cost) if the distance isn't less than max_distance or if the directions
+    are different, unless the direction of the vehicle is unknown or the distance is small.
+
+    :param centroids: centroids (N, 2) of the blobs.
+    :param directions: directions (N) of the blobs.
+    :param track_centroids: centroids (M, 2) of the vehicles.
+    :param track_directions: directions (M) of the vehicles.
+    :param max_distance: maximum distance in pixel allowed.
+    :param same_direction_distance: distance under which the directions aren't compared.
+
+    :return: cost matrix (N, M).
+    """
+
+    difference = np.asarray(centroids, np.float64)[:, None, :] - np.asarray(track_centroids, np.float64)[None, :, :]
+    distances = np.hypot(difference[..., 0], difference[..., 1])
+
+    directions = np.asarray(directions, object)[:, None]
+    track_directions = np.asarray(track_directions, object)[None, :]
+    compatible = (track_directions == UNKNOWN) | (directions == track_directions) | \
+                 (distances <= same_direction_distance)
+
+    return np.where(compatible & (distances < max_distance), distances, np.inf)
+
+
+def get_assignment(cost):
+    r"""
+    Assign the blobs to the vehicles tracked, minimizing the total cost (Hungarian algorithm).
+    The number of couples allowed is maximized first, then their total distance.
+
+    :param cost: cost matrix (N, M), infinite if the couple isn't allowed.
+
+    :return: for each blob the index of the vehicle (-1 if not assigned) and the distance.
+    """
+
+    matches = np.full(cost.shape[0], -1, np.int64)
+    distances = np.full(cost.shape[0], np.inf)
+
+    allowed = np.isfinite(cost)
+    if not allowed.any():
+        return matches, distances
+
+    # Only rows and columns with at least a couple allowed
+    rows = np.flatnonzero(allowed.any(axis=1))
+    columns = np.flatnonzero(allowed.any(axis=0))
+    sub_cost = cost[np.ix_(rows, columns)]
+
+    # Not allowed couples cost more than any set of allowed couples
+    penalty = (sub_cost[np.isfinite(sub_cost)].max() + 1) * (len(rows) + 1)
+    row_index, column_index = linear_sum_assignment(np.where(np.isfinite(sub_cost), sub_cost, penalty))
+
+    valid = np.isfinite(sub_cost[row_index, column_index])
+    matches[rows[row_index[valid]]] = columns[column_index[valid]]
+    distances[rows[row_index[valid]]] = sub_cost[row_index[valid], column_index[valid]]
+
+    return matches, distances
+
+
 def get_random_color(list):
     r"""
     Create a random color rgb.
@@ -95,72 +163,133 @@ def get_random_color(list):
     return result, list
 
 
-def get_area(contour, min_area=40):
-    r"""
-    Get the area of a specific contour.
+def extract_blobs(mask, offset=(0, 0), min_area=40, zones_map=None, labels=None):
+    """
+    Extract the blobs (connected components) of the binary mask, discarding the small areas and
+    the blobs whose centroid (of the bounding box) isn't inside the polygons.
+
+    :param mask: binary mask.
+    :param offset: offset (x, y) of the mask into the image.
+    :param min_area: minimum area (pixels) of a blob.
+    :param zones_map: map of the zones (polygons) of the image, None to not consider the polygons.
+    :param labels: buffer of the labels.
+
+    :return boxes: bounding boxes (x_start, y_start, x_end, y_end) of the blobs (coordinates of the image).
+    :return labels: labels of the pixels.
+    """
+
+    _, labels, stats, _ = cv.connectedComponentsWithStats(mask, labels, connectivity=8)
 
-    :param contour: contour.
-    :param min_area: minimum area value.
+    # The first component is the background
+    x, y, w, h, area = stats[1:].T
+    x = x + offset[0]
+    y = y + offset[1]
 
-    :return: bool, true if the contour is to be discarded, false otherwise.
+    # Discard small areas and lines
+    is_valid = (area > min_area) & (w > 1) & (h > 1)
+
+    if zones_map is not None:
+        # Check if the centroid is inside the polygons
+        is_valid &= zones_map[y + h // 2, x + w // 2] > 0
+
+    boxes = np.stack((x, y, x + w, y + h), axis=1)[is_valid]
+
+    return boxes, labels
+
+
+def get_zones_map(polygons, height, width):
     """
+    Get the map of the zones (polygons) of the image: each pixel stores the index (starting from 1)
+    of the polygon it belongs to, 0 if it is outside all polygons.
+
+    :param polygons: polygons of the city.
+    :param height: height of the image.
+    :param width: width of the image.
+
+    :return: map of the zones.
+    """
+
+    zones_map = np.zeros((height, width), np.uint8)
 
-    area = cv.contourArea(contour)
-    peri = cv.arcLength(contour, True)
-    approx = cv.approxPolyDP(contour, 0.04 * peri, True)
-    return min_area >= area or len(approx) < 4
+    # Reverse order: if the polygons overlap, the pixel belongs to the first one
+    for index in range(len(polygons) - 1, -1, -1):
+        cv.fillPoly(zones_map, [polygons[index].astype(np.int32)], index + 1)
 
+    return zones_map
 
-def discard_area(cnt, polygons, excluded_area):
+
+def get_zone(zones_map, zones, coordinates):
     """
-    Discard the area if it is too small or if the point isn't inside the polygon.
+    Get the zone (polygon) in which is the centroid of the bounding box.
+
+    :param zones_map: map of the zones of the image.
+    :param zones: names of the zones.
+    :param coordinates: coordinates of the bounding box.
 
-    :param cnt: contour.
-    :param polygons: polygon.
-    :param excluded_area: bool, if true it does consider the polygon.
+    :return: name of the zone, None if the centroid is outside the polygons.
     """
 
-    (x, y, w, h) = cv.boundingRect(cnt)
-    coordinates = ((x, y), (x + w, y + h))
+    x, y = get_centroid(coordinates)
+    index = zones_map[y, x]
 
-    if get_area(cnt):
-        # Discard small areas
-        return True, []
+    return zones[index - 1] if index > 0 else None
 
-    if excluded_area:
-        if check_polygon(polygons, coordinates=coordinates):
-            # Check if the point is inside the polygon
-            return True, []
 
-    return False, coordinates
+def render_flow_colors(gain=2):
+    """
+    Renders all colors of the optical flow: HSV color (hue on the rows, value on the columns, saturation 255)
+    converted to BGR and multiplied by gain.
 
+    :param gain: gain of the BGR color.
 
-def get_intensity(mask, coordinates):
+    :return: BGR image (256 x 256), indexed by hue in [0, 180) and value in [0, 255].
     """
-    Gets average value among the intensity of the pixels.
 
-    :param mask: mask.
-    :param coordinates: coordinates of the area to calculate the average.
+    hsv = np.full((256, 256, 3), 255, np.uint8)
+    hsv[..., 0] = (np.arange(256) % 180)[:, None]
+    hsv[..., 2] = np.arange(256)[None, :]
+
+    bgr = cv.cvtColor(hsv, cv.COLOR_HSV2BGR)
+    return cv.addWeighted(bgr, gain, bgr, 0, 0)
+
+
+def get_hue_thresholds(threshold, gain=2):
     """
+    Gets, for each hue, the minimum value (normalized magnitude of the flow) of a pixel whose color
+    rendered (see render_flow_colors) and converted to gray is greater than threshold.
 
-    try:
-        p1, _, _, p4 = coordinates
-    except:
-        p1, p4 = coordinates
+    :param threshold: threshold of the gray level.
+    :param gain: gain of the BGR color.
+
+    :return: look-up table (256 elements, float32) indexed by the hue in [0, 180).
+    """
 
-    (x_start, y_start), (x_end, y_end) = p1, p4
+    is_moving = cv.cvtColor(render_flow_colors(gain), cv.COLOR_BGR2GRAY) > threshold
 
-    mask = mask[y_start:y_end, x_start:x_end]
-    mask = mask[:, :, 0]  # Component H
+    # The gray level increases with the value, so the first value moving is the minimum one
+    thresholds = np.where(is_moving.any(axis=1), is_moving.argmax(axis=1), 256)
 
-    try:
-        avg_color_per_row = np.average(mask)
-        avg_color = np.average(avg_color_per_row)
-        color_hsv = round(avg_color)
-    except ZeroDivisionError:
-        color_hsv = 0
+    return thresholds.astype(np.float32)
+
+
+def erode_dilate(mask, iterations, mask_erode=None, mask_dilate=None):
+    """
+    Erodes the binary mask N times and dilates it once with the 3x3 ellipse (a cross).
+    N erosions by the cross are one erosion by a diamond of radius N, so all erosions are done in a single
+    pass: a pixel is kept if its distance (L1) from the background is greater than N.
+
+    :param mask: binary mask.
+    :param iterations: number of erosions (lower than 255).
+    :param mask_erode: buffer of the mask eroded.
+    :param mask_dilate: buffer of the mask dilated.
 
-    return color_hsv
+    :return: mask eroded and dilated.
+    """
+
+    mask_erode = cv.distanceTransform(mask, cv.DIST_L1, cv.DIST_MASK_3, mask_erode, dstType=cv.CV_8U)
+    cv.threshold(mask_erode, iterations, 255, cv.THRESH_BINARY, mask_erode)
+
+    return cv.dilate(mask_erode, KERNEL_MORPHOLOGY, mask_dilate)
 
 
 def get_polygon(city):
@@ -181,44 +310,74 @@ def get_polygon(city):
     return polygon
 
 
-def check_polygon(polygons, coordinates):
+def get_zones(city):
+    """
+    Get the names of the zones (polygons) based on specific city.
+
+    :param city: city object.
     """
-    Check if the coordinates are inside the polygon.
 
-    :param polygons: polygon of the city.
-    :param coordinates: coordinates to check.
+    zones = []
 
-    return: bool, True if the coordinates are out the polygon, false otherwise.
+    for _city in CITIES:
+        if city["Name"] == _city:
+            zones = list(city.get("Zones", []))
+
+    # Zones without name
+    zones += [f"Zone {index + 1}" for index in range(len(zones), len(city["Polygon"]))]
+
+    return zones
+
+
+def get_bounding_box_polygons(polygons, width, height, padding=0):
     """
-    is_out = True
+    Get the bounding box of all polygons, enlarged by padding and clipped to the image.
 
-    if len(polygons) > 0:
-        centroid = get_centroid(coordinates)
-        point = (int(centroid[0]), int(centroid[1]))
+    :param polygons: polygons of the city.
+    :param width: width of the image.
+    :param height: height of the image.
+    :param padding: pixels added to each side of the bounding box.
 
-        for polygon in polygons:
-            is_inside = cv.pointPolygonTest(polygon, point, False)
+    :return: bounding box (x, y, width, height), None if there aren't polygons.
+    """
 
-            if is_inside >= 0:
-                # Point is inside the polygon
-                is_out = False
-                break
+    if len(polygons) == 0:
+        return None
 
-    return is_out
+    x, y, w, h = cv.boundingRect(np.concatenate(polygons).astype(np.int32))
+
+    x_start, y_start = max(0, x - padding), max(0, y - padding)
+    x_end, y_end = min(width, x + w + padding), min(height, y + h + padding)
+
+    return x_start, y_start, x_end - x_start, y_end - y_start
+
+
+def translate_coordinates(coordinates, offset):
+    """
+    Translate the coordinates of the bounding box into the region of interest.
+
+    :param coordinates: coordinates (start point, end point) or four coordinates of the bounding box.
+    :param offset: offset (x, y) of the region of interest.
+
+    :return: start point and end point translated.
+    """
+
+    (x_start, y_start), (x_end, y_end) = coordinates[0], coordinates[-1]
+    x_offset, y_offset = offset
+
+    return (max(0, x_start - x_offset), max(0, y_start - y_offset)), (x_end - x_offset, y_end - y_offset)
 
 
 def draw_vehicles(vehicles, iteration, img, show_log):
     r"""
     Draw the bounding box of a vehicle.
 
-    :param img: img to draw in.
+    :param img: img to draw in, if None only the iteration of the vehicles is updated.
     :param iteration: current iteration.
     :param vehicles: vehicles to draw.
     :param show_log: bool, if true the logs are showed.
     """
 
-    height, width, _ = img.shape
-
     for vehicle in vehicles:
 
         if show_log:
@@ -226,6 +385,11 @@ def draw_vehicles(vehicles, iteration, img, show_log):
 
         vehicle.set_iteration(iteration)
 
+        if img is None:
+            # Headless mode
+            continue
+
+        height, width, _ = img.shape
         thick = int((height + width) // 900)
 
         start, end = vehicle.coordinates[0], vehicle.coordinates[3]
@@ -322,65 +486,6 @@ def check_exit_to_the_scene(img, coordinates, max_value=8):
         return False
 
 
-def delete_item_in_list(list, name):
-    r"""
-    Delete vehicle by name in list.
-
-    :param list: list of vehicles.
-    :param name: name of vehicle to be deleted.
-
-    :return: list updated.
-    """
-
-    is_deleted = False
-    for index, vehicle in enumerate(list):
-        if vehicle.name == name:
-            del list[index]
-            is_deleted = True
-            break
-
-    return list, is_deleted
-
-
-def delete_all_items_in_list(list, name):
-    r"""
-    Delete all vehicles by name in list.
-
-    :param list: list of vehicles.
-    :param name: name of vehicle to be deleted.
-
-    :return: list updated.
-    """
-
-    is_deleted = False
-    tmp_list = list.copy()
-    count_deleted = 0
-    for index, vehicle in enumerate(list):
-        if vehicle.name == name:
-            del tmp_list[index - count_deleted]
-            count_deleted += 1
-            is_deleted = True
-
-    return tmp_list, is_deleted
-
-
-def check_vehicle_in_list(list, vehicle_to_search):
-    r"""
-    Check if name is present in list. If present, deletes this name in the list and reinsertes it.
-
-    :param list: list to search name.
-    :param vehicle_to_search: vehicle to search.
-    """
-
-    for index, vehicle in enumerate(list):
-        if vehicle.name == vehicle_to_search.name:
-            del list[index]
-            break
-
-    list.append(vehicle_to_search)
-    return list
-
-
 def stack_images(scale, imgArray):
     r"""
     Stack the images based on the number of them by rows and columns.
@@ -433,82 +538,3 @@ def stack_images(scale, imgArray):
         ver = hor
 
     return ver
-
-
-def get_direction(coordinates, angle, magnitude, threshold=10.0):
-    """
-    Calculate the direction of the vehicles.
-
-    :param coordinates: coordinates (start point, end point) of the vehicle.
-    :param angle: angle.
-    :param magnitude: magnitude.
-    :param threshold: threshold to filter the direction.
-
-    :return direction of the vehicle.
-    """
-    (x_start, y_start), (x_end, y_end) = coordinates
-
-    # Get portion of image
-    angle = angle[y_start:y_end, x_start:x_end]
-    magnitude = magnitude[y_start:y_end, x_start:x_end]
-
-    # Convert angles from radians to degrees
-    angle = np.degrees(angle)
-    magnitude = np.degrees(magnitude)
-
-    move_sense = angle[magnitude > threshold]
-    move_mode = mode(move_sense)[0]
-
-    directions_map = np.zeros([10, 5])
-
-    if 340 < move_mode or move_mode <= 70:
-        # Down
-        directions_map[-1, 0] = 1
-        directions_map[-1, 1:] = 0
-        directions_map = np.roll(directions_map, -1, axis=0)
-
-    elif 70 < move_mode <= 180:
-        # Right
-        directions_map[-1, 1] = 1
-        directions_map[-1, :1] = 0
-        directions_map[-1, 2:] = 0
-        directions_map = np.roll(directions_map, -1, axis=0)
-
-    elif 180 < move_mode <= 250:
-        # Up
-        directions_map[-1, 2] = 1
-        directions_map[-1, :2] = 0
-        directions_map[-1, 3:] = 0
-        directions_map = np.roll(directions_map, -1, axis=0)
-
-    elif 250 < move_mode < 340:
-        # Left
-        directions_map[-1, 3] = 1
-        directions_map[-1, :3] = 0
-        directions_map[-1, 4:] = 0
-        directions_map = np.roll(directions_map, -1, axis=0)
-
-    else:
-        # Stationary
-        directions_map[-1, -1] = 1
-        directions_map[-1, :-1] = 0
-        directions_map = np.roll(directions_map, 1, axis=0)
-
-    loc = directions_map.mean(axis=0).argmax()
-
-    if loc == 0:
-        text = DOWN
-
-    elif loc == 1:
-        text = LEFT
-
-    elif loc == 2:
-        text = UP
-
-    elif loc == 3:
-        text = RIGHT
-
-    else:
-        text = STATIONARY
-
-    return text
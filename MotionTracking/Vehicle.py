@@ -1,34 +1,100 @@
 from colorama import Fore
-from MotionTracking.Utility import UP, DOWN, LEFT, RIGHT
-from MotionTracking import Utility as Utility
+from MotionTracking.Utility import UP, DOWN, LEFT, RIGHT, STATIONARY, UNKNOWN
 
-UNKNOWN = "Unknown"
+# Directions counted to get the direction of the vehicle, in order of priority
+DIRECTIONS = [UP, DOWN, RIGHT, LEFT]
+
+# Codes of the directions in the history (0 is an empty position)
+DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS + [STATIONARY, UNKNOWN], 1)}
+DIRECTION_NAMES = [None] + DIRECTIONS + [STATIONARY, UNKNOWN]
+
+# Length of the history of the directions
+HISTORY_DIRECTIONS = 10
 
 
 class Vehicle:
     """
     Vehicle class.
+    It is a view of the state of the vehicle, stored into the arrays of the track store (position slot).
+    The view is valid as long as the vehicle is tracked, then the slot is reused by other vehicles.
     """
 
-    def __init__(self, name, coordinates, av_intensity, color, num_iter_stat, direction=UNKNOWN):
+    __slots__ = ("store", "slot", "id", "name", "color", "zone")
 
-        self.name = name
+    def __init__(self, store, slot, vehicle_id, name, coordinates, av_intensity, color, num_iter_stat,
+                 direction=UNKNOWN):
 
-        # Array with 4 coordinates of the bounding box.
-        self.coordinates = coordinates
-        self.centroid = Utility.get_centroid(coordinates)
+        self.store = store
+        self.slot = slot
 
+        self.id = vehicle_id
+        self.name = name
         self.color = color
-        self.velocity = 0
-        self.direction = [direction]
-        self.average_intensity = av_intensity
+
+        # Zone (polygon of the city) in which is the vehicle
+        self.zone = UNKNOWN
+
+        self.set_coordinates(coordinates)
+        self.set_velocity(0)
+        self.set_intensity(av_intensity)
+
+        store.direction_history[slot] = 0
+        store.direction_index[slot] = 0
+        self.set_direction(direction)
 
         ### Field to manage stationary vehicles ###
-        self.is_stationary = False
-        self.iteration = 0
+        store.stationary[slot] = False
+        self.set_iteration(0)
 
         # Minimum num frame before deleting the vehicle (if stationary)
-        self.num_frame_to_remove_vehicle = num_iter_stat
+        self.reset_iterations_stationary(num_iter_stat)
+
+    @property
+    def coordinates(self):
+        """
+        Array with 4 coordinates of the bounding box.
+        """
+
+        x_start, y_start, x_end, y_end = self.store.bboxes[self.slot].tolist()
+        return [(x_start, y_start), (x_end, y_start), (x_start, y_end), (x_end, y_end)]
+
+    @property
+    def centroid(self):
+        x, y = self.store.centroids[self.slot].tolist()
+        return x, y
+
+    @property
+    def velocity(self):
+        return float(self.store.velocities[self.slot])
+
+    @property
+    def average_intensity(self):
+        return int(self.store.intensities[self.slot])
+
+    @property
+    def direction(self):
+        """
+        History of the directions, from the newest.
+        """
+
+        store = self.store
+        index = int(store.direction_index[self.slot])
+        codes = store.direction_history[self.slot].tolist()
+
+        history = codes[index - 1::-1] + codes[:index - 1:-1]
+        return [DIRECTION_NAMES[code] for code in history if code != 0]
+
+    @property
+    def is_stationary(self):
+        return bool(self.store.stationary[self.slot])
+
+    @property
+    def iteration(self):
+        return int(self.store.iterations[self.slot])
+
+    @property
+    def num_frame_to_remove_vehicle(self):
+        return int(self.store.frames_to_remove[self.slot])
 
     def set_coordinates(self, new_coordinates):
         """
@@ -36,8 +102,18 @@ class Vehicle:
 
         :param new_coordinates: new coordinates.
         """
-        self.coordinates = new_coordinates
-        self.centroid = Utility.get_centroid(new_coordinates)
+        (x_start, y_start), (x_end, y_end) = new_coordinates[0], new_coordinates[-1]
+
+        self.store.bboxes[self.slot] = (x_start, y_start, x_end, y_end)
+        self.store.centroids[self.slot] = ((x_start + x_end) // 2, (y_start + y_end) // 2)
+
+    def set_zone(self, zone):
+        """
+        Update the zone.
+
+        :param zone: name of the zone (polygon) in which is the vehicle.
+        """
+        self.zone = zone
 
     def set_velocity(self, new_value):
         """
@@ -45,58 +121,26 @@ class Vehicle:
 
         :param new_value: new velocity.
         """
-        self.velocity = round(new_value, 3)
+        self.store.velocities[self.slot] = round(new_value, 3)
 
     def set_direction(self, new_direction):
         """
-        Update the direction.
+        Update the direction (the oldest one of the history is overwritten).
 
         :param new_direction: new direction.
         """
-        self.direction.insert(0, new_direction)
+        store = self.store
+        index = store.direction_index[self.slot]
 
-        if len(self.direction) > 10:
-            del self.direction[-1]
+        store.direction_history[self.slot, index] = DIRECTION_CODES.get(new_direction, DIRECTION_CODES[UNKNOWN])
+        store.direction_index[self.slot] = (index + 1) % HISTORY_DIRECTIONS
 
     def get_direction(self):
         """
         Get direction of the vehicle.
         """
 
-        count_up = 0
-        count_down = 0
-        count_left = 0
-        count_right = 0
-
-        for direction in self.direction:
-            if direction == UP:
-                count_up += 1
-
-            elif direction == DOWN:
-                count_down += 1
-
-            elif direction == LEFT:
-                count_left += 1
-
-            elif direction == RIGHT:
-                count_right += 1
-
-        max_direction = max(count_up, count_down, count_left, count_right)
-
-        text_direction = ""
-        if max_direction == count_up:
-            text_direction = UP
-
-        elif max_direction == count_down:
-            text_direction = DOWN
-
-        elif max_direction == count_right:
-            text_direction = RIGHT
-
-        elif max_direction == count_left:
-            text_direction = LEFT
-
-        return text_direction
+        return self.store.get_directions([self])[0]
 
     def set_intensity(self, intensity):
         """
@@ -104,19 +148,19 @@ class Vehicle:
 
         :param intensity: new intensity to update.
         """
-        self.average_intensity = intensity
+        self.store.intensities[self.slot] = intensity
 
     def marked_as_stationary(self):
         """
         Mark the vehicle as stationary.
         """
-        self.is_stationary = True
+        self.store.stationary[self.slot] = True
 
     def unmarked_as_stationary(self, default_iter):
         """
         Unmark the vehicle as stationary.
         """
-        self.is_stationary = False
+        self.store.stationary[self.slot] = False
         self.reset_iterations_stationary(default_iter)
 
     def decrease_iterations_stationary(self):
@@ -124,7 +168,7 @@ class Vehicle:
         Decrease number of interatons for stationary vehicle.
         """
         if self.is_stationary:
-            self.num_frame_to_remove_vehicle -= 1
+            self.store.frames_to_remove[self.slot] -= 1
 
             return self.num_frame_to_remove_vehicle
 
@@ -137,13 +181,13 @@ class Vehicle:
 
         :param iter: new value iteration.
         """
-        self.iteration = iter
+        self.store.iterations[self.slot] = iter
 
     def reset_iterations_stationary(self, default_iter):
         """
         Resets (sets default value) the number of iterations to remove vehicle into list.
         """
-        self.num_frame_to_remove_vehicle = default_iter
+        self.store.frames_to_remove[self.slot] = default_iter
 
     def to_string(self):
         """
@@ -152,4 +196,4 @@ class Vehicle:
 
         return (Fore.RED + f"[Name]: {self.name}\n[Is stationary]: {self.is_stationary}\n[Velocity]: {self.velocity}\n"
                            f"[Direction]: {self.direction}\n[Color]: {self.color}\n[Coordinates]: {self.coordinates}\n"
-                           f"[Intensity HSV]: {self.average_intensity}")
+                           f"[Intensity HSV]: {self.average_intensity}\n[Zone]: {self.zone}")
@@ -0,0 +1,162 @@
+import abc
+
+import cv2 as cv
+import numpy as np
+
+# Backends
+FARNEBACK = "Farneback"
+DIS = "DIS"
+COARSE_FARNEBACK = "Coarse Farneback"
+
+# Presets (quality/speed)
+PRESET_ULTRAFAST = "ultrafast"
+PRESET_FAST = "fast"
+PRESET_MEDIUM = "medium"
+
+FARNEBACK_PARAMS = {
+    PRESET_MEDIUM: {"pyr_scale": 0.5, "levels": 5, "winsize": 11, "iterations": 5, "poly_n": 5, "poly_sigma": 1.1},
+    PRESET_FAST: {"pyr_scale": 0.5, "levels": 5, "winsize": 15, "iterations": 2, "poly_n": 5, "poly_sigma": 1.1},
+    PRESET_ULTRAFAST: {"pyr_scale": 0.5, "levels": 3, "winsize": 15, "iterations": 1, "poly_n": 5, "poly_sigma": 1.1}
+}
+
+DIS_PRESETS = {
+    PRESET_MEDIUM: cv.DISOPTICAL_FLOW_PRESET_MEDIUM,
+    PRESET_FAST: cv.DISOPTICAL_FLOW_PRESET_FAST,
+    PRESET_ULTRAFAST: cv.DISOPTICAL_FLOW_PRESET_ULTRAFAST
+}
+
+
+def check_preset(preset, presets):
+    r"""
+    Check if the preset is available.
+
+    :param preset: preset to check.
+    :param presets: available presets.
+    """
+
+    if preset not in presets:
+        raise Exception(f"Unknown optical flow preset: {preset}")
+
+
+class FlowEngine(abc.ABC):
+    r"""
+    Interface of the optical flow engines.
+    Each engine returns a flow with shape (height, width, 2) and type float32.
+    """
+
+    @abc.abstractmethod
+    def compute(self, prev_gray, gray, out=None):
+        """
+        Calculates the optical flow between two frames.
+
+        :param prev_gray: previous frame (grayscale).
+        :param gray: current frame (grayscale).
+        :param out: buffer of the flow (height, width, 2) float32, None to use the buffer of the engine.
+
+        :return: optical flow (valid until the next call if out is None).
+        """
+
+
+class FarnebackFlow(FlowEngine):
+    r"""
+    Optical flow dense of Farneback.
+    """
+
+    def __init__(self, preset=PRESET_MEDIUM):
+        check_preset(preset, FARNEBACK_PARAMS)
+
+        self.params = FARNEBACK_PARAMS[preset]
+        self.flow = None
+
+    def compute(self, prev_gray, gray, out=None):
+        if out is not None:
+            # Without OPTFLOW_USE_INITIAL_FLOW the content of the buffer is ignored
+            return cv.calcOpticalFlowFarneback(prev_gray, gray, out, flags=0, **self.params)
+
+        self.flow = cv.calcOpticalFlowFarneback(prev_gray, gray, self.flow, flags=0, **self.params)
+        return self.flow
+
+
+class DISFlow(FlowEngine):
+    r"""
+    Optical flow dense DIS (Dense Inverse Search).
+    """
+
+    def __init__(self, preset=PRESET_FAST):
+        check_preset(preset, DIS_PRESETS)
+
+        self.dis = cv.DISOpticalFlow_create(DIS_PRESETS[preset])
+        self.flow = None
+
+    def compute(self, prev_gray, gray, out=None):
+        self.flow = self.dis.calc(prev_gray, gray, None)
+
+        if out is not None:
+            # DIS uses a flow given as input to initialize the search, so it's calculated into its own buffer
+            np.copyto(out, self.flow)
+            return out
+
+        return self.flow
+
+
+class CoarseFarnebackFlow(FlowEngine):
+    r"""
+    Optical flow dense of Farneback calculated on the downscaled frames.
+    The flow is upsampled (and its vectors rescaled) to the size of the frames.
+    """
+
+    def __init__(self, preset=PRESET_MEDIUM, scale=0.5):
+        check_preset(preset, FARNEBACK_PARAMS)
+
+        self.params = FARNEBACK_PARAMS[preset]
+        self.scale = scale
+
+        # Buffers
+        self.prev_small = None
+        self.small = None
+        self.flow_small = None
+        self.flow = None
+
+    def compute(self, prev_gray, gray, out=None):
+        height, width = gray.shape[:2]
+
+        if self.flow is None or self.flow.shape[:2] != (height, width):
+            size_small = (max(1, round(width * self.scale)), max(1, round(height * self.scale)))
+            self.prev_small = np.empty(size_small[::-1], np.uint8)
+            self.small = np.empty(size_small[::-1], np.uint8)
+            self.flow = np.empty((height, width, 2), np.float32)
+
+        size_small = self.small.shape[::-1]
+        cv.resize(prev_gray, size_small, dst=self.prev_small, interpolation=cv.INTER_AREA)
+        cv.resize(gray, size_small, dst=self.small, interpolation=cv.INTER_AREA)
+
+        self.flow_small = cv.calcOpticalFlowFarneback(self.prev_small, self.small, self.flow_small, flags=0,
+                                                      **self.params)
+
+        flow = self.flow if out is None else out
+
+        # Upsampling, the vectors are rescaled to the size of the frames
+        cv.resize(self.flow_small, (width, height), dst=flow, interpolation=cv.INTER_LINEAR)
+        flow *= 1 / self.scale
+
+        return flow
+
+
+def create_flow_engine(backend=FARNEBACK, preset=PRESET_MEDIUM):
+    r"""
+    Create the optical flow engine.
+
+    :param backend: backend of the optical flow (Farneback, DIS, Coarse Farneback).
+    :param preset: preset of the backend (ultrafast, fast, medium).
+    """
+
+    if backend == FARNEBACK:
+        return FarnebackFlow(preset)
+
+    elif backend == DIS:
+        return DISFlow(preset)
+
+    elif backend == COARSE_FARNEBACK:
+        return CoarseFarnebackFlow(preset)
+
+    raise Exception(f"Unknown optical flow backend: {backend}")
@@ -0,0 +1,62 @@
+# Displacement (pixels) of the fastest vehicle between two frames processed targeted by the adaptive stride,
+# well below the maximum distance of the association (see Motion)
+TARGET_DISPLACEMENT = 8.0
+
+
+class FrameStride:
+    r"""
+    Stride of the frames of the video processed: the optical flow is calculated between the frames t and t + stride,
+    the frames in between are skipped. If the maximum stride is greater than the minimum one, the stride adapts
+    to the motion: it shrinks at once when the vehicles move fast and grows one frame at a time when the scene
+    is quiet, so the displacement of the vehicles between two frames processed stays around the target.
+    """
+
+    def __init__(self, stride=1, max_stride=None, target_displacement=TARGET_DISPLACEMENT):
+        """
+        Constructor of class.
+
+        :param stride: stride of the frames (minimum stride if adaptive).
+        :param max_stride: maximum stride, None (or equal to stride) for a fixed stride.
+        :param target_displacement: displacement (pixels) of the fastest vehicle between two frames processed.
+        """
+
+        if stride < 1 or (max_stride is not None and max_stride < stride):
+            raise Exception(f"Invalid frame stride: {stride} (maximum {max_stride})")
+
+        self.min_stride = stride
+        self.max_stride = max_stride if max_stride is not None else stride
+        self.target_displacement = target_displacement
+
+        self.stride = stride
+
+    def is_adaptive(self):
+        """
+        Checks if the stride adapts to the motion.
+        """
+
+        return self.max_stride > self.min_stride
+
+    def update(self, displacement):
+        """
+        Updates the stride with the motion of the last frames processed.
+
+        :param displacement: displacement (pixels) of the fastest vehicle between the last two frames processed
+                             (stride frames apart), 0 if nothing moves.
+
+        :return: stride of the next frame.
+        """
+
+        if not self.is_adaptive():
+            return self.stride
+
+        # Displacement in one frame of the video
+        displacement_frame = displacement / self.stride
+
+        if displacement_frame > 0:
+            stride = int(self.target_displacement / displacement_frame)
+        else:
+            stride = self.max_stride
+
+        self.stride = max(self.min_stride, min(stride, self.stride + 1, self.max_stride))
+
+        return self.stride
@@ -0,0 +1,283 @@
+import math
+import multiprocessing
+import time
+
+import cv2 as cv
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from MotionTracking.Utility import log
+from OpticalFlow.flowEngine import FARNEBACK, PRESET_MEDIUM
+from OpticalFlow.opticalflowDense import OpticalFlowDense
+
+# Frames processed by a chunk before its first frame, to warm up the tracker and to stitch the tracks
+CHUNK_OVERLAP = 50
+
+# Maximum number of output frames of a chunk by default: the records of a chunk are sent back in one message and
+# reach the sink only when the chunk is finished, so long videos are split into more chunks than processes
+MAX_CHUNK_FRAMES = 3000
+
+# Minimum mean IoU and minimum number of frames in common of two tracks stitched
+MIN_STITCH_IOU = 0.3
+MIN_STITCH_FRAMES = 3
+
+
+def get_chunks(num_frames, chunk_frames, overlap=CHUNK_OVERLAP):
+    r"""
+    Splits a video into chunks. The frame i of the output is the flow between the frames i and i + 1 of the video,
+    so there are num_frames - 1 output frames.
+
+    :param num_frames: number of frames of the video.
+    :param chunk_frames: number of output frames of each chunk.
+    :param overlap: number of frames processed before the first output frame of the chunk.
+
+    :return: list of (first frame processed, first output frame, end output frame (excluded)).
+    """
+
+    num_iterations = max(num_frames - 1, 0)
+    chunks = []
+
+    for first in range(0, num_iterations, chunk_frames):
+        chunks.append((max(0, first - overlap), first, min(first + chunk_frames, num_iterations)))
+
+    return chunks
+
+
+def get_record(vehicle):
+    r"""
+    Get the data of a vehicle tracked (the vehicles don't leave the process of the tracker).
+
+    :param vehicle: vehicle.
+
+    :return: dict with id, name, box (x1, y1, x2, y2), velocity, direction, stationary, zone and color.
+    """
+
+    (x_start, y_start), _, _, (x_end, y_end) = vehicle.coordinates
+
+    return {"id": vehicle.id, "name": vehicle.name, "box": (x_start, y_start, x_end, y_end),
+            "velocity": vehicle.velocity, "direction": vehicle.get_direction(), "stationary": vehicle.is_stationary,
+            "zone": vehicle.zone, "color": vehicle.color}
+
+
+def process_chunk(task):
+    r"""
+    Tracks the vehicles of a chunk of the video with a new tracker (worker of the pool).
+
+    :param task: tuple (video_url, chunk, parameters of OpticalFlowDense).
+
+    :return: chunk and, for each frame processed, the list of the records of the vehicles tracked.
+    """
+
+    video_url, chunk, parameters = task
+    start, _, end = chunk
+    frames = []
+
+    def sink(iteration, vehicles):
+        frames.append([get_record(vehicle) for vehicle in vehicles])
+
+    op_dense = OpticalFlowDense(video_url=video_url, show_log=False, headless=True, sink=sink, start_frame=start,
+                                max_frames=end - start, **parameters)
+    op_dense.run()
+
+    return chunk, frames
+
+
+def get_iou(box_1, box_2):
+    r"""
+    Intersection over union of two boxes (x1, y1, x2, y2).
+    """
+
+    width = min(box_1[2], box_2[2]) - max(box_1[0], box_2[0])
+    height = min(box_1[3], box_2[3]) - max(box_1[1], box_2[1])
+
+    if width <= 0 or height <= 0:
+        return 0.0
+
+    intersection = width * height
+    union = (box_1[2] - box_1[0]) * (box_1[3] - box_1[1]) + (box_2[2] - box_2[0]) * (box_2[3] - box_2[1]) - \
+        intersection
+
+    return intersection / union if union > 0 else 0.0
+
+
+def stitch_tracks(previous_frames, frames, min_iou=MIN_STITCH_IOU, min_frames=MIN_STITCH_FRAMES):
+    r"""
+    Matches the tracks of a chunk to the tracks of the previous chunk in the frames processed by both (overlap):
+    the score of two tracks is their mean IoU in the frames where both are present, the tracks are assigned
+    by the Hungarian algorithm.
+
+    :param previous_frames: records of the previous chunk (global ids) in the frames of the overlap.
+    :param frames: records of the chunk (local ids) in the same frames.
+    :param min_iou: minimum mean IoU of two tracks stitched.
+    :param min_frames: minimum number of frames in common of two tracks stitched.
+
+    :return: dict local id: global id of the tracks stitched.
+    """
+
+    sums = {}
+    counts = {}
+
+    for previous_records, records in zip(previous_frames, frames):
+        for previous in previous_records:
+            for record in records:
+                iou = get_iou(previous["box"], record["box"])
+
+                if iou > 0:
+                    key = (previous["id"], record["id"])
+                    sums[key] = sums.get(key, 0.0) + iou
+                    counts[key] = counts.get(key, 0) + 1
+
+    if not sums:
+        return {}
+
+    previous_ids = sorted({key[0] for key in sums})
+    ids = sorted({key[1] for key in sums})
+    rows = {vehicle_id: i for i, vehicle_id in enumerate(previous_ids)}
+    columns = {vehicle_id: j for j, vehicle_id in enumerate(ids)}
+
+    scores = np.zeros((len(previous_ids), len(ids)))
+    for (previous_id, vehicle_id), total in sums.items():
+        if counts[(previous_id, vehicle_id)] >= min_frames:
+            # Mean IoU over the frames where both are present
+            scores[rows[previous_id], columns[vehicle_id]] = total / counts[(previous_id, vehicle_id)]
+
+    assigned_rows, assigned_columns = linear_sum_assignment(-scores)
+
+    return {ids[j]: previous_ids[i] for i, j in zip(assigned_rows, assigned_columns) if scores[i, j] >= min_iou}
+
+
+class OfflineProcessing:
+    r"""
+    Offline tracking of a video file split into chunks processed in parallel by a pool of processes.
+    Each chunk is tracked by an independent tracker, which starts some frames before the chunk (overlap):
+    the tracks of the overlap are stitched to the tracks of the previous chunk, so a vehicle crossing
+    the border of two chunks keeps its id. The vehicles of each frame are sent to the sink in order.
+    """
+
+    def __init__(self, video_url, height_cam=512, width_cam=750, excluded_area=True, sink=None, processes=None,
+                 chunk_frames=None, overlap=CHUNK_OVERLAP, flow_backend=FARNEBACK, flow_preset=PRESET_MEDIUM,
+                 crop_roi=True, prediction=False, threshold=20, erode_iterations=12, min_area=40, show_log=True):
+        """
+        Constructor of class.
+
+        :param video_url: video to process (dict of the city, local video).
+        :param height_cam: height of camera.
+        :param width_cam: width of camera.
+        :param excluded_area: bool, if true it does consider the polygon.
+        :param sink: callable sink(iteration, records) called for each frame in order, the records are dict with
+                     id, name, box, velocity, direction, stationary, zone and color of the vehicles.
+        :param processes: number of processes, None for the number of cpu.
+        :param chunk_frames: number of frames of each chunk, None to split the video into one chunk per process
+                             (at most MAX_CHUNK_FRAMES frames each).
+        :param overlap: number of frames processed by both chunks at the border of two chunks.
+        :param flow_backend: backend of the optical flow (Farneback, DIS, Coarse Farneback).
+        :param flow_preset: preset of the optical flow backend (ultrafast, fast, medium).
+        :param crop_roi: bool, if true the optical flow is calculated only into the bounding box of the polygons.
+        :param prediction: bool, if true the position of the vehicles is predicted to track them.
+        :param threshold: threshold of the flow to mark a pixel as moving.
+        :param erode_iterations: number of erosions of the mask of the moving pixels.
+        :param min_area: minimum area (pixels) of a vehicle.
+        :param show_log: bool, if true show the log.
+        """
+
+        if "http" in video_url["Path"]:
+            raise Exception("Offline processing requires a local video")
+
+        self.video_url = video_url
+        self.sink = sink
+        self.processes = processes or multiprocessing.cpu_count()
+        self.chunk_frames = chunk_frames
+        self.overlap = overlap
+        self.show_log = show_log
+
+        self.parameters = {"height_cam": height_cam, "width_cam": width_cam, "excluded_area": excluded_area,
+                           "flow_backend": flow_backend, "flow_preset": flow_preset, "crop_roi": crop_roi,
+                           "prediction": prediction, "threshold": threshold, "erode_iterations": erode_iterations,
+                           "min_area": min_area}
+
+        # Global ids of the tracks
+        self.counter_vehicle = 0
+
+    def get_num_frames(self):
+        """
+        Get the number of frames of the video.
+        """
+
+        capture = cv.VideoCapture(self.video_url["Path"])
+        num_frames = int(capture.get(cv.CAP_PROP_FRAME_COUNT))
+        capture.release()
+
+        return num_frames
+
+    def run(self):
+        """
+        Tracks the vehicles of the whole video.
+
+        :return: number of frames processed and elapsed time (seconds).
+        """
+
+        start_time = time.perf_counter()
+
+        num_frames = self.get_num_frames()
+        if num_frames <= 1:
+            raise Exception(f"Unknown number of frames of the video {self.video_url['Path']}")
+
+        chunk_frames = self.chunk_frames or min(math.ceil((num_frames - 1) / self.processes), MAX_CHUNK_FRAMES)
+        chunks = get_chunks(num_frames, chunk_frames, self.overlap)
+        tasks = [(self.video_url, chunk, self.parameters) for chunk in chunks]
+
+        if self.show_log:
+            log(0, f"Offline processing: {num_frames} frames, {len(chunks)} chunks, {self.processes} processes")
+
+        # Records (global ids) of the last frames of the previous chunk
+        previous_frames = []
+        iterations = 0
+
+        context = multiprocessing.get_context("spawn")
+
+        with context.Pool(min(self.processes, len(chunks))) as pool:
+            # The chunks are received in order, the next ones are processed meanwhile
+            for (start, first, end), frames in pool.imap(process_chunk, tasks):
+                # Frames processed by both chunks: the last ones before the first output frame
+                overlap = first - start
+                common = min(overlap, len(previous_frames))
+                mapping = stitch_tracks(previous_frames[len(previous_frames) - common:],
+                                        frames[overlap - common:overlap]) if common > 0 else {}
+
+                if self.show_log:
+                    log(0, f"Chunk {first}-{end}: {len(frames)} frames, {len(mapping)} tracks stitched")
+
+                frames = [self.get_global_records(records, mapping) for records in frames[overlap:]]
+
+                if self.sink is not None:
+                    for i, records in enumerate(frames):
+                        self.sink(first + i, records)
+
+                iterations += len(frames)
+                previous_frames = (previous_frames + frames)[-self.overlap:] if self.overlap > 0 else []
+
+        return iterations, time.perf_counter() - start_time
+
+    def get_global_records(self, records, mapping):
+        """
+        Replaces the local ids of the records of a chunk with the global ids, a new global id is given
+        to the tracks not stitched (the mapping is updated).
+
+        :param records: records of a frame.
+        :param mapping: dict local id: global id.
+
+        :return: records with the global ids.
+        """
+
+        global_records = []
+
+        for record in records:
+            global_id = mapping.get(record["id"])
+
+            if global_id is None:
+                self.counter_vehicle += 1
+                global_id = mapping[record["id"]] = self.counter_vehicle
+
+            global_records.append(dict(record, id=global_id, name=f"Vehicle {global_id}"))
+
+        return global_records
@@ -3,18 +3,26 @@ import time
 
 import cv2 as cv
 import numpy as np
-from PyQt5.QtWidgets import QApplication
 
-from Calibration.ModuleCalibration import load_coefficients
+from Calibration.ModuleCalibration import load_undistort_maps
 from Common import color as Color
-from Common.loadVideo import get_video
+from Common.profiler import Profiler, NullProfiler, CAPTURE, PREPROCESS, FLOW, DISPLAY, FRAME
+from Common.loadVideo import get_video, FramePrefetcher
 from MotionTracking import Utility as Utility
 from MotionTracking.Motion import Motion
-from MotionTracking.Table import Table
+from MotionTracking.Table import NullTable
+from MotionTracking.TableViewer import TableProxy
 from MotionTracking.Utility import log
+from OpticalFlow.flowEngine import create_flow_engine, FARNEBACK, PRESET_MEDIUM
+from OpticalFlow.frameStride import FrameStride
+from OpticalFlow.preprocessing import Preprocessing
+from OpticalFlow.stagedPipeline import StagedPipeline
 
 WINDOW_OPTICAL_FLOW = "Optical Flow Dense"
 
+# Pixels added to each side of the region of interest (window of the optical flow)
+ROI_PADDING = 24
+
 
 def callback_mouse(event, x, y, flag, param):
     r"""
@@ -25,19 +33,15 @@ def callback_mouse(event, x, y, flag, param):
         print(f"Click image in position ({x},{y})")
 
 
-def filtering(frame):
-    r"""
-    Filtering image.
-    """
-    return cv.GaussianBlur(frame, ksize=(9, 9), sigmaX=cv.BORDER_DEFAULT)
-
-
 class OpticalFlowDense:
     r"""
     Class to detect moving vehicles by implementation of optical flow dense.
     """
 
-    def __init__(self, video_url, height_cam=512, width_cam=750, excluded_area=True, show_log=True):
+    def __init__(self, video_url, height_cam=512, width_cam=750, excluded_area=True, show_log=True, headless=False,
+                 sink=None, flow_backend=FARNEBACK, flow_preset=PRESET_MEDIUM, crop_roi=True,
+                 prefetch=8, prediction=False, profile=False, profile_path=None, threshold=20, erode_iterations=12,
+                 min_area=40, start_frame=0, max_frames=None, staged=False, stride=1, max_stride=None):
         """"
         Constructor of class.
 
@@ -46,19 +50,72 @@ class OpticalFlowDense:
         :param width_cam: width of camera.
         :param excluded_area: bool, if true it does consider the polygon.
         :param show_log: bool, of true show the log.
+        :param headless: bool, if true no window (table, video, masks) is created.
+        :param sink: callable sink(iteration, vehicles) called after each processed frame.
+        :param flow_backend: backend of the optical flow (Farneback, DIS, Coarse Farneback).
+        :param flow_preset: preset of the optical flow backend (ultrafast, fast, medium).
+        :param crop_roi: bool, if true (and excluded_area) the optical flow is calculated only into the
+                         bounding box of the polygons.
+        :param prefetch: number of frames decoded in advance on a background thread (0 to disable).
+        :param prediction: bool, if true the position of the vehicles is predicted to associate them.
+        :param profile: bool, if true the time of each stage is measured (overlay, periodic log).
+        :param profile_path: path of the JSON file with the times of the stages written at the end, None to disable.
+        :param threshold: threshold of the flow to mark a pixel as moving (see Motion).
+        :param erode_iterations: number of erosions of the mask of the moving pixels (see Motion).
+        :param min_area: minimum area (pixels) of a vehicle (see Motion).
+        :param start_frame: index of the first frame of the video processed (local videos only).
+        :param max_frames: maximum number of frames of the video processed by run_headless, None to process
+                           the whole video.
+        :param staged: bool, if true (headless only) capture, optical flow and tracking run in three processes
+                       connected by shared memory (see StagedPipeline).
+        :param stride: number of frames of the video between two frames processed, the frames in between are
+                       skipped (minimum stride if adaptive).
+        :param max_stride: maximum stride, if greater than stride the stride adapts to the motion of the vehicles
+                           (see FrameStride), None for a fixed stride.
         """
 
-        # Camera
+        if staged and not headless:
+            raise Exception("The staged pipeline is available only in headless mode")
+
+        if staged and (stride != 1 or max_stride not in (None, 1)):
+            raise Exception("The staged pipeline processes all the frames, the frame stride isn't available")
+
+        # Camera (opened by the capture stage if staged)
         self.height = height_cam
         self.width = width_cam
-        self.camera = get_video(video_url["Path"], self.height, self.width)
+        self.camera = None if staged else get_video(video_url["Path"], self.height, self.width,
+                                                     buffer_size=prefetch, start_frame=start_frame)
+        self.start_frame = start_frame
+        self.max_frames = max_frames
+        self.staged = staged
+
+        # Stride of the frames processed and index (from the first frame read) of the last frame processed
+        self.frame_stride = FrameStride(stride, max_stride)
+        self.frame_index = 0
 
         # Table
-        self.app_qt = QApplication(sys.argv)
-        self.table = Table(show_log)
+        self.headless = headless
+        self.sink = sink
+
+        if self.headless:
+            self.table = NullTable()
+        else:
+            # Table shown by a separate process (key 't' to show/hide it)
+            self.table = TableProxy(show_log)
+
+        # Optical flow
+        self.flow_backend = flow_backend
+        self.flow_preset = flow_preset
+        self.flow_engine = create_flow_engine(flow_backend, flow_preset)
+
+        # Timing of the stages
+        self.profiler = Profiler() if profile else NullProfiler()
+        self.profile_path = profile_path
 
         # Object Motion
-        self.motion = Motion(self.table, excluded_area, show_log)
+        self.motion = Motion(self.table, excluded_area, show_log, show_masks=not self.headless,
+                             threshold=threshold, erode_iterations=erode_iterations, min_area=min_area,
+                             prediction=prediction, profiler=self.profiler)
 
         # Frame Rate
         self.frame_rate_x, self.frame_rate_y = video_url["Frame rate"]
@@ -76,9 +133,17 @@ class OpticalFlowDense:
         # City
         self.obj_city = video_url
         self.polygons = None
+        self.zones = None
+
+        # Region of interest (x, y, width, height) of the optical flow
+        self.crop_roi = crop_roi
+        self.roi = None
 
         self.start_video = False
 
+        # Preprocessing of the frames
+        self.preprocessing = None
+
     def frame_rate(self, frame):
         """
         Calculates the frame rate.
@@ -92,18 +157,83 @@ class OpticalFlowDense:
         Utility.set_text(frame, f"FPS: {int(self.fps)}", (self.frame_rate_x, self.frame_rate_y), dim=1.5,
                          color=Color.RED, thickness=2)
 
+    def load_calibration(self):
+        """
+        Loads the undistortion maps of the camera and creates the preprocessing of the frames.
+        """
+
+        map_x, map_y = load_undistort_maps("Calibration/data", self.width, self.height)
+        self.preprocessing = Preprocessing(self.width, self.height, map_x, map_y)
+
+    def load_polygons(self):
+        """
+        Loads the polygons of the city and the region of interest of the optical flow.
+        """
+
+        self.polygons = Utility.get_polygon(self.obj_city)
+        self.zones = Utility.get_zones(self.obj_city)
+
+        if self.crop_roi:
+            self.roi = Utility.get_bounding_box_polygons(self.polygons, self.width, self.height, ROI_PADDING)
+
+            if self.show_log and self.roi is not None:
+                log(0, f"Region of interest: {self.roi}")
+
+    def dump_profile(self):
+        """
+        Writes the times of the stages into the JSON file (if profiling).
+        """
+
+        if self.profile_path is not None:
+            self.profiler.dump(self.profile_path)
+
+            if self.show_log:
+                log(0, "Profile: %s", self.profiler.get_percentiles())
+
+    def read_frame(self, stride):
+        """
+        Reads the frame stride frames after the last frame read, the frames in between are skipped.
+
+        :param stride: stride of the frames.
+
+        :return: bool, true if the frame has been read, and the frame.
+        """
+
+        for _ in range(stride - 1):
+            if not self.camera.grab():
+                return False, None
+
+        return self.camera.read()
+
+    def compute_flow(self, prev_gray, gray):
+        """
+        Calculates the optical flow into the region of interest.
+
+        :param prev_gray: previous frame (grayscale).
+        :param gray: current frame (grayscale).
+        """
+
+        if self.roi is None:
+            return self.flow_engine.compute(prev_gray, gray)
+
+        x, y, w, h = self.roi
+        return self.flow_engine.compute(prev_gray[y:y + h, x:x + w], gray[y:y + h, x:x + w])
+
     def run(self):
         """
         Trackin vehicles by optical flow.
         """
 
+        if self.staged:
+            return self.run_staged()
+
+        if self.headless:
+            return self.run_headless()
+
         cv.namedWindow(WINDOW_OPTICAL_FLOW)
         cv.setMouseCallback(WINDOW_OPTICAL_FLOW, callback_mouse)
 
-        data = load_coefficients("Calibration/data")
-        camera_matrix, dist_matrix, rvecs, tvecs = data
-        newcameramtx, roi = cv.getOptimalNewCameraMatrix(camera_matrix, dist_matrix, (self.width, self.height), 0,
-                                                         (self.width, self.height))
+        self.load_calibration()
 
         if self.show_log:
             log(0, "Optical Flow Dense start!")
@@ -113,25 +243,22 @@ class OpticalFlowDense:
 
         _, first_frame = self.camera.read()
 
-        first_frame_copy = cv.resize(first_frame.copy(), (self.width, self.height))
-        first_frame_copy = cv.undistort(first_frame_copy, camera_matrix, dist_matrix, None, newcameramtx)
-
-        first_frame = filtering(first_frame)
-        first_frame = cv.resize(first_frame, (self.width, self.height))
-        first_frame = cv.undistort(first_frame, camera_matrix, dist_matrix, None, newcameramtx)
-
-        prev_gray = cv.cvtColor(first_frame, cv.COLOR_BGR2GRAY)
+        first_frame, prev_gray = self.preprocessing.process(first_frame)
 
-        stack = Utility.stack_images(1, ([first_frame_copy, first_frame_copy]))
+        stack = Utility.stack_images(1, ([first_frame, first_frame]))
         cv.imshow(WINDOW_OPTICAL_FLOW, stack)
 
+        # Buffers of the images to show
+        img_to_draw = np.empty_like(first_frame)
+        frame_masked = np.empty_like(first_frame)
+
         mask = cv.resize(np.zeros_like(first_frame), (400, 400))
         stack_mask = Utility.stack_images(1, ([mask, mask]))
         cv.imshow("Masks", stack_mask)
         key = cv.waitKey(0)
 
         if self.excluded_area:
-            self.polygons = Utility.get_polygon(self.obj_city)
+            self.load_polygons()
             mask_poly = np.zeros_like(first_frame[:, :, 0])
 
             for polygon in self.polygons:
@@ -142,58 +269,255 @@ class OpticalFlowDense:
 
         if self.start_video:
 
-            while self.camera.isOpened():
+            # Frames of the video between the first frames of the last two pairs processed (the blobs are
+            # at the positions of the first frame of the pair)
+            dt = self.frame_stride.stride
+
+            # Frame rate of the video, used to estimate the velocity (the FPS shown is the one of the processing)
+            video_fps = self.camera.get(cv.CAP_PROP_FPS)
+
+            try:
+                while self.camera.isOpened():
+
+                    stride = self.frame_stride.stride
+
+                    start_frame = start = self.profiler.start()
+                    ret, frame = self.read_frame(stride)
+                    start = self.profiler.stop(CAPTURE, start)
+
+                    if ret:
+                        if self.show_log:
+                            log(0, "Iteration: %s", self.iterations)
+
+                        frame, gray = self.preprocessing.process(frame)
+
+                        if self.excluded_area:
+                            cv.bitwise_and(frame, frame, dst=frame_masked, mask=mask_poly)
+                            # for polygon in self.polygons:
+                            #    cv.polylines(frame_masked, [polygon], True, (255, 0, 255), 8)
+
+                            cv.addWeighted(frame, self.alpha, frame_masked, 1 - self.alpha, 0, dst=img_to_draw)
+                        else:
+                            np.copyto(img_to_draw, frame)
+
+                        self.frame_rate(img_to_draw)
+                        start = self.profiler.stop(PREPROCESS, start)
+
+                        # Optical Flow Dense
+                        flow = self.compute_flow(prev_gray, gray)
+                        self.profiler.stop(FLOW, start)
+
+                        # Frame rate of the frames processed: the time between them is dt frames of the video,
+                        # the rate of the processing only if the frame rate of the video is unknown
+                        fps = video_fps / dt if video_fps > 0 else self.fps
+
+                        self.motion.detect_vehicle(img=frame, img_to_draw=img_to_draw, flow=flow,
+                                                   iter=self.iterations,
+                                                   fps=fps,
+                                                   polygons=self.polygons,
+                                                   roi=self.roi,
+                                                   zones=self.zones,
+                                                   dt=dt)
+
+                        start = self.profiler.start()
+                        self.profiler.draw(img_to_draw, (self.frame_rate_x, self.frame_rate_y + 30))
+
+                        stack = Utility.stack_images(1, ([img_to_draw, frame]))
+                        cv.imshow(WINDOW_OPTICAL_FLOW, stack)
+
+                        key = cv.waitKey(1)
+                        self.profiler.stop(DISPLAY, start)
+                        self.profiler.stop(FRAME, start_frame)
+                        self.profiler.report()
+
+                        if key & 0xFF == ord('t'):
+                            # Show/hide the table
+                            self.table.toggle()
+
+                        elif key & 0xFF == ord('q'):
+                            # Exit to the program (the table is closed and the profile written by finally)
+                            cv.destroyAllWindows()
+                            sys.exit()
+
+                        # Update frame
+                        prev_gray = gray
+                        self.iterations += 1
+                        self.frame_index += stride
+                        dt = stride
+                        self.frame_stride.update(self.motion.get_displacement())
+
+                    else:
+                        # End of the video
+                        break
+            finally:
+                # Also at the end of the video
+                self.table.close()
+                self.dump_profile()
+
+    def run_headless(self):
+        """
+        Tracking vehicles by optical flow without windows, as fast as the cpu allows.
+        The vehicles tracked are sent to the sink after each frame, with the index of the frame of the video.
+
+        :return: number of frames of the video processed (the frames skipped by the stride included) and elapsed
+                 time (seconds).
+        """
+
+        self.load_calibration()
+
+        if self.show_log:
+            log(0, "Optical Flow Dense start (headless)!")
+            log(0, f"City: {self.obj_city['Name']}")
+
+        ret, first_frame = self.camera.read()
+
+        if not ret:
+            log(1, "Error read first frame of the video")
+            return 0, 0
+
+        _, prev_gray = self.preprocessing.process(first_frame)
+
+        if self.excluded_area:
+            self.load_polygons()
+
+        # Frame rate of the video, used to estimate the velocity
+        video_fps = self.camera.get(cv.CAP_PROP_FPS)
+        self.previous_time = time.time()
+        start_time = time.perf_counter()
+
+        # Frames of the video between the first frames of the last two pairs processed (the blobs are at the
+        # positions of the first frame of the pair)
+        dt = self.frame_stride.stride
+
+        while self.camera.isOpened():
+
+            if self.max_frames is not None and self.frame_index >= self.max_frames:
+                break
+
+            stride = self.frame_stride.stride
+
+            start_frame = start = self.profiler.start()
+            ret, frame = self.read_frame(stride)
+            start = self.profiler.stop(CAPTURE, start)
+
+            if not ret:
+                # End of the video
+                break
+
+            if self.show_log:
+                log(0, "Iteration: %s", self.iterations)
+
+            frame, gray = self.preprocessing.process(frame)
+            start = self.profiler.stop(PREPROCESS, start)
+
+            if video_fps > 0:
+                # Frame rate of the frames processed: the time between them is dt frames of the video
+                self.fps = video_fps / dt
+            else:
+                self.current_time = time.time()
+                self.fps = np.divide(1, (self.current_time - self.previous_time))
+                self.previous_time = self.current_time
+
+            # Optical Flow Dense
+            flow = self.compute_flow(prev_gray, gray)
+            self.profiler.stop(FLOW, start)
+
+            vehicles = self.motion.detect_vehicle(img=frame, img_to_draw=None, flow=flow, iter=self.iterations,
+                                                  fps=self.fps, polygons=self.polygons, roi=self.roi,
+                                                  zones=self.zones, dt=dt)
+
+            if self.sink is not None:
+                self.sink(self.frame_index, vehicles)
+
+            self.profiler.stop(FRAME, start_frame)
+            self.profiler.report()
+
+            # Update frame
+            prev_gray = gray
+            self.iterations += 1
+            self.frame_index += stride
+            dt = stride
+            self.frame_stride.update(self.motion.get_displacement())
+
+        elapsed_time = time.perf_counter() - start_time
+
+        if self.show_log and isinstance(self.camera, FramePrefetcher):
+            log(0, f"Capture: {self.camera.get_counters()}")
+
+        if self.show_log and self.frame_stride.is_adaptive():
+            log(0, f"Frames processed: {self.iterations} of {self.frame_index}")
+
+        self.camera.release()
+        self.dump_profile()
+
+        return self.frame_index, elapsed_time
+
+    def run_staged(self):
+        """
+        Tracking vehicles by optical flow without windows, with capture, optical flow and tracking in three
+        processes (see StagedPipeline). The vehicles tracked are sent to the sink after each frame.
+
+        :return: number of frames processed and elapsed time (seconds).
+        """
+
+        if self.show_log:
+            log(0, "Optical Flow Dense start (staged)!")
+            log(0, f"City: {self.obj_city['Name']}")
+
+        if self.excluded_area:
+            self.load_polygons()
 
-                ret, frame = self.camera.read()
+        # Frame rate of the video, used to estimate the velocity
+        capture = cv.VideoCapture(self.obj_city["Path"]) if "http" not in self.obj_city["Path"] else None
+        video_fps = capture.get(cv.CAP_PROP_FPS) if capture is not None else 0
+        if capture is not None:
+            capture.release()
 
-                if ret:
-                    if self.show_log:
-                        log(0, f"Iteration: {self.iterations}")
+        pipeline = StagedPipeline(self.obj_city["Path"], self.width, self.height, self.roi, self.flow_backend,
+                                  self.flow_preset, self.start_frame)
+        pipeline.start()
 
-                    frame_copy = cv.resize(frame.copy(), (self.width, self.height))
-                    frame_copy = cv.undistort(frame_copy, camera_matrix, dist_matrix, None, newcameramtx)
-                    img_to_draw = frame_copy.copy()
+        self.previous_time = time.time()
+        start_time = time.perf_counter()
 
-                    frame = filtering(frame)
-                    frame = cv.resize(frame, (self.width, self.height))
-                    frame = cv.undistort(frame, camera_matrix, dist_matrix, None, newcameramtx)
+        try:
+            while self.max_frames is None or self.iterations < self.max_frames:
 
-                    gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+                start_frame = self.profiler.start()
+                ret, frame, flow = pipeline.read()
 
-                    if self.excluded_area:
-                        frame = cv.bitwise_and(frame, frame, mask=mask_poly)
-                        # for polygon in self.polygons:
-                        #    cv.polylines(frame, [polygon], True, (255, 0, 255), 8)
+                if not ret:
+                    # End of the video
+                    break
 
-                    if self.excluded_area:
-                        img_to_draw = cv.addWeighted(img_to_draw, self.alpha, frame, 1 - self.alpha, 0)
+                if self.show_log:
+                    log(0, "Iteration: %s", self.iterations)
 
-                    self.frame_rate(img_to_draw)
+                if video_fps > 0:
+                    self.fps = video_fps
+                else:
+                    self.current_time = time.time()
+                    self.fps = np.divide(1, (self.current_time - self.previous_time))
+                    self.previous_time = self.current_time
 
-                    # Optical Flow Dense
-                    flow = cv.calcOpticalFlowFarneback(prev_gray, gray, None, pyr_scale=0.5, levels=5, winsize=11,
-                                                       iterations=5, poly_n=5, poly_sigma=1.1, flags=0)
+                vehicles = self.motion.detect_vehicle(img=frame, img_to_draw=None, flow=flow, iter=self.iterations,
+                                                      fps=self.fps, polygons=self.polygons, roi=self.roi,
+                                                      zones=self.zones)
 
-                    # flow = cv.calcOpticalFlowFarneback(prev_gray, gray, None, pyr_scale=0.5, levels=5, winsize=15,
-                    #                                    iterations=2, poly_n=5, poly_sigma=1.1, flags=0)
+                if self.sink is not None:
+                    self.sink(self.iterations, vehicles)
 
-                    if self.show_log:
-                        Utility.set_text(frame, f"Iter: {self.iterations}", (40, 45), dim=1.5, color=Color.RED)
+                self.profiler.stop(FRAME, start_frame)
+                self.profiler.report()
 
-                    self.motion.detect_vehicle(img=frame, img_to_draw=img_to_draw, flow=flow, iter=self.iterations,
-                                               fps=self.fps,
-                                               polygons=self.polygons)
+                self.iterations += 1
 
-                    stack = Utility.stack_images(1, ([img_to_draw, frame_copy]))
-                    cv.imshow(WINDOW_OPTICAL_FLOW, stack)
+            elapsed_time = time.perf_counter() - start_time
+        finally:
+            # The views of the shared memory must be released before closing it
+            frame = flow = None
+            pipeline.release()
 
-                    key = cv.waitKey(1)
-                    if key & 0xFF == ord('q'):
-                        # Exit to the program
-                        self.table.close()
-                        cv.destroyAllWindows()
-                        sys.exit()
+        self.dump_profile()
 
-                    # Update frame
-                    prev_gray = gray
-                    self.iterations += 1
+        return self.iterations, elapsed_time
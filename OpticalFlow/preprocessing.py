@@ -0,0 +1,64 @@
+import cv2 as cv
+import numpy as np
+
+
+class Preprocessing:
+    r"""
+    Preprocessing of the frames read by the camera.
+    Each frame is resized and undistorted once, then the image to show and the blurred grayscale image
+    (input of the optical flow) are derived from the same result. The buffers are allocated once and reused.
+    """
+
+    def __init__(self, width, height, map_x, map_y, ksize=(9, 9), sigma=cv.BORDER_DEFAULT):
+        """
+        Constructor of class.
+
+        :param width: width of the images.
+        :param height: height of the images.
+        :param map_x: first undistortion map (fixed-point).
+        :param map_y: second undistortion map (fixed-point).
+        :param ksize: kernel size of the gaussian filter.
+        :param sigma: sigma of the gaussian filter.
+        """
+
+        self.size = (width, height)
+        self.map_x = map_x
+        self.map_y = map_y
+
+        self.ksize = ksize
+        self.sigma = sigma
+
+        # Buffers
+        self.resized = np.empty((height, width, 3), np.uint8)
+        self.image = np.empty((height, width, 3), np.uint8)
+        self.gray = np.empty((height, width), np.uint8)
+
+        # Two buffers for the blurred image: the previous one is still used by the optical flow
+        self.blurred = [np.empty((height, width), np.uint8), np.empty((height, width), np.uint8)]
+        self.index = 0
+
+    def process(self, frame, image=None, blurred=None):
+        """
+        Resizes and undistorts the frame, then converts it to gray and blurs it.
+
+        :param frame: frame read by the camera.
+        :param image: buffer of the image, None to use the buffer of the preprocessing.
+        :param blurred: buffer of the blurred image, None to use the buffers of the preprocessing.
+
+        :return image: image resized and undistorted (valid until the next call).
+        :return blurred: blurred grayscale image (valid until the second next call).
+        """
+
+        if image is None:
+            image = self.image
+
+        if blurred is None:
+            self.index ^= 1
+            blurred = self.blurred[self.index]
+
+        cv.resize(frame, self.size, dst=self.resized)
+        cv.remap(self.resized, self.map_x, self.map_y, cv.INTER_LINEAR, dst=image)
+        cv.cvtColor(image, cv.COLOR_BGR2GRAY, dst=self.gray)
+        cv.GaussianBlur(self.gray, self.ksize, self.sigma, dst=blurred)
+
+        return image, blurred
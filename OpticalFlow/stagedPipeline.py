@@ -0,0 +1,375 @@
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from Calibration.ModuleCalibration import load_undistort_maps
+from Common.loadVideo import get_video
+from MotionTracking.Utility import log
+from OpticalFlow.flowEngine import create_flow_engine
+from OpticalFlow.preprocessing import Preprocessing
+
+# Number of slots of the rings of the frames and of the flows
+FRAME_SLOTS = 4
+FLOW_SLOTS = 3
+
+# Sequence number of the slot after the last one (end of the video)
+END_OF_STREAM = -1
+
+# Interval (seconds) of the checks of the stop while a stage waits a slot
+WAIT_INTERVAL = 0.1
+
+
+class SharedRing:
+    r"""
+    Ring of slots in shared memory: each slot holds some arrays of fixed shape and the sequence number of its
+    content. The arrays are numpy views of the shared memory, so the stages read and write them without copies.
+    """
+
+    def __init__(self, num_slots, arrays, names=None):
+        """
+        Constructor of class.
+
+        :param num_slots: number of slots.
+        :param arrays: dict name: (shape, dtype) of the arrays of each slot.
+        :param names: dict name: name of the shared memory (attach to an existing ring), None to create it.
+        """
+
+        self.num_slots = num_slots
+        self.layout = arrays
+        self.owner = names is None
+        self.memories = {}
+        self.arrays = {}
+
+        for name, (shape, dtype) in {**arrays, "sequence": ((), np.int64)}.items():
+            size = num_slots * int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize
+
+            if self.owner:
+                memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            else:
+                memory = shared_memory.SharedMemory(name=names[name])
+
+            self.memories[name] = memory
+            self.arrays[name] = np.ndarray((num_slots, *shape), dtype, buffer=memory.buf)
+
+        self.sequence = self.arrays.pop("sequence")
+
+        if self.owner:
+            self.sequence.fill(END_OF_STREAM)
+
+    def get_spec(self):
+        """
+        Get the description of the ring, to attach to it from another process.
+
+        :return: tuple (number of slots, arrays, names of the shared memories).
+        """
+
+        return self.num_slots, self.layout, {name: memory.name for name, memory in self.memories.items()}
+
+    @classmethod
+    def attach(cls, spec):
+        """
+        Attaches to the ring created by another process.
+
+        :param spec: description of the ring (see get_spec).
+        """
+
+        num_slots, arrays, names = spec
+        return cls(num_slots, arrays, names)
+
+    def get_slot(self, sequence):
+        """
+        Get the index of the slot of a sequence number.
+        """
+
+        return sequence % self.num_slots
+
+    def check(self, slot, sequence):
+        """
+        Checks the sequence number of a slot.
+
+        :param slot: index of the slot.
+        :param sequence: sequence number expected.
+
+        :return: bool, false if the slot marks the end of the video.
+        """
+
+        found = int(self.sequence[slot])
+
+        if found == END_OF_STREAM:
+            return False
+
+        if found != sequence:
+            raise Exception(f"Slot {slot} of the ring holds the sequence {found} instead of {sequence}")
+
+        return True
+
+    def close(self):
+        """
+        Releases the ring, the process that created it also removes the shared memory.
+        """
+
+        self.arrays = {}
+        self.sequence = None
+
+        for memory in self.memories.values():
+            memory.close()
+
+            if self.owner:
+                memory.unlink()
+
+        self.memories = {}
+
+
+def acquire(semaphore, stop):
+    r"""
+    Waits a semaphore until it's acquired or the pipeline is stopped.
+
+    :param semaphore: semaphore.
+    :param stop: event of the stop of the pipeline.
+
+    :return: bool, true if the semaphore is acquired.
+    """
+
+    while not stop.is_set():
+        if semaphore.acquire(timeout=WAIT_INTERVAL):
+            return True
+
+    return False
+
+
+def run_capture(path, width, height, start_frame, spec_frames, frame_free, frame_ready, stop):
+    r"""
+    Entry point of the capture stage: reads and preprocesses the frames into the slots of the frames.
+
+    :param path: path of the video.
+    :param width: width of the frames.
+    :param height: height of the frames.
+    :param start_frame: index of the first frame of the video.
+    :param spec_frames: description of the ring of the frames.
+    :param frame_free: semaphore of the free slots of the frames.
+    :param frame_ready: semaphore of the slots of the frames ready.
+    :param stop: event of the stop of the pipeline.
+    """
+
+    frames = SharedRing.attach(spec_frames)
+    camera = get_video(path, height, width, start_frame=start_frame)
+
+    map_x, map_y = load_undistort_maps("Calibration/data", width, height)
+    preprocessing = Preprocessing(width, height, map_x, map_y)
+
+    sequence = 0
+
+    try:
+        while True:
+            ret, frame = camera.read()
+
+            if not acquire(frame_free, stop):
+                break
+
+            slot = frames.get_slot(sequence)
+
+            if not ret:
+                # End of the video
+                frames.sequence[slot] = END_OF_STREAM
+                frame_ready.release()
+                break
+
+            preprocessing.process(frame, image=frames.arrays["image"][slot], blurred=frames.arrays["gray"][slot])
+            frames.sequence[slot] = sequence
+            frame_ready.release()
+
+            sequence += 1
+    finally:
+        camera.release()
+        frames.close()
+
+
+def run_flow(spec_frames, spec_flows, roi, flow_backend, flow_preset, frame_ready, flow_free, flow_ready, stop):
+    r"""
+    Entry point of the flow stage: calculates the optical flow between each two consecutive frames into the slots
+    of the flows. The flow of the sequence n is between the frames n and n + 1.
+
+    :param spec_frames: description of the ring of the frames.
+    :param spec_flows: description of the ring of the flows.
+    :param roi: region of interest (x, y, width, height) of the optical flow, None for the whole frame.
+    :param flow_backend: backend of the optical flow.
+    :param flow_preset: preset of the optical flow backend.
+    :param frame_ready: semaphore of the slots of the frames ready.
+    :param flow_free: semaphore of the free slots of the flows.
+    :param flow_ready: semaphore of the slots of the flows ready.
+    :param stop: event of the stop of the pipeline.
+    """
+
+    frames = SharedRing.attach(spec_frames)
+    flows = SharedRing.attach(spec_flows)
+    flow_engine = create_flow_engine(flow_backend, flow_preset)
+
+    grays = frames.arrays["gray"]
+    if roi is not None:
+        x, y, w, h = roi
+        grays = grays[:, y:y + h, x:x + w]
+
+    sequence = 0
+
+    try:
+        if not acquire(frame_ready, stop):
+            return
+
+        available = frames.check(frames.get_slot(0), 0)
+
+        while available:
+            if not acquire(frame_ready, stop):
+                return
+
+            # The frame n is released by the tracking stage, after the flow n
+            available = frames.check(frames.get_slot(sequence + 1), sequence + 1)
+
+            if not acquire(flow_free, stop):
+                return
+
+            slot = flows.get_slot(sequence)
+
+            if available:
+                flow_engine.compute(grays[frames.get_slot(sequence)], grays[frames.get_slot(sequence + 1)],
+                                    out=flows.arrays["flow"][slot])
+                flows.sequence[slot] = sequence
+            else:
+                flows.sequence[slot] = END_OF_STREAM
+
+            flow_ready.release()
+            sequence += 1
+
+        if sequence == 0:
+            # Video with one frame: only the end of the video
+            if acquire(flow_free, stop):
+                flows.sequence[flows.get_slot(0)] = END_OF_STREAM
+                flow_ready.release()
+    finally:
+        # The views of the shared memory must be released before closing it
+        grays = None
+        frames.close()
+        flows.close()
+
+
+class StagedPipeline:
+    r"""
+    Pipeline of three processes: the capture stage reads and preprocesses the frames, the flow stage calculates
+    the optical flow, the tracking stage (the process of the pipeline) segments and tracks the vehicles.
+    The frames and the flows are passed through rings of slots in shared memory, without copies: the semaphores
+    of the free and ready slots synchronize the stages and the sequence numbers of the slots are checked.
+    The throughput approaches the one of the slowest stage instead of the sum of the stages.
+    """
+
+    def __init__(self, path, width, height, roi=None, flow_backend=None, flow_preset=None, start_frame=0,
+                 frame_slots=FRAME_SLOTS, flow_slots=FLOW_SLOTS):
+        """
+        Constructor of class.
+
+        :param path: path of the video.
+        :param width: width of the frames.
+        :param height: height of the frames.
+        :param roi: region of interest (x, y, width, height) of the optical flow, None for the whole frame.
+        :param flow_backend: backend of the optical flow.
+        :param flow_preset: preset of the optical flow backend.
+        :param start_frame: index of the first frame of the video processed (local videos only).
+        :param frame_slots: number of slots of the frames (at least 2: the flow uses two consecutive frames).
+        :param flow_slots: number of slots of the flows.
+        """
+
+        if frame_slots < 2 or flow_slots < 1:
+            raise Exception(f"Invalid number of slots: {frame_slots} frames, {flow_slots} flows")
+
+        flow_width, flow_height = (width, height) if roi is None else roi[2:]
+
+        self.frames = SharedRing(frame_slots, {"image": ((height, width, 3), np.uint8),
+                                               "gray": ((height, width), np.uint8)})
+        self.flows = SharedRing(flow_slots, {"flow": ((flow_height, flow_width, 2), np.float32)})
+
+        context = multiprocessing.get_context("spawn")
+
+        self.frame_free = context.Semaphore(frame_slots)
+        self.frame_ready = context.Semaphore(0)
+        self.flow_free = context.Semaphore(flow_slots)
+        self.flow_ready = context.Semaphore(0)
+        self.stop_event = context.Event()
+
+        self.stages = [
+            context.Process(target=run_capture, name="Capture stage", daemon=True,
+                            args=(path, width, height, start_frame, self.frames.get_spec(), self.frame_free,
+                                  self.frame_ready, self.stop_event)),
+            context.Process(target=run_flow, name="Flow stage", daemon=True,
+                            args=(self.frames.get_spec(), self.flows.get_spec(), roi, flow_backend, flow_preset,
+                                  self.frame_ready, self.flow_free, self.flow_ready, self.stop_event))
+        ]
+
+        self.sequence = 0
+
+    def start(self):
+        """
+        Starts the capture and the flow stages.
+        """
+
+        for stage in self.stages:
+            stage.start()
+
+    def read(self):
+        """
+        Waits the next flow.
+
+        :return: bool (false at the end of the video), frame n + 1 and flow between the frames n and n + 1
+                 (valid until the next call).
+        """
+
+        if self.sequence > 0:
+            # The frame n - 1 and the flow n - 1 aren't used anymore
+            self.frame_free.release()
+            self.flow_free.release()
+
+        while not self.flow_ready.acquire(timeout=WAIT_INTERVAL):
+            if not self.is_alive():
+                raise Exception("A stage of the pipeline crashed")
+
+        slot_flow = self.flows.get_slot(self.sequence)
+
+        if not self.flows.check(slot_flow, self.sequence):
+            return False, None, None
+
+        slot_frame = self.frames.get_slot(self.sequence + 1)
+        self.frames.check(slot_frame, self.sequence + 1)
+
+        self.sequence += 1
+
+        return True, self.frames.arrays["image"][slot_frame], self.flows.arrays["flow"][slot_flow]
+
+    def is_alive(self):
+        """
+        Checks the stages.
+
+        :return: bool, true if no stage crashed.
+        """
+
+        return all(stage.is_alive() or stage.exitcode == 0 for stage in self.stages)
+
+    def release(self, timeout=1):
+        """
+        Stops the stages and releases the shared memory.
+
+        :param timeout: maximum time (seconds) to wait each stage.
+        """
+
+        self.stop_event.set()
+
+        for stage in self.stages:
+            if stage.pid is None:
+                continue
+
+            stage.join(timeout)
+
+            if stage.is_alive():
+                log(1, f"{stage.name} not stopped, terminate it")
+                stage.terminate()
+                stage.join()
+
+        self.frames.close()
+        self.flows.close()
@@ -0,0 +1,340 @@
+import multiprocessing
+import os
+import queue
+import time
+
+import cv2 as cv
+
+from MotionTracking.Utility import log
+
+# States of a camera
+RUNNING = "Running"
+WAITING = "Waiting"  # Crashed, waiting to be restarted
+FINISHED = "Finished"  # End of the video file
+
+# Interval (seconds) of the checks of the workers
+POLL_INTERVAL = 0.2
+
+
+def get_camera(city, name=None, **parameters):
+    r"""
+    Get the configuration of a camera.
+
+    :param city: city (dict of Common/url.py) with the path of the video, the polygons and the zones.
+    :param name: name of the camera, None for the name of the city.
+    :param parameters: parameters of OpticalFlowDense (height_cam, width_cam, excluded_area, flow_backend, ...).
+
+    :return: dict with name, city and parameters.
+    """
+
+    return {"Name": name or city["Name"], "City": city, "Parameters": parameters}
+
+
+def get_cpus(index, cpus_per_camera):
+    r"""
+    Get the cpus of a camera: the cameras get consecutive cpus, more cameras than cpus share them round robin.
+
+    :param index: index of the camera.
+    :param cpus_per_camera: number of cpus of each camera.
+
+    :return: list of cpu ids, None if the affinity isn't supported.
+    """
+
+    if not hasattr(os, "sched_getaffinity"):
+        return None
+
+    available = sorted(os.sched_getaffinity(0))
+    return sorted({available[(index * cpus_per_camera + i) % len(available)] for i in range(cpus_per_camera)})
+
+
+def run_camera(camera, cpus, stats, report_interval):
+    r"""
+    Entry point of the worker of a camera: runs the headless pipeline and sends its statistics.
+
+    :param camera: configuration of the camera.
+    :param cpus: cpus of the worker, None to keep the affinity of the supervisor.
+    :param stats: queue of the statistics (name, frames, fps, lag, dropped, vehicles).
+    :param report_interval: interval (seconds) of the statistics.
+    """
+
+    from Common.logger import configure, WARNING
+    from Common.loadVideo import FramePrefetcher
+    from OpticalFlow.opticalflowDense import OpticalFlowDense
+
+    configure(level=WARNING)
+
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+        cv.setNumThreads(len(cpus))
+
+    name = camera["Name"]
+    parameters = dict(camera["Parameters"])
+    parameters.setdefault("show_log", False)
+
+    op_dense = OpticalFlowDense(video_url=camera["City"], headless=True, **parameters)
+
+    # The staged pipeline opens the video in its capture stage
+    camera = op_dense.camera
+    video_fps = camera.get(cv.CAP_PROP_FPS) if camera is not None else 0
+    start_position = camera.get(cv.CAP_PROP_POS_MSEC) if camera is not None else 0
+    start_time = time.perf_counter()
+    last = [start_time, 0]
+
+    def get_lag(now):
+        # Time behind the source: the wall clock compared with the position of the frame processed, i.e. the
+        # position of the capture minus the frames decoded and not yet processed. If the source doesn't report
+        # its position, the frames queued and dropped (live sources) are counted instead
+        counters = camera.get_counters() if isinstance(camera, FramePrefetcher) else {"Queued": 0, "Dropped": 0}
+        queued = counters["Queued"] / video_fps if video_fps > 0 else 0.0
+
+        position = camera.get(cv.CAP_PROP_POS_MSEC) if camera is not None else 0
+        if position > 0:
+            return now - start_time - (position - start_position) / 1000 + queued
+
+        return queued + counters["Dropped"] / video_fps if video_fps > 0 else 0.0
+
+    def sink(iteration, vehicles):
+        now = time.perf_counter()
+
+        if now - last[0] < report_interval:
+            return
+
+        frames = iteration + 1
+        fps = (frames - last[1]) / (now - last[0])
+
+        lag = get_lag(now)
+        dropped = camera.get_counters()["Dropped"] if isinstance(camera, FramePrefetcher) else 0
+
+        try:
+            stats.put_nowait((name, frames, fps, max(lag, 0.0), dropped, len(vehicles)))
+        except queue.Full:
+            pass
+
+        last[0], last[1] = now, frames
+
+    op_dense.sink = sink
+    op_dense.run()
+
+
+class Supervisor:
+    r"""
+    Runs the pipeline of each camera (headless) in its own worker process, pinned to its cpus.
+    The workers that crash (or stop sending statistics) are restarted with exponential backoff; the workers
+    of video files that reach the end are not restarted. The FPS and the lag of the cameras are aggregated
+    and logged periodically.
+    """
+
+    def __init__(self, cameras, cpus_per_camera=1, report_interval=5.0, min_backoff=1.0, max_backoff=60.0,
+                 stable_time=60.0, stall_timeout=60.0, show_log=True):
+        """
+        Constructor of class.
+
+        :param cameras: configurations of the cameras (see get_camera).
+        :param cpus_per_camera: number of cpus of each worker.
+        :param report_interval: interval (seconds) of the statistics of the workers and of the log.
+        :param min_backoff: delay (seconds) before the first restart of a worker.
+        :param max_backoff: maximum delay (seconds) before a restart.
+        :param stable_time: a worker running for this time (seconds) before crashing is restarted without delay.
+        :param stall_timeout: a worker without statistics for this time (seconds) is restarted, 0 to disable.
+        :param show_log: bool, if true show the log.
+        """
+
+        names = [camera["Name"] for camera in cameras]
+        if len(set(names)) != len(names):
+            raise Exception(f"Names of the cameras must be unique: {names}")
+
+        self.cameras = {camera["Name"]: camera for camera in cameras}
+        self.report_interval = report_interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.stable_time = stable_time
+        self.stall_timeout = stall_timeout
+        self.show_log = show_log
+
+        self.context = multiprocessing.get_context("spawn")
+        self.stats = self.context.Queue(1024)
+
+        self.workers = {}
+        self.status = {}
+
+        for index, name in enumerate(self.cameras):
+            self.status[name] = {"state": WAITING, "cpus": get_cpus(index, cpus_per_camera), "restarts": 0,
+                                 "failures": 0, "restart_time": 0.0, "start_time": 0.0, "last_stats": 0.0,
+                                 "frames": 0, "fps": 0.0, "lag": 0.0, "dropped": 0, "vehicles": 0}
+
+        self.last_report = time.perf_counter()
+
+    def start_worker(self, name):
+        """
+        Starts the worker of a camera.
+
+        :param name: name of the camera.
+        """
+
+        status = self.status[name]
+        process = self.context.Process(target=run_camera, name=f"Camera {name}", daemon=True,
+                                       args=(self.cameras[name], status["cpus"], self.stats, self.report_interval))
+        process.start()
+
+        self.workers[name] = process
+        now = time.perf_counter()
+        status.update({"state": RUNNING, "start_time": now, "last_stats": now, "fps": 0.0})
+
+        if self.show_log:
+            log(0, f"Camera {name} started (pid {process.pid}, cpus {status['cpus']})")
+
+    def stop_worker(self, name, timeout=1):
+        """
+        Stops the worker of a camera.
+
+        :param name: name of the camera.
+        :param timeout: maximum time (seconds) to wait the worker.
+        """
+
+        process = self.workers.pop(name, None)
+        if process is None:
+            return
+
+        process.terminate()
+        process.join(timeout)
+
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+    def schedule_restart(self, name, reason):
+        """
+        Schedules the restart of a crashed worker, with exponential backoff.
+
+        :param name: name of the camera.
+        :param reason: reason of the restart.
+        """
+
+        status = self.status[name]
+        now = time.perf_counter()
+
+        if now - status["start_time"] >= self.stable_time:
+            status["failures"] = 0
+
+        delay = min(self.max_backoff, self.min_backoff * 2 ** status["failures"])
+        status.update({"state": WAITING, "restart_time": now + delay, "fps": 0.0})
+        status["failures"] += 1
+        status["restarts"] += 1
+
+        log(1, f"Camera {name}: {reason}, restart in {delay:.1f} s")
+
+    def read_stats(self):
+        """
+        Reads the statistics sent by the workers.
+        """
+
+        now = time.perf_counter()
+
+        while True:
+            try:
+                name, frames, fps, lag, dropped, vehicles = self.stats.get_nowait()
+            except queue.Empty:
+                break
+
+            self.status[name].update({"frames": frames, "fps": fps, "lag": lag, "dropped": dropped,
+                                      "vehicles": vehicles, "last_stats": now})
+
+    def check_workers(self):
+        """
+        Checks the workers: restarts the crashed and stalled ones when their backoff expired.
+        """
+
+        now = time.perf_counter()
+
+        for name, status in self.status.items():
+            if status["state"] == RUNNING:
+                process = self.workers[name]
+
+                if not process.is_alive():
+                    process.join()
+                    del self.workers[name]
+
+                    live = "http" in self.cameras[name]["City"]["Path"]
+                    if process.exitcode == 0 and not live:
+                        status.update({"state": FINISHED, "fps": 0.0})
+
+                        if self.show_log:
+                            log(0, f"Camera {name} finished")
+                    else:
+                        self.schedule_restart(name, f"worker exited with code {process.exitcode}")
+
+                elif self.stall_timeout > 0 and now - status["last_stats"] > self.stall_timeout:
+                    self.stop_worker(name)
+                    self.schedule_restart(name, f"no statistics for {self.stall_timeout:.0f} s")
+
+            elif status["state"] == WAITING and now >= status["restart_time"]:
+                self.start_worker(name)
+
+    def get_stats(self):
+        """
+        Get the statistics of the cameras.
+
+        :return: dict name of the camera: dict with state, cpus, restarts, frames, fps, lag (seconds behind
+                 the source), dropped frames and vehicles tracked.
+        """
+
+        return {name: {key: status[key] for key in ("state", "cpus", "restarts", "frames", "fps", "lag", "dropped",
+                                                     "vehicles")}
+                for name, status in self.status.items()}
+
+    def report(self):
+        """
+        Logs the aggregated statistics, if the last log is older than the report interval.
+        """
+
+        now = time.perf_counter()
+        if now - self.last_report < self.report_interval:
+            return
+
+        self.last_report = now
+
+        if self.show_log:
+            running = [status for status in self.status.values() if status["state"] == RUNNING]
+            total_fps = sum(status["fps"] for status in running)
+            max_lag = max((status["lag"] for status in running), default=0.0)
+
+            cameras = ", ".join(f"{name} {status['fps']:.1f} FPS lag {status['lag']:.1f} s"
+                                if status["state"] == RUNNING else f"{name} {status['state'].lower()}"
+                                for name, status in self.status.items())
+
+            log(0, f"Cameras {len(running)}/{len(self.status)}: {total_fps:.1f} FPS, "
+                   f"max lag {max_lag:.1f} s [{cameras}]")
+
+    def run(self, duration=None):
+        """
+        Starts the workers and supervises them until all the videos are finished (or the duration expired).
+
+        :param duration: maximum time (seconds), None to run until all the videos are finished.
+
+        :return: statistics of the cameras.
+        """
+
+        start_time = time.perf_counter()
+
+        try:
+            while any(status["state"] != FINISHED for status in self.status.values()):
+                if duration is not None and time.perf_counter() - start_time >= duration:
+                    break
+
+                self.check_workers()
+                self.read_stats()
+                self.report()
+
+                time.sleep(POLL_INTERVAL)
+        finally:
+            self.stop()
+
+        return self.get_stats()
+
+    def stop(self):
+        """
+        Stops all the workers.
+        """
+
+        for name in list(self.workers):
+            self.stop_worker(name)
@@ -1,24 +1,198 @@
 import Common.url as Url
+from MotionTracking.Utility import log
+from OpticalFlow.flowEngine import FARNEBACK, PRESET_MEDIUM
+from OpticalFlow.offlineProcessing import OfflineProcessing, CHUNK_OVERLAP
 from OpticalFlow.opticalflowDense import OpticalFlowDense
+from OpticalFlow.supervisor import Supervisor
 
 DENSE = "Dense"
 
 
 class App:
 
-    def __init__(self, video_url, excluded_area, show_log, type_op=DENSE, height_cam=512, width_cam=750):
+    def __init__(self, video_url, excluded_area, show_log, type_op=DENSE, height_cam=512, width_cam=750,
+                 flow_backend=FARNEBACK, flow_preset=PRESET_MEDIUM, crop_roi=True, prediction=False,
+                 profile=False, profile_path=None, stride=1, max_stride=None):
         self.type_op = type_op
 
         self.op_dense = OpticalFlowDense(video_url=video_url,
                                          height_cam=height_cam,
                                          width_cam=width_cam,
                                          excluded_area=excluded_area,
-                                         show_log=show_log)
+                                         show_log=show_log,
+                                         flow_backend=flow_backend,
+                                         flow_preset=flow_preset,
+                                         crop_roi=crop_roi,
+                                         prediction=prediction,
+                                         profile=profile or profile_path is not None,
+                                         profile_path=profile_path,
+                                         stride=stride,
+                                         max_stride=max_stride)
 
     def run(self):
         self.op_dense.run()
 
 
+class HeadlessApp:
+    r"""
+    Runs the tracking without windows (no table, no video), as fast as the cpu allows.
+    The vehicles tracked in each frame are sent to the sink.
+    """
+
+    def __init__(self, video_url, excluded_area, show_log=False, sink=None, height_cam=512, width_cam=750,
+                 flow_backend=FARNEBACK, flow_preset=PRESET_MEDIUM, crop_roi=True, prediction=False,
+                 profile=False, profile_path=None, threshold=20, erode_iterations=12, min_area=40, staged=False,
+                 stride=1, max_stride=None):
+        """
+        Constructor of class.
+
+        :param video_url: url to get video.
+        :param excluded_area: bool, if true it does consider the polygon.
+        :param show_log: bool, if true show the log.
+        :param sink: callable sink(iteration, vehicles) called after each frame processed (iteration is the index
+                     of the frame of the video).
+        :param height_cam: height of camera.
+        :param width_cam: width of camera.
+        :param flow_backend: backend of the optical flow (Farneback, DIS, Coarse Farneback).
+        :param flow_preset: preset of the optical flow backend (ultrafast, fast, medium).
+        :param crop_roi: bool, if true the optical flow is calculated only into the bounding box of the polygons.
+        :param prediction: bool, if true the position of the vehicles is predicted (Kalman filter) to track them.
+        :param profile: bool, if true the time of each stage of the processing is measured.
+        :param profile_path: path of the JSON file with the times of the stages, None to disable.
+        :param threshold: threshold of the flow to mark a pixel as moving.
+        :param erode_iterations: number of erosions of the mask of the moving pixels.
+        :param min_area: minimum area (pixels) of a vehicle.
+        :param staged: bool, if true capture, optical flow and tracking run in three processes connected by
+                       shared memory.
+        :param stride: number of frames of the video between two frames processed (minimum stride if adaptive).
+        :param max_stride: maximum stride, if greater than stride the stride adapts to the motion of the vehicles.
+        """
+
+        self.op_dense = OpticalFlowDense(video_url=video_url,
+                                         height_cam=height_cam,
+                                         width_cam=width_cam,
+                                         excluded_area=excluded_area,
+                                         show_log=show_log,
+                                         headless=True,
+                                         sink=sink,
+                                         flow_backend=flow_backend,
+                                         flow_preset=flow_preset,
+                                         crop_roi=crop_roi,
+                                         prediction=prediction,
+                                         profile=profile or profile_path is not None,
+                                         profile_path=profile_path,
+                                         threshold=threshold,
+                                         erode_iterations=erode_iterations,
+                                         min_area=min_area,
+                                         staged=staged,
+                                         stride=stride,
+                                         max_stride=max_stride)
+
+    def run(self):
+        """
+        Runs the tracking and prints the throughput.
+
+        :return: frames per second processed.
+        """
+
+        frames, elapsed_time = self.op_dense.run()
+        fps = frames / elapsed_time if elapsed_time > 0 else 0
+
+        log(0, f"Processed {frames} frames in {elapsed_time:.2f} s ({fps:.2f} FPS)")
+
+        return fps
+
+
+class OfflineApp:
+    r"""
+    Tracks a recorded video (local file) split into overlapping chunks processed in parallel by a pool
+    of processes, the tracks are stitched at the borders of the chunks.
+    The vehicles tracked in each frame are sent to the sink in order.
+    """
+
+    def __init__(self, video_url, excluded_area, show_log=False, sink=None, processes=None, chunk_frames=None,
+                 overlap=CHUNK_OVERLAP, height_cam=512, width_cam=750, flow_backend=FARNEBACK,
+                 flow_preset=PRESET_MEDIUM, crop_roi=True, prediction=False):
+        """
+        Constructor of class.
+
+        :param video_url: video to process (local file).
+        :param excluded_area: bool, if true it does consider the polygon.
+        :param show_log: bool, if true show the log.
+        :param sink: callable sink(iteration, records) called after each frame, the records are dict with id,
+                     name, box, velocity, direction, stationary, zone and color of the vehicles.
+        :param processes: number of processes, None for the number of cpu.
+        :param chunk_frames: number of frames of each chunk, None for one chunk per process (at most MAX_CHUNK_FRAMES
+                             frames each).
+        :param overlap: number of frames processed by both chunks at the border of two chunks.
+        :param height_cam: height of camera.
+        :param width_cam: width of camera.
+        :param flow_backend: backend of the optical flow (Farneback, DIS, Coarse Farneback).
+        :param flow_preset: preset of the optical flow backend (ultrafast, fast, medium).
+        :param crop_roi: bool, if true the optical flow is calculated only into the bounding box of the polygons.
+        :param prediction: bool, if true the position of the vehicles is predicted (Kalman filter) to track them.
+        """
+
+        self.offline = OfflineProcessing(video_url=video_url,
+                                         height_cam=height_cam,
+                                         width_cam=width_cam,
+                                         excluded_area=excluded_area,
+                                         sink=sink,
+                                         processes=processes,
+                                         chunk_frames=chunk_frames,
+                                         overlap=overlap,
+                                         flow_backend=flow_backend,
+                                         flow_preset=flow_preset,
+                                         crop_roi=crop_roi,
+                                         prediction=prediction,
+                                         show_log=show_log)
+
+    def run(self):
+        """
+        Runs the tracking and prints the throughput.
+
+        :return: frames per second processed.
+        """
+
+        frames, elapsed_time = self.offline.run()
+        fps = frames / elapsed_time if elapsed_time > 0 else 0
+
+        log(0, f"Processed {frames} frames in {elapsed_time:.2f} s ({fps:.2f} FPS)")
+
+        return fps
+
+
+class MultiCameraApp:
+    r"""
+    Runs the tracking of many cameras (headless), each one into its own worker process pinned to its cpus.
+    The crashed workers are restarted with backoff, the FPS and the lag of the cameras are logged periodically.
+    """
+
+    def __init__(self, cameras, cpus_per_camera=1, report_interval=5.0, show_log=True):
+        """
+        Constructor of class.
+
+        :param cameras: configurations of the cameras, see get_camera in OpticalFlow/supervisor.py.
+        :param cpus_per_camera: number of cpus of each camera.
+        :param report_interval: interval (seconds) of the log of the statistics.
+        :param show_log: bool, if true show the log.
+        """
+
+        self.supervisor = Supervisor(cameras, cpus_per_camera=cpus_per_camera, report_interval=report_interval,
+                                     show_log=show_log)
+
+    def run(self, duration=None):
+        """
+        Runs the cameras until the videos are finished (or the duration expired).
+
+        :param duration: maximum time (seconds), None to run until the videos are finished.
+
+        :return: statistics of the cameras.
+        """
+
+        return self.supervisor.run(duration)
+
+
 if __name__ == "__main__":
     r"""
     Main
@@ -26,6 +200,8 @@ if __name__ == "__main__":
     app = App(video_url=Url.CAMBRIDGE,
               excluded_area=True,
               show_log=True,
-              type_op=DENSE)
+              type_op=DENSE,
+              flow_backend=FARNEBACK,
+              flow_preset=PRESET_MEDIUM)
 
     app.run()